@@ -6,19 +6,34 @@ This code serves as the entry point to this package.
 import argparse
 
 # Local imports.
+from agent import Agent
 from config import (
     PROGRAM_DESCRIPTION,
+    DEFAULT_AGENT_WINDOW,
+    DEFAULT_APT_LOCK_TIMEOUT,
+    DEFAULT_APT_MAX_AGE,
     DEFAULT_OS,
+    DEFAULT_PATH_TO_DOWNLOAD_CACHE,
     DEFAULT_TARGET_DIR,
     DEFAULT_PATH_TO_WALLPAPER_DIR,
     DEFAULT_PATH_TO_GIT_CREDENTIALS,
+    DEFAULT_PATH_TO_HISTORY,
     DEFAULT_PATH_TO_PAT,
+    DEFAULT_PATH_TO_REPO_CACHE,
+    DEFAULT_PATH_TO_VENV_DIR,
     DEFAULT_GIT_USERNAME,
+    DEFAULT_CLONE_JOBS,
     DEFAULT_EMAIL_ADDRESS,
+    DEFAULT_FLEET_JOBS,
+    DEFAULT_HOST_TIMEOUT,
+    DEFAULT_JOBS,
     DEFAULT_PYTHON_VERSION
 )
+from fleet import Fleet, load_inventory
 from git_credentials import set_up_git_credentials
 from hm_software_installer import HMSoftwareInstaller
+from snapshot import Snapshot
+from step_history import StepHistory
 
 # Constants.
 ARGUMENTS = [
@@ -28,6 +43,32 @@ ARGUMENTS = [
         "dest": "this_os",
         "help": "A string giving the OS in use on this system",
         "type": str
+    }, {
+        "name": "--apt-lock-timeout",
+        "default": DEFAULT_APT_LOCK_TIMEOUT,
+        "dest": "apt_lock_timeout",
+        "help": (
+            "The number of seconds for which to wait for another process to "+
+            "release APT's lock"
+        ),
+        "type": int
+    }, {
+        "name": "--apt-max-age",
+        "default": DEFAULT_APT_MAX_AGE,
+        "dest": "apt_max_age",
+        "help": (
+            "The age, in seconds, beyond which APT's lists are updated, even "+
+            "if the sources haven't changed"
+        ),
+        "type": int
+    }, {
+        "name": "--command-timeout",
+        "default": None,
+        "dest": "command_timeout",
+        "help": (
+            "The number of seconds after which to give up on any one command"
+        ),
+        "type": int
     }, {
         "name": "--email-address",
         "default": DEFAULT_EMAIL_ADDRESS,
@@ -52,6 +93,32 @@ ARGUMENTS = [
         "dest": "path_to_pat",
         "help": "The path to the Personal Access Token file",
         "type": str
+    }, {
+        "name": "--path-to-download-cache",
+        "default": DEFAULT_PATH_TO_DOWNLOAD_CACHE,
+        "dest": "path_to_download_cache",
+        "help": (
+            "The path to the directory in which downloaded files are cached"
+        ),
+        "type": str
+    }, {
+        "name": "--export-debs",
+        "default": None,
+        "dest": "path_to_deb_export",
+        "help": (
+            "The path to a shared directory into which to export the .deb "+
+            "files this run downloads"
+        ),
+        "type": str
+    }, {
+        "name": "--local-apt-repo",
+        "default": None,
+        "dest": "path_to_local_apt_repo",
+        "help": (
+            "The path to a directory of exported .deb files to use as a "+
+            "local APT repository"
+        ),
+        "type": str
     }, {
         "name": "--path-to-wallpaper-dir",
         "default": DEFAULT_PATH_TO_WALLPAPER_DIR,
@@ -84,6 +151,44 @@ ARGUMENTS = [
             "The path to the directory into which we're going to install stuff"
         ),
         "type": str
+    }, {
+        "name": "--clone-jobs",
+        "default": DEFAULT_CLONE_JOBS,
+        "dest": "clone_jobs",
+        "help": "The maximum number of our own repos to clone at once",
+        "type": int
+    }, {
+        "name": "--jobs",
+        "default": DEFAULT_JOBS,
+        "dest": "jobs",
+        "help": (
+            "The maximum number of installation steps to run at once"
+        ),
+        "type": int
+    }, {
+        "name": "--fleet",
+        "default": None,
+        "dest": "path_to_inventory",
+        "help": (
+            "The path to a JSON inventory of hosts on which to run this "+
+            "installer, over SSH, instead of on this computer"
+        ),
+        "type": str
+    }, {
+        "name": "--fleet-jobs",
+        "default": DEFAULT_FLEET_JOBS,
+        "dest": "fleet_jobs",
+        "help": "The maximum number of hosts to provision at once",
+        "type": int
+    }, {
+        "name": "--host-timeout",
+        "default": DEFAULT_HOST_TIMEOUT,
+        "dest": "host_timeout",
+        "help": (
+            "The number of seconds after which to give up on provisioning "+
+            "any one host"
+        ),
+        "type": int
     }, {
         "name": "--thunderbird-num",
         "default": None,
@@ -96,6 +201,133 @@ ARGUMENTS = [
         "default": False,
         "dest": "reset_git_credentials_only",
         "help": "Reset the Git credentials, but perform no installations"
+    }, {
+        "name": "--trace",
+        "default": None,
+        "dest": "path_to_trace",
+        "help": (
+            "The path to a JSON file in which to save a timeline of this "+
+            "run, for Perfetto or chrome://tracing"
+        ),
+        "type": str
+    }, {
+        "name": "--repo-cache",
+        "default": DEFAULT_PATH_TO_REPO_CACHE,
+        "dest": "path_to_repo_cache",
+        "help": (
+            "The directory, which may be on storage shared by a fleet, in "+
+            "which to keep mirrors of our own repos, from which to clone them"
+        ),
+        "type": str
+    }, {
+        "name": "--venv-dir",
+        "default": DEFAULT_PATH_TO_VENV_DIR,
+        "dest": "path_to_venv_dir",
+        "help": (
+            "The directory in which to keep the base virtual environment, "+
+            "and one derived from it for each of our own repos; pass an "+
+            "empty string to install into the system's Python instead"
+        ),
+        "type": str
+    }, {
+        "name": "--report",
+        "default": None,
+        "dest": "path_to_report",
+        "help": (
+            "The path to a JSON file in which to save a report of this run"
+        ),
+        "type": str
+    }, {
+        "name": "--plan",
+        "action": "store_true",
+        "default": False,
+        "dest": "plan",
+        "help": (
+            "Print what a real run would change, and how much it would "+
+            "download, without changing anything"
+        )
+    }, {
+        "name": "--history",
+        "default": DEFAULT_PATH_TO_HISTORY,
+        "dest": "path_to_history",
+        "help": (
+            "The path to the SQLite database in which to keep how long each "+
+            "step took, from which to estimate how long is left"
+        ),
+        "type": str
+    }, {
+        "name": "--stats",
+        "action": "store_true",
+        "default": False,
+        "dest": "show_stats",
+        "help": (
+            "Just print the typical and worst timings of each step, from the "+
+            "history"
+        )
+    }, {
+        "name": "--export-snapshot",
+        "default": None,
+        "dest": "path_to_snapshot_export",
+        "help": (
+            "After a successful run, pack what it left behind into an "+
+            "archive at this path, from which another computer can be "+
+            "restored"
+        ),
+        "type": str
+    }, {
+        "name": "--restore-snapshot",
+        "default": None,
+        "dest": "path_to_snapshot_import",
+        "help": (
+            "Instead of a full run, restore this computer from the archive "+
+            "at this path, installing only the packages it lacks"
+        ),
+        "type": str
+    }, {
+        "name": "--no-prefetch",
+        "action": "store_false",
+        "default": True,
+        "dest": "prefetch",
+        "help": (
+            "Download what each step needs when it starts, rather than "+
+            "downloading everything in the background from the outset"
+        )
+    }, {
+        "name": "--agent",
+        "action": "store_true",
+        "default": False,
+        "dest": "agent",
+        "help": (
+            "Keep running, watching this computer for changes which undo "+
+            "the installer's work, and re-run whichever steps they undid"
+        )
+    }, {
+        "name": "--agent-window",
+        "default": DEFAULT_AGENT_WINDOW,
+        "dest": "agent_window",
+        "help": (
+            "How many seconds the agent waits for a burst of changes to die "+
+            "down before it repairs anything"
+        ),
+        "type": float
+    }, {
+        "name": "--resume",
+        "action": "store_true",
+        "default": False,
+        "dest": "resume",
+        "help": (
+            "Skip those steps which a previous run completed, provided their "+
+            "inputs haven't changed and their work is still in place"
+        )
+    }, {
+        "name": "--update-repos",
+        "action": "store_true",
+        "default": False,
+        "dest": "update_repos",
+        "help": (
+            "Just fetch our own repos, fast-forward those which are clean, "+
+            "and rerun their installation scripts if those have changed"
+        )
     }, {
         "name": "--show-output",
         "action": "store_true",
@@ -152,6 +384,20 @@ def run_git_credentials_function(
         path_to_pat=arguments.path_to_pat
     )
 
+def run_fleet(arguments):
+    """ Run the installer on every host in the inventory, and say how it
+    went. """
+    fleet = \
+        Fleet(
+            load_inventory(arguments.path_to_inventory),
+            max_hosts=arguments.fleet_jobs,
+            timeout=arguments.host_timeout,
+            history=StepHistory(arguments.path_to_history)
+        )
+    result = fleet.run()
+    fleet.print_report()
+    return result
+
 ###################
 # RUN AND WRAP UP #
 ###################
@@ -162,9 +408,28 @@ def run():
     arguments = parser.parse_args()
     if arguments.reset_git_credentials_only:
         run_git_credentials_function(arguments)
+    elif arguments.show_stats:
+        StepHistory(arguments.path_to_history).print_stats()
+    elif arguments.path_to_inventory:
+        run_fleet(arguments)
     else:
         installer = make_installer_obj(arguments)
-        installer.run()
+        if arguments.plan:
+            installer.make_plan().print_plan()
+        elif arguments.agent:
+            Agent(installer, window=arguments.agent_window).run()
+        elif arguments.path_to_snapshot_import:
+            Snapshot(
+                installer,
+                arguments.path_to_snapshot_import,
+                jobs=arguments.jobs
+            ).restore()
+        elif installer.run() and arguments.path_to_snapshot_export:
+            Snapshot(
+                installer,
+                arguments.path_to_snapshot_export,
+                jobs=arguments.jobs
+            ).export()
 
 if __name__ == "__main__":
     run()
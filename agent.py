@@ -0,0 +1,252 @@
+"""
+This code defines a class which keeps a computer in line after the installer
+has run. It watches the files in which the installer's work shows up, using
+the kernel's change notifications, so that it costs next to nothing while
+nothing changes, and, once a burst of changes has died down, re-runs only
+those processes whose work has come undone.
+"""
+
+# Standard imports.
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import DEFAULT_AGENT_WINDOW
+from tracing import Tracer
+
+# Local constants.
+EVENT_HEADER = struct.Struct("iIII")
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_CLOSE_WRITE|IN_MOVED_FROM|IN_MOVED_TO|IN_DELETE
+READ_SIZE = 64*1024
+
+################
+# INOTIFY SHIM #
+################
+
+@dataclass
+class Inotify:
+    """ A thin wrapper around Linux's inotify, via the C library, since the
+    standard library hasn't got one. """
+    # Fields.
+    descriptor: int = None
+    directories: dict = field(default_factory=dict)
+    libc: object = field(default=None, repr=False)
+
+    def open(self):
+        """ Start an inotify instance. """
+        self.libc = \
+            ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        descriptor = self.libc.inotify_init1(IN_NONBLOCK|IN_CLOEXEC)
+        if descriptor < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+        self.descriptor = descriptor
+
+    def add_watch(self, directory):
+        """ Watch a given directory for files being written, moved or
+        deleted. Watching a directory twice is harmless. """
+        watch = \
+            self.libc.inotify_add_watch(
+                self.descriptor,
+                os.fsencode(directory),
+                WATCH_MASK
+            )
+        if watch < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number), directory)
+        self.directories[watch] = directory
+
+    def wait(self, timeout=None):
+        """ Wait, for up to a given number of seconds, or for ever, for
+        something to happen, and say whether it did. """
+        poller = select.poll()
+        poller.register(self.descriptor, select.POLLIN)
+        if timeout is not None:
+            timeout = timeout*1000
+        return bool(poller.poll(timeout))
+
+    def read_events(self):
+        """ Read what's happened since we last looked, as the directory and
+        name of each file, or, if the kernel had to throw events away, None
+        in place of both. """
+        result = []
+        while True:
+            try:
+                data = os.read(self.descriptor, READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                watch, mask, _, length = \
+                    EVENT_HEADER.unpack_from(data, offset)
+                offset = offset+EVENT_HEADER.size
+                name = data[offset:offset+length].rstrip(b"\0")
+                offset = offset+length
+                if mask & IN_Q_OVERFLOW:
+                    result.append((None, None))
+                elif watch in self.directories:
+                    result.append(
+                        (self.directories[watch], os.fsdecode(name))
+                    )
+        return result
+
+    def close(self):
+        """ Stop watching everything. """
+        if self.descriptor is not None:
+            os.close(self.descriptor)
+            self.descriptor = None
+            self.directories = {}
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class Agent:
+    """ The class in question. """
+    # Fields.
+    installer: object
+    window: float = DEFAULT_AGENT_WINDOW
+    inotify: Inotify = field(default_factory=Inotify, repr=False)
+    watched: dict = field(default_factory=dict)
+    repairs: int = 0
+
+    def make_steps(self):
+        """ Build a tuple of those of the installer's processes which declare
+        where their work shows up. """
+        installer = self.installer
+        steps = installer.make_essentials()
+        if not installer.minimal:
+            steps = \
+                steps+installer.make_non_essentials()+ \
+                (installer.make_wallpaper_step(),)
+        result = tuple(step for step in steps if step.get("watches"))
+        return result
+
+    def map_watches(self, steps):
+        """ Map each directory we watch to the files within it which we care
+        about, and each of those to the processes which care about it. We
+        watch directories, rather than files, because many programs replace
+        a file, rather than rewriting it. """
+        result = {}
+        for step in steps:
+            for path_to in step["watches"]:
+                directory, name = os.path.split(os.path.abspath(path_to))
+                names = result.setdefault(directory, {})
+                names.setdefault(name, set()).add(step["imperative"])
+        return result
+
+    def add_watches(self):
+        """ Watch those of the directories we care about which exist. One
+        which doesn't yet may well exist after a repair, so this is run
+        again after each. """
+        for directory in self.watched:
+            if os.path.isdir(directory):
+                self.inotify.add_watch(directory)
+
+    def wait_for_drift(self):
+        """ Wait, without polling, until something we care about changes,
+        then keep gathering changes until none has arrived for a whole
+        window, and return the processes which care about them. A change to
+        a file we don't care about, in a directory we watch, neither starts
+        nor extends the window. """
+        result = set()
+        deadline = None
+        timeout = None
+        while self.inotify.wait(timeout):
+            relevant = False
+            for directory, name in self.inotify.read_events():
+                if directory is None:
+                    # We missed something, so we check everything.
+                    for names in self.watched.values():
+                        for imperatives in names.values():
+                            result.update(imperatives)
+                    relevant = True
+                    continue
+                imperatives = self.watched.get(directory, {}).get(name)
+                if imperatives:
+                    result.update(imperatives)
+                    relevant = True
+            if relevant:
+                deadline = time.monotonic()+self.window
+            if deadline is not None:
+                timeout = max(deadline-time.monotonic(), 0)
+        return result
+
+    def forget_state(self):
+        """ Throw away what the installer has remembered about this computer,
+        and what it's recorded about its processes, since the last repair,
+        so that it checks afresh, and so that a long-running agent doesn't
+        grow. """
+        installer = self.installer
+        installer.apt_installed.clear()
+        installer.apt_failures.clear()
+        installer.get_package_index().refresh()
+        installer.os_release = None
+        installer.failure_log = []
+        installer.failure_output = {}
+        installer.tracer = Tracer()
+        if installer.history:
+            installer.history.flush()
+            installer.history.forget_estimates()
+
+    def repair(self, steps, imperatives):
+        """ Re-run those of the given processes whose work has come undone.
+        Return whether they all went through. """
+        self.forget_state()
+        drifted = tuple(
+            step for step in steps
+            if (step["imperative"] in imperatives) and
+            (not self.installer.verify_step(step))
+        )
+        if not drifted:
+            return True
+        print(
+            time.strftime("%Y-%m-%d %H:%M:%S")+" Repairing: "+
+            ", ".join(step["imperative"] for step in drifted)
+        )
+        self.repairs += 1
+        result = self.installer.run_steps(drifted)
+        for failure in self.installer.failure_log:
+            print("    * "+failure)
+        self.add_watches()
+        return result
+
+    def run(self, rounds=None):
+        """ Bring this computer in line, then keep it there, for a given
+        number of bursts of changes, or for ever. """
+        steps = self.make_steps()
+        self.watched = self.map_watches(steps)
+        self.installer.get_sudo()
+        self.inotify.open()
+        try:
+            self.add_watches()
+            print(
+                "Watching "+str(len(self.watched))+" directories for "+
+                "changes to "+str(len(steps))+" processes..."
+            )
+            self.repair(steps, {step["imperative"] for step in steps})
+            while (rounds is None) or (rounds > 0):
+                imperatives = self.wait_for_drift()
+                self.repair(steps, imperatives)
+                if rounds is not None:
+                    rounds -= 1
+        except KeyboardInterrupt:
+            print("\nStopped.")
+        finally:
+            self.inotify.close()
+            if self.installer.history:
+                self.installer.history.close()
+        return True
@@ -0,0 +1,267 @@
+"""
+This code defines a class which reads APT's package lists, in-process and
+without privileges, so that we can say which versions of which packages APT
+could install, how big they are, and on what they depend, without asking APT.
+It also defines some functions which work out how fresh those lists are.
+"""
+
+# Standard imports.
+import glob
+import os
+import re
+import time
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import (
+    DEFAULT_ENCODING,
+    DEFAULT_PATH_TO_APT_LISTS,
+    DEFAULT_PATH_TO_APT_SOURCES_DIR,
+    DEFAULT_PATH_TO_APT_SOURCES_LIST
+)
+from package_index import parse_stanza
+
+# Local constants.
+PACKAGES_PATTERN = "*_Packages"
+RELEASE_PATTERNS = ("*_InRelease", "*_Release")
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class AptCatalogue:
+    """ The class in question. """
+    # Fields.
+    path_to_apt_lists: str = DEFAULT_PATH_TO_APT_LISTS
+    stanzas: dict = field(default_factory=dict)
+    candidates: dict = field(default_factory=dict)
+
+    def get_paths_to_lists(self):
+        """ Get the paths to the uncompressed Packages files APT has
+        downloaded. """
+        pattern = os.path.join(self.path_to_apt_lists, PACKAGES_PATTERN)
+        result = sorted(glob.glob(pattern))
+        return result
+
+    def load(self):
+        """ Read every Packages file. The stanzas are only split up by package
+        here; they're parsed later, and only if someone asks about them. """
+        stanzas = {}
+        for path_to_list in self.get_paths_to_lists():
+            try:
+                with open(
+                    path_to_list,
+                    "r",
+                    encoding=DEFAULT_ENCODING,
+                    errors="replace"
+                ) as list_file:
+                    contents = list_file.read()
+            except OSError:
+                continue
+            for stanza in contents.split("\n\n"):
+                if not stanza.startswith("Package: "):
+                    continue
+                name = stanza[len("Package: "):stanza.find("\n")].strip()
+                stanzas.setdefault(name, []).append(stanza)
+        self.stanzas = stanzas
+        self.candidates = {}
+
+    def get_candidate(self, package_name):
+        """ Get the fields of the highest version of a given package which
+        APT knows about, or None if it doesn't know about it at all. Pinning
+        and phased updates are ignored. """
+        if package_name in self.candidates:
+            return self.candidates[package_name]
+        result = None
+        for stanza in self.stanzas.get(package_name, ()):
+            fields = parse_stanza(stanza)
+            if (
+                (result is None) or
+                (
+                    compare_debian_versions(
+                        fields.get("Version", "0"),
+                        result.get("Version", "0")
+                    ) > 0
+                )
+            ):
+                result = fields
+        self.candidates[package_name] = result
+        return result
+
+    def check_known(self, package_name):
+        """ Check whether APT knows about a given package. """
+        if package_name in self.stanzas:
+            return True
+        return False
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def get_order(letters, index):
+    """ Get the weight of a given character in the non-numeric part of a
+    Debian version string. Running off the end weighs less than anything but a
+    tilde. """
+    if index >= len(letters):
+        return 0
+    character = letters[index]
+    if character == "~":
+        return -1
+    if character.isalpha():
+        return ord(character)
+    return ord(character)+256
+
+def compare_fragments(fragment_a, fragment_b):
+    """ Compare the upstream versions, or revisions, of two Debian version
+    strings, as DPKG does. """
+    while fragment_a or fragment_b:
+        letters_a = re.match(r"[^0-9]*", fragment_a).group()
+        letters_b = re.match(r"[^0-9]*", fragment_b).group()
+        length = max(len(letters_a), len(letters_b))
+        for index in range(length):
+            difference = \
+                get_order(letters_a, index)-get_order(letters_b, index)
+            if difference:
+                return difference
+        fragment_a = fragment_a[len(letters_a):]
+        fragment_b = fragment_b[len(letters_b):]
+        digits_a = re.match(r"[0-9]*", fragment_a).group()
+        digits_b = re.match(r"[0-9]*", fragment_b).group()
+        difference = int(digits_a or 0)-int(digits_b or 0)
+        if difference:
+            return difference
+        fragment_a = fragment_a[len(digits_a):]
+        fragment_b = fragment_b[len(digits_b):]
+    return 0
+
+def split_debian_version(version):
+    """ Split a Debian version string into its epoch, upstream version and
+    revision. """
+    epoch = 0
+    if ":" in version:
+        epoch_string, version = version.split(":", 1)
+        epoch = int(epoch_string or 0)
+    revision = ""
+    if "-" in version:
+        version, revision = version.rsplit("-", 1)
+    return epoch, version, revision
+
+def compare_debian_versions(version_a, version_b):
+    """ Compare two Debian version strings, returning a negative number, zero
+    or a positive number, as version A is lower than, equal to or higher than
+    version B. """
+    epoch_a, upstream_a, revision_a = split_debian_version(version_a)
+    epoch_b, upstream_b, revision_b = split_debian_version(version_b)
+    if epoch_a != epoch_b:
+        return epoch_a-epoch_b
+    result = compare_fragments(upstream_a, upstream_b)
+    if result:
+        return result
+    result = compare_fragments(revision_a, revision_b)
+    return result
+
+def parse_depends(depends):
+    """ Parse a Depends field into a list of groups of alternatives, dropping
+    any version constraints and architecture qualifiers. """
+    result = []
+    if not depends:
+        return result
+    for group in depends.split(","):
+        alternatives = []
+        for alternative in group.split("|"):
+            name = alternative.strip().split(" ")[0].split("(")[0]
+            name = name.split(":")[0]
+            if name:
+                alternatives.append(name)
+        if alternatives:
+            result.append(alternatives)
+    return result
+
+def load_apt_catalogue(path_to_apt_lists=DEFAULT_PATH_TO_APT_LISTS):
+    """ Build and populate a catalogue. """
+    result = AptCatalogue(path_to_apt_lists=path_to_apt_lists)
+    result.load()
+    return result
+
+#############
+# FRESHNESS #
+#############
+
+def get_newest_time(paths, use_ctime=False):
+    """ Get the time at which the most recently changed of some files
+    changed, or None if none of them exist. """
+    result = None
+    for path_to in paths:
+        try:
+            stat = os.stat(path_to)
+        except OSError:
+            continue
+        changed_at = stat.st_ctime if use_ctime else stat.st_mtime
+        if (result is None) or (changed_at > result):
+            result = changed_at
+    return result
+
+def get_last_update_time(
+        paths_to_stamps,
+        path_to_apt_lists=DEFAULT_PATH_TO_APT_LISTS
+    ):
+    """ Work out when APT's lists were last updated, from the stamps which
+    get touched when an update succeeds, and from when the release files were
+    last written. (APT sets the latter's mtimes to the server's, so we go by
+    their ctimes.) """
+    paths_to_releases = []
+    for pattern in RELEASE_PATTERNS:
+        pattern = os.path.join(path_to_apt_lists, pattern)
+        paths_to_releases = paths_to_releases+glob.glob(pattern)
+    times = (
+        get_newest_time(paths_to_stamps),
+        get_newest_time(paths_to_releases, use_ctime=True)
+    )
+    times = [changed_at for changed_at in times if changed_at is not None]
+    if not times:
+        return None
+    return max(times)
+
+def list_apt_sources(
+        path_to_sources_list=DEFAULT_PATH_TO_APT_SOURCES_LIST,
+        path_to_sources_dir=DEFAULT_PATH_TO_APT_SOURCES_DIR
+    ):
+    """ List the files which configure APT's sources, along with the
+    directory holding most of them, whose mtime changes when one is
+    removed. """
+    result = [path_to_sources_list, path_to_sources_dir]
+    for pattern in ("*.list", "*.sources"):
+        result = result+glob.glob(os.path.join(path_to_sources_dir, pattern))
+    return result
+
+def check_apt_lists_fresh(
+        max_age,
+        paths_to_stamps,
+        path_to_apt_lists=DEFAULT_PATH_TO_APT_LISTS,
+        path_to_sources_list=DEFAULT_PATH_TO_APT_SOURCES_LIST,
+        path_to_sources_dir=DEFAULT_PATH_TO_APT_SOURCES_DIR
+    ):
+    """ Decide whether APT's lists are fresh enough to skip updating them,
+    i.e. whether they were updated within the maximum age given, and since
+    the sources last changed. Return the decision, and the reason for it. """
+    last_update = \
+        get_last_update_time(
+            paths_to_stamps,
+            path_to_apt_lists=path_to_apt_lists
+        )
+    if last_update is None:
+        return False, "no record of a previous update"
+    age = time.time()-last_update
+    if age > max_age:
+        return False, "lists are "+str(int(age))+" seconds old"
+    sources_changed = \
+        get_newest_time(
+            list_apt_sources(
+                path_to_sources_list=path_to_sources_list,
+                path_to_sources_dir=path_to_sources_dir
+            )
+        )
+    if (sources_changed is not None) and (sources_changed > last_update):
+        return False, "sources changed since the last update"
+    return True, "lists are "+str(int(age))+" seconds old"
@@ -0,0 +1,248 @@
+"""
+This code defines a class which runs commands under asyncio, on a single event
+loop in a background thread, so that many commands can be supervised at once.
+Each command's output is streamed into a bounded ring buffer, and into a
+rotating log file for the step which ran it, so that memory stays flat however
+chatty the command, and we still have the tail of the output when something
+goes wrong.
+"""
+
+# Standard imports.
+import asyncio
+import collections
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import (
+    DEFAULT_LOG_BACKUPS,
+    DEFAULT_LOG_MAX_BYTES,
+    DEFAULT_OUTPUT_RING_SIZE,
+    DEFAULT_PATH_TO_LOG_DIR
+)
+
+# Local constants.
+GRACE_PERIOD = 5
+MAX_LINE_LENGTH = 1024
+READ_SIZE = 4096
+
+##################
+# HELPER CLASSES #
+##################
+
+@dataclass
+class CommandResult:
+    """ What happened when we ran a command. """
+    return_code: int
+    tail: list = field(default_factory=list)
+    timed_out: bool = False
+    kept: list = field(default_factory=list)
+
+@dataclass
+class RotatingLog:
+    """ A log file which is rotated when it gets too big. """
+    path_to: str
+    max_bytes: int = DEFAULT_LOG_MAX_BYTES
+    backups: int = DEFAULT_LOG_BACKUPS
+    handle: object = None
+    size: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def rotate(self):
+        """ Shuffle the backups along, and start a new log. """
+        self.close()
+        for index in range(self.backups-1, 0, -1):
+            source = self.path_to+"."+str(index)
+            if os.path.exists(source):
+                os.replace(source, self.path_to+"."+str(index+1))
+        if self.backups > 0:
+            os.replace(self.path_to, self.path_to+".1")
+        else:
+            os.remove(self.path_to)
+
+    def open_handle(self):
+        """ Open the log file for appending. The handle stays open between
+        writes, until close() is called. """
+        self.handle = open(self.path_to, "ab") # pylint: disable=R1732
+        self.size = self.handle.tell()
+
+    def write(self, data):
+        """ Append some bytes to the log. """
+        with self.lock:
+            if self.handle is None:
+                self.open_handle()
+            if self.size and (self.size+len(data) > self.max_bytes):
+                self.rotate()
+                self.open_handle()
+            self.handle.write(data)
+            self.handle.flush()
+            self.size += len(data)
+
+    def close(self):
+        """ Close the log file, if it's open. """
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class AsyncCommandRunner:
+    """ The class in question. """
+    # Fields.
+    ring_size: int = DEFAULT_OUTPUT_RING_SIZE
+    path_to_log_dir: str = DEFAULT_PATH_TO_LOG_DIR
+    log_max_bytes: int = DEFAULT_LOG_MAX_BYTES
+    log_backups: int = DEFAULT_LOG_BACKUPS
+    loop: asyncio.AbstractEventLoop = None
+    logs: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def get_loop(self):
+        """ Get the event loop, starting it in a background thread if it isn't
+        running already. """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                thread = \
+                    threading.Thread(
+                        target=self.loop.run_forever,
+                        name="async-runner",
+                        daemon=True
+                    )
+                thread.start()
+            return self.loop
+
+    def get_log(self, log_name):
+        """ Get the rotating log for a given step. """
+        if not log_name:
+            return None
+        with self.lock:
+            if log_name not in self.logs:
+                os.makedirs(self.path_to_log_dir, exist_ok=True)
+                filename = re.sub(r"[^A-Za-z0-9]+", "_", log_name).strip("_")
+                self.logs[log_name] = \
+                    RotatingLog(
+                        os.path.join(self.path_to_log_dir, filename+".log"),
+                        max_bytes=self.log_max_bytes,
+                        backups=self.log_backups
+                    )
+            return self.logs[log_name]
+
+    async def pump(self, stream, ring, log, show_output, keep=None, kept=None):
+        """ Read a stream to its end, a block at a time, keeping the last
+        few lines in the ring buffer, along with any line, however early,
+        which matches a given pattern. """
+        partial = b""
+        while True:
+            block = await stream.read(READ_SIZE)
+            if not block:
+                break
+            if log:
+                log.write(block)
+            if show_output:
+                print(block.decode(errors="replace"), end="", flush=True)
+            lines = re.split(rb"\r\n|\r|\n", partial+block)
+            partial = lines.pop()[-MAX_LINE_LENGTH:]
+            for line in lines:
+                if line:
+                    line = line[:MAX_LINE_LENGTH].decode(errors="replace")
+                    ring.append(line)
+                    if keep and keep.match(line):
+                        kept.append(line)
+        if partial:
+            line = partial.decode(errors="replace")
+            ring.append(line)
+            if keep and keep.match(line):
+                kept.append(line)
+
+    async def finish(self, process, pumps):
+        """ Wait for a command's output to run dry, and then for the command
+        itself to exit, since it may have closed its output and carried on.
+        The output is shielded, so that, if we give up, we can still collect
+        what's left of it. """
+        await asyncio.shield(pumps)
+        result = await process.wait()
+        return result
+
+    async def supervise(
+            self,
+            arguments,
+            cwd,
+            timeout,
+            log_name,
+            show_output,
+            keep=None
+        ):
+        """ Run a command to completion, or until it times out. """
+        ring = collections.deque(maxlen=self.ring_size)
+        kept = []
+        if keep:
+            keep = re.compile(keep)
+        log = self.get_log(log_name)
+        if log:
+            log.write(("$ "+" ".join(arguments)+"\n").encode())
+        try:
+            process = \
+                await asyncio.create_subprocess_exec(
+                    *arguments,
+                    cwd=cwd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+        except OSError as error:
+            return CommandResult(return_code=127, tail=[str(error)])
+        pumps = asyncio.gather(
+            self.pump(process.stdout, ring, log, show_output, keep, kept),
+            self.pump(process.stderr, ring, log, show_output, keep, kept)
+        )
+        timed_out = False
+        try:
+            await asyncio.wait_for(self.finish(process, pumps), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            process.kill()
+            await process.wait()
+            try:
+                # A grandchild might still be holding the pipes open.
+                await asyncio.wait_for(pumps, GRACE_PERIOD)
+            except asyncio.TimeoutError:
+                pass
+            ring.append("[Timed out after "+str(timeout)+" seconds]")
+        result = \
+            CommandResult(
+                return_code=process.returncode,
+                tail=list(ring),
+                timed_out=timed_out,
+                kept=kept
+            )
+        return result
+
+    def run(
+            self,
+            arguments,
+            cwd=None,
+            timeout=None,
+            log_name=None,
+            show_output=False,
+            keep=None
+        ):
+        """ Run a command on the event loop, and wait for its result. This can
+        be called from any number of threads at once. Any line of output
+        matching the pattern to keep is kept, even once it's left the
+        ring. """
+        coroutine = \
+            self.supervise(
+                list(arguments),
+                cwd,
+                timeout,
+                log_name,
+                show_output,
+                keep=keep
+            )
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+        return future.result()
@@ -0,0 +1,208 @@
+"""
+This code defines a script which benchmarks the installer's orchestration
+against a fake system, recording the wall time, the number of subprocesses
+and the peak memory of a full run, and comparing them against saved baselines.
+"""
+
+# Standard imports.
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+# Local imports.
+from config import DEFAULT_ENCODING
+from fake_system import FakeSystem
+from hm_software_installer import HMSoftwareInstaller
+
+# Local constants.
+DEFAULT_PATH_TO_BASELINES = \
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "benchmark_baselines.json"
+    )
+DEFAULT_TOLERANCE = 1.5
+LATENCIES = {
+    "apt-get": 0.05,
+    "git": 0.03,
+    "pip3": 0.03,
+    "sh": 0.02,
+    "wget": 0.05
+}
+SCENARIOS = (
+    { "name": "fresh_serial", "jobs": 1, "rerun": False },
+    { "name": "fresh_parallel", "jobs": 4, "rerun": False },
+    { "name": "rerun", "jobs": 4, "rerun": True },
+    { "name": "rerun_resumed", "jobs": 4, "rerun": True, "resume": True },
+    {
+        "name": "lock_contention",
+        "jobs": 4,
+        "rerun": False,
+        "external_lock_seconds": 1.0
+    }
+)
+
+#############
+# FUNCTIONS #
+#############
+
+def run_installer(system, jobs, resume=False):
+    """ Run the installer, in full, against a given fake system. """
+    installer = \
+        HMSoftwareInstaller(
+            minimal=False,
+            jobs=jobs,
+            resume=resume,
+            **system.make_installer_fields()
+        )
+    working_dir = os.getcwd()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = installer.run()
+    finally:
+        os.chdir(working_dir)
+    return result
+
+def run_scenario(scenario):
+    """ Run a given scenario, and return its measurements. """
+    with tempfile.TemporaryDirectory() as root_dir:
+        system = \
+            FakeSystem(
+                root_dir,
+                latencies=LATENCIES,
+                external_lock_seconds=scenario.get("external_lock_seconds", 0)
+            )
+        if scenario["rerun"]:
+            run_installer(system, scenario["jobs"])
+        count_before = system.command_count
+        tracemalloc.start()
+        start = time.perf_counter()
+        passed = \
+            run_installer(
+                system,
+                scenario["jobs"],
+                resume=scenario.get("resume", False)
+            )
+        wall_time = time.perf_counter()-start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result = {
+            "passed": passed,
+            "wall_time": round(wall_time, 3),
+            "subprocess_count": system.command_count-count_before,
+            "peak_memory": peak_memory
+        }
+    return result
+
+def run_benchmarks():
+    """ Run every scenario. """
+    result = {}
+    for scenario in SCENARIOS:
+        result[scenario["name"]] = run_scenario(scenario)
+    return result
+
+def compare_to_baselines(results, baselines, tolerance=DEFAULT_TOLERANCE):
+    """ Compare some results with the baselines, and return a list of
+    regressions. Subprocess counts must not go up at all; times and memory
+    may wobble within the tolerance. """
+    result = []
+    for name, measurements in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        if not measurements["passed"]:
+            result.append(name+": the run failed")
+        if measurements["subprocess_count"] > baseline["subprocess_count"]:
+            result.append(
+                name+": subprocess count went from "+
+                str(baseline["subprocess_count"])+" to "+
+                str(measurements["subprocess_count"])
+            )
+        for key in ("wall_time", "peak_memory"):
+            if measurements[key] > baseline[key]*tolerance:
+                result.append(
+                    name+": "+key+" went from "+str(baseline[key])+" to "+
+                    str(measurements[key])
+                )
+    return result
+
+def print_results(results):
+    """ Print the results as a table. """
+    print(
+        "scenario".ljust(16)+"wall time (s)".rjust(14)+
+        "subprocesses".rjust(14)+"peak memory (KiB)".rjust(19)
+    )
+    for name, measurements in results.items():
+        print(
+            name.ljust(16)+
+            str(measurements["wall_time"]).rjust(14)+
+            str(measurements["subprocess_count"]).rjust(14)+
+            str(measurements["peak_memory"]//1024).rjust(19)
+        )
+
+def make_parser():
+    """ Make and return the parser object. """
+    result = argparse.ArgumentParser(description=__doc__)
+    result.add_argument(
+        "--path-to-baselines",
+        default=DEFAULT_PATH_TO_BASELINES,
+        help="The path to the JSON file holding the baselines"
+    )
+    result.add_argument(
+        "--save",
+        action="store_true",
+        help="Save these results as the new baselines"
+    )
+    result.add_argument(
+        "--tolerance",
+        default=DEFAULT_TOLERANCE,
+        type=float,
+        help=(
+            "How many times the baseline time or memory counts as a "+
+            "regression"
+        )
+    )
+    return result
+
+###################
+# RUN AND WRAP UP #
+###################
+
+def run():
+    """ Run this file. """
+    arguments = make_parser().parse_args()
+    results = run_benchmarks()
+    print_results(results)
+    if arguments.save:
+        with open(
+            arguments.path_to_baselines,
+            "w",
+            encoding=DEFAULT_ENCODING
+        ) as baselines_file:
+            json.dump(results, baselines_file, indent=4)
+        print("Saved baselines to "+arguments.path_to_baselines)
+        return
+    try:
+        with open(
+            arguments.path_to_baselines,
+            "r",
+            encoding=DEFAULT_ENCODING
+        ) as baselines_file:
+            baselines = json.load(baselines_file)
+    except FileNotFoundError:
+        print("No baselines at "+arguments.path_to_baselines)
+        return
+    regressions = \
+        compare_to_baselines(results, baselines, tolerance=arguments.tolerance)
+    for regression in regressions:
+        print("REGRESSION: "+regression)
+    if regressions:
+        raise SystemExit(1)
+    print("No regressions.")
+
+if __name__ == "__main__":
+    run()
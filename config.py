@@ -17,15 +17,81 @@ PROGRAM_DESCRIPTION = "His Majesty's Software Suite"
 PATH_TO_HOME = str(pathlib.Path.home())
 
 # Defaults.
+DEFAULT_AGENT_WINDOW = 2.0 # I.e. repair once changes have stopped for 2 s.
+DEFAULT_APT_LOCK_POLL_INTERVAL = 0.5
+DEFAULT_APT_LOCK_TIMEOUT = 600
+DEFAULT_APT_MAX_AGE = 6*60*60
+DEFAULT_DOWNLOAD_ATTEMPTS = 3
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 64*1024
+DEFAULT_DOWNLOAD_TIMEOUT = 30
 DEFAULT_EMAIL_ADDRESS = "tomdothosker@gmail.com"
 DEFAULT_ENCODING = "utf-8"
 DEFAULT_GIT_USERNAME = "tomhosker"
+DEFAULT_HOST_TIMEOUT = 2*60*60 # I.e. a whole run on one host.
+DEFAULT_LOG_BACKUPS = 3
+DEFAULT_LOG_MAX_BYTES = 1024*1024
 DEFAULT_OS = "ubuntu"
+DEFAULT_OUTPUT_RING_SIZE = 200
+DEFAULT_PATH_TO_APT_ARCHIVES = "/var/cache/apt/archives"
+DEFAULT_PATH_TO_APT_LISTS = "/var/lib/apt/lists"
+DEFAULT_PATH_TO_APT_PERIODIC_STAMP = \
+    "/var/lib/apt/periodic/update-success-stamp"
+DEFAULT_PATH_TO_APT_SOURCES_DIR = "/etc/apt/sources.list.d"
+DEFAULT_PATH_TO_APT_SOURCES_LIST = "/etc/apt/sources.list"
+DEFAULT_PATH_TO_APT_UPDATE_STAMP = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "apt-update-stamp")
+DEFAULT_PATH_TO_DCONF_DB = \
+    os.path.join(PATH_TO_HOME, ".config", "dconf", "user")
+DEFAULT_PATH_TO_DOWNLOAD_CACHE = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "downloads")
+DEFAULT_PATH_TO_DPKG_STATUS = "/var/lib/dpkg/status"
+DEFAULT_PATH_TO_DRM_DIR = "/sys/class/drm"
 DEFAULT_PATH_TO_GIT_CREDENTIALS = \
     os.path.join(PATH_TO_HOME, ".git-credentials")
+DEFAULT_PATH_TO_GITCONFIG = os.path.join(PATH_TO_HOME, ".gitconfig")
+DEFAULT_PATH_TO_HISTORY = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "history.sqlite3")
+DEFAULT_PATH_TO_JOURNAL = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "journal.json")
+DEFAULT_PATH_TO_LOCAL_APT_INDEX = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "local-apt-index")
+DEFAULT_PATH_TO_LOG_DIR = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "logs")
+DEFAULT_PATH_TO_OS_RELEASE = "/etc/os-release"
+DEFAULT_PATH_TO_PROC_LOCKS = "/proc/locks"
 DEFAULT_PATH_TO_PAT = \
     os.path.join(PATH_TO_HOME, "personal_access_token.txt")
+DEFAULT_PATH_TO_PCMANFM_CONFIG = \
+    os.path.join(
+        PATH_TO_HOME, ".config", "pcmanfm", "LXDE-pi", "desktop-items-0.conf"
+    )
+DEFAULT_PATH_TO_PREFETCH_DIR = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "prefetch")
+DEFAULT_PATH_TO_REPO_CACHE = \
+    os.path.join(PATH_TO_HOME, ".cache", "hmss", "repo-mirrors")
+DEFAULT_PATH_TO_VENV_DIR = \
+    os.path.join(PATH_TO_HOME, ".local", "share", "hmss", "venvs")
 DEFAULT_PATH_TO_WALLPAPER_DIR = \
     os.path.join(PATH_TO_HOME, "hmss/wallpaper/")
+DEFAULT_PATHS_TO_APT_LOCKS = (
+    "/var/lib/dpkg/lock-frontend",
+    "/var/lib/dpkg/lock",
+    "/var/lib/apt/lists/lock",
+    "/var/cache/apt/archives/lock"
+)
 DEFAULT_PYTHON_VERSION = 3
 DEFAULT_TARGET_DIR = PATH_TO_HOME
+DEFAULT_WALLPAPER_QUALITY = 82
+DEFAULT_WALLPAPER_RESOLUTIONS = (
+    (1280, 720), (1366, 768), (1920, 1080), (2560, 1440), (3840, 2160)
+)
+
+# Scheduling.
+DEFAULT_CLONE_JOBS = 4
+DEFAULT_FLEET_JOBS = 20
+DEFAULT_JOBS = 1
+DEFAULT_RESOURCE_CAPACITIES = {
+    "apt": 1, # Only one process can hold the DPKG lock at once.
+    "cwd": 1, # Only one step at a time can wander around the file system.
+    "network": 4
+}
@@ -0,0 +1,281 @@
+"""
+This code defines some functions which read configuration files in-process,
+work out what would have to change in them to bring them to a desired state,
+and apply those changes with a single atomic write per file, writing nothing
+at all if nothing needs to change. It understands Git's configuration files,
+and the INI files of desktops such as PCManFM's.
+"""
+
+# Standard imports.
+import os
+import re
+import stat
+import tempfile
+
+# Local imports.
+from config import DEFAULT_ENCODING
+
+# Local constants.
+GIT_ESCAPES = { "n": "\n", "t": "\t", "b": "\b", "\"": "\"", "\\": "\\" }
+GIT_SECTION_PATTERN = re.compile(r'\[\s*([^\s\]"]+)(?:\s+"(.*)")?\s*\]$')
+INI_SECTION_PATTERN = re.compile(r"\[(.*)\]$")
+
+###########
+# GENERIC #
+###########
+
+def read_text(path_to, encoding=DEFAULT_ENCODING):
+    """ Read a text file, or return None if there isn't one. """
+    try:
+        with open(path_to, "r", encoding=encoding) as text_file:
+            return text_file.read()
+    except OSError:
+        return None
+
+def write_text_atomically(path_to, text, mode=None, encoding=DEFAULT_ENCODING):
+    """ Write a text file, via a temporary file in the same directory, so that
+    nobody ever sees it half written. The file keeps its permissions, or, if
+    it's new, gets the usual ones, unless we're given some. """
+    directory = os.path.dirname(os.path.abspath(path_to))
+    os.makedirs(directory, exist_ok=True)
+    if mode is None:
+        try:
+            mode = os.stat(path_to).st_mode & 0o7777
+        except OSError:
+            mode = 0o644
+    descriptor, path_to_temp = \
+        tempfile.mkstemp(dir=directory, prefix=".hmss-", suffix=".tmp")
+    try:
+        with open(descriptor, "w", encoding=encoding) as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fchmod(temp_file.fileno(), mode)
+            os.fsync(temp_file.fileno())
+        os.replace(path_to_temp, path_to)
+    except BaseException:
+        os.remove(path_to_temp)
+        raise
+
+def apply_text(path_to, current, wanted, mode=None, encoding=DEFAULT_ENCODING):
+    """ Bring a file's text from what it is to what we want, with one write,
+    or with none if they're the same, and say whether we wrote it. If we're
+    given some permissions, the file gets them either way. """
+    if current == wanted:
+        if (
+            (mode is not None) and
+            (stat.S_IMODE(os.stat(path_to).st_mode) != mode)
+        ):
+            os.chmod(path_to, mode)
+        return False
+    write_text_atomically(path_to, wanted, mode=mode, encoding=encoding)
+    return True
+
+#######
+# GIT #
+#######
+
+def parse_git_value(raw):
+    """ Turn a value, as it's written in a Git configuration file, into the
+    value itself, undoing quotes and escapes, and dropping any comment. """
+    result = []
+    kept = 0
+    quoted = False
+    characters = iter(raw.strip())
+    for character in characters:
+        if character == "\\":
+            escaped = next(characters, "")
+            result.append(GIT_ESCAPES.get(escaped, escaped))
+            kept = len(result)
+        elif character == "\"":
+            quoted = not quoted
+            kept = len(result)
+        elif (character in "#;") and not quoted:
+            break
+        else:
+            result.append(character)
+            if quoted or not character.isspace():
+                kept = len(result)
+    return "".join(result[:kept])
+
+def format_git_value(value):
+    """ Write a value as Git would in its configuration file, quoting it if
+    it would otherwise be read back differently. """
+    result = (
+        value.replace("\\", "\\\\").replace("\"", "\\\"")
+        .replace("\n", "\\n").replace("\t", "\\t")
+    )
+    if (result != result.strip()) or ("#" in result) or (";" in result):
+        result = "\""+result+"\""
+    return result
+
+def parse_git_line(line):
+    """ Make sense of one line of a Git configuration file, returning the
+    section it starts, as "section" or "section.subsection", or the name and
+    raw value of the variable it sets, or None if it does neither. """
+    line = line.strip()
+    if (not line) or line.startswith(("#", ";")):
+        return None
+    match = GIT_SECTION_PATTERN.match(line)
+    if match:
+        section = match.group(1).lower()
+        if match.group(2) is not None:
+            section = section+"."+match.group(2)
+        return ("section", section)
+    name, equals, value = line.partition("=")
+    if not equals:
+        # A name on its own means true.
+        value = "true"
+    return ("variable", name.strip().lower(), value)
+
+def parse_git_config(text):
+    """ Map each key in the text of a Git configuration file, in the form in
+    which "git config" takes it, to its value. Includes are ignored. """
+    result = {}
+    section = None
+    for line in (text or "").splitlines():
+        parsed = parse_git_line(line)
+        if parsed is None:
+            continue
+        if parsed[0] == "section":
+            section = parsed[1]
+        elif section is not None:
+            result[section+"."+parsed[1]] = parse_git_value(parsed[2])
+    return result
+
+def make_git_section_header(section):
+    """ Make the line which starts a given section. """
+    name, _, subsection = section.partition(".")
+    if subsection:
+        return "["+name+" \""+subsection+"\"]\n"
+    return "["+name+"]\n"
+
+def find_git_values(lines):
+    """ Map each key set in some lines of a Git configuration file to the
+    values, in order, to which it's set. """
+    result = {}
+    section = None
+    for line in lines:
+        parsed = parse_git_line(line)
+        if parsed and (parsed[0] == "section"):
+            section = parsed[1]
+        elif parsed and (section is not None):
+            result.setdefault(section+"."+parsed[1], []).append(
+                parse_git_value(parsed[2])
+            )
+    return result
+
+def update_git_config(text, wanted):
+    """ Work out the text of a Git configuration file once some keys have
+    been set to some values, changing as little as possible: other keys,
+    comments and layout are left alone, a key we want is changed where it
+    is, and a key which isn't there yet is added to the end of its
+    section. Like Git, we won't replace several values of a key with one,
+    and raise a ValueError if asked to, unless the last of them, which is
+    the one that counts, is already what we want. """
+    lines = (text or "").splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] = lines[-1]+"\n"
+    values = find_git_values(lines)
+    for key, value in wanted.items():
+        if (len(values.get(key, ())) > 1) and (values[key][-1] != value):
+            raise ValueError(
+                "cannot overwrite multiple values of "+key+" with a single "+
+                "value"
+            )
+    result = []
+    section_ends = {}
+    section = None
+    for line in lines:
+        parsed = parse_git_line(line)
+        if parsed and (parsed[0] == "section"):
+            section = parsed[1]
+        elif parsed and (section is not None):
+            key = section+"."+parsed[1]
+            if (
+                (key in wanted) and
+                (len(values[key]) == 1) and
+                (values[key][0] != wanted[key])
+            ):
+                name = line.strip().partition("=")[0].strip()
+                line = "\t"+name+" = "+format_git_value(wanted[key])+"\n"
+        result.append(line)
+        if section is not None:
+            section_ends[section] = len(result)
+    missing = {}
+    for key, value in wanted.items():
+        if key not in values:
+            section, name = key.rsplit(".", 1)
+            missing.setdefault(section, []).append(
+                "\t"+name+" = "+format_git_value(value)+"\n"
+            )
+    existing = sorted(
+        (section for section in missing if section in section_ends),
+        key=lambda section: section_ends[section],
+        reverse=True
+    )
+    for section in existing:
+        index = section_ends[section]
+        result[index:index] = missing.pop(section)
+    for section, new_lines in missing.items():
+        result.append(make_git_section_header(section))
+        result.extend(new_lines)
+    return "".join(result)
+
+#######
+# INI #
+#######
+
+def parse_ini(text):
+    """ Map each section of the text of an INI file to a dictionary of its
+    keys and values. """
+    result = {}
+    section = None
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if (not line) or line.startswith(("#", ";")):
+            continue
+        match = INI_SECTION_PATTERN.match(line)
+        if match:
+            section = match.group(1)
+            result.setdefault(section, {})
+        elif (section is not None) and ("=" in line):
+            key, _, value = line.partition("=")
+            result[section][key.strip()] = value.strip()
+    return result
+
+def update_ini(text, section, wanted):
+    """ Work out the text of an INI file once some keys in a given section
+    have been set to some values, changing as little as possible. """
+    lines = (text or "").splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] = lines[-1]+"\n"
+    result = []
+    section_end = None
+    seen = set()
+    current = None
+    for line in lines:
+        stripped = line.strip()
+        match = INI_SECTION_PATTERN.match(stripped)
+        if match:
+            current = match.group(1)
+        elif (current == section) and ("=" in stripped):
+            key = stripped.partition("=")[0].strip()
+            if key in wanted:
+                if key in seen:
+                    continue
+                seen.add(key)
+                line = key+"="+wanted[key]+"\n"
+        result.append(line)
+        if current == section:
+            section_end = len(result)
+    missing = [
+        key+"="+value+"\n" for key, value in wanted.items()
+        if key not in seen
+    ]
+    if not missing:
+        return "".join(result)
+    if section_end is None:
+        result.append("["+section+"]\n")
+        section_end = len(result)
+    result[section_end:section_end] = missing
+    return "".join(result)
@@ -0,0 +1,169 @@
+"""
+This code defines some functions which export the .deb files that APT has
+downloaded into a shared cache directory, and which turn such a directory
+into a local APT repository, so that other machines can install from it
+instead of from the internet.
+"""
+
+# Standard imports.
+import glob
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+
+# Local imports.
+from config import (
+    DEFAULT_ENCODING,
+    DEFAULT_PATH_TO_APT_ARCHIVES,
+    DEFAULT_PATH_TO_LOCAL_APT_INDEX
+)
+from downloader import load_json, write_json_atomically
+
+# Local constants.
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_LENGTH = 60
+INDEX_CACHE_FILENAME = "index_cache.json"
+PACKAGES_FILENAME = "Packages"
+
+#############
+# EXPORTING #
+#############
+
+def export_debs(
+        path_to_deb_cache,
+        source_dirs=(DEFAULT_PATH_TO_APT_ARCHIVES,)
+    ):
+    """ Copy any .deb files in the source directories which aren't already in
+    the cache into it, and return how many we copied. """
+    os.makedirs(path_to_deb_cache, exist_ok=True)
+    result = 0
+    for source_dir in source_dirs:
+        pattern = os.path.join(source_dir, "**", "*.deb")
+        for path_to_deb in glob.glob(pattern, recursive=True):
+            destination = \
+                os.path.join(path_to_deb_cache, os.path.basename(path_to_deb))
+            if (
+                os.path.exists(destination) and
+                (os.path.getsize(destination) == os.path.getsize(path_to_deb))
+            ):
+                continue
+            shutil.copy2(path_to_deb, destination+".tmp")
+            os.replace(destination+".tmp", destination)
+            result += 1
+    return result
+
+############
+# INDEXING #
+############
+
+def read_ar_members(path_to_deb):
+    """ Yield the name and contents of each member of an ar archive, which is
+    what a .deb file is on the outside. """
+    with open(path_to_deb, "rb") as deb_file:
+        if deb_file.read(len(AR_MAGIC)) != AR_MAGIC:
+            raise ValueError(path_to_deb+" is not an ar archive")
+        while True:
+            header = deb_file.read(AR_HEADER_LENGTH)
+            if len(header) < AR_HEADER_LENGTH:
+                return
+            name = header[:16].decode("ascii").strip().rstrip("/")
+            size = int(header[48:58].decode("ascii").strip())
+            contents = deb_file.read(size)
+            if size%2:
+                deb_file.read(1)
+            yield name, contents
+
+def read_deb_control(path_to_deb):
+    """ Read the control file out of a .deb, in-process if Python can
+    decompress it, and via dpkg-deb if not. """
+    for name, contents in read_ar_members(path_to_deb):
+        if not name.startswith("control.tar"):
+            continue
+        try:
+            with tarfile.open(fileobj=io.BytesIO(contents)) as control_tar:
+                for member in control_tar.getmembers():
+                    if member.name in ("control", "./control"):
+                        control = control_tar.extractfile(member).read()
+                        return control.decode(DEFAULT_ENCODING).strip()
+        except tarfile.CompressionError:
+            break
+    process = \
+        subprocess.run(
+            ["dpkg-deb", "--field", path_to_deb],
+            stdout=subprocess.PIPE,
+            check=True
+        )
+    return process.stdout.decode(DEFAULT_ENCODING).strip()
+
+def hash_deb(path_to_deb):
+    """ Compute the checksums which APT wants for a .deb. """
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    with open(path_to_deb, "rb") as deb_file:
+        for chunk in iter(lambda: deb_file.read(1024*1024), b""):
+            md5.update(chunk)
+            sha256.update(chunk)
+    return md5.hexdigest(), sha256.hexdigest()
+
+def make_packages_stanza(path_to_deb):
+    """ Make the stanza describing a given .deb in a Packages file. The
+    filename is given relative to the root of the file system, which is where
+    our source line points. """
+    md5sum, sha256 = hash_deb(path_to_deb)
+    result = (
+        read_deb_control(path_to_deb)+"\n"+
+        "Filename: "+os.path.abspath(path_to_deb).lstrip("/")+"\n"+
+        "Size: "+str(os.path.getsize(path_to_deb))+"\n"+
+        "MD5sum: "+md5sum+"\n"+
+        "SHA256: "+sha256+"\n"
+    )
+    return result
+
+def build_packages_index(
+        path_to_deb_cache,
+        path_to_index_dir=DEFAULT_PATH_TO_LOCAL_APT_INDEX
+    ):
+    """ Write a Packages file describing every .deb in the cache. The index
+    lives in a directory of its own, so that the cache itself can be
+    read-only, e.g. on a USB stick. Stanzas for .debs we've seen before are
+    reused, so that only new files are read and hashed. """
+    os.makedirs(path_to_index_dir, exist_ok=True)
+    path_to_index_cache = \
+        os.path.join(path_to_index_dir, INDEX_CACHE_FILENAME)
+    old_cache = load_json(path_to_index_cache)
+    new_cache = {}
+    stanzas = []
+    paths_to_debs = \
+        sorted(glob.glob(os.path.join(path_to_deb_cache, "*.deb")))
+    for path_to_deb in paths_to_debs:
+        stat = os.stat(path_to_deb)
+        key = os.path.abspath(path_to_deb)
+        fingerprint = [stat.st_size, stat.st_mtime]
+        entry = old_cache.get(key)
+        if entry and (entry["fingerprint"] == fingerprint):
+            stanza = entry["stanza"]
+        else:
+            stanza = make_packages_stanza(path_to_deb)
+        new_cache[key] = { "fingerprint": fingerprint, "stanza": stanza }
+        stanzas.append(stanza)
+    path_to_packages = os.path.join(path_to_index_dir, PACKAGES_FILENAME)
+    with open(
+        path_to_packages+".tmp",
+        "w",
+        encoding=DEFAULT_ENCODING
+    ) as packages_file:
+        packages_file.write("\n".join(stanzas))
+    os.replace(path_to_packages+".tmp", path_to_packages)
+    write_json_atomically(path_to_index_cache, new_cache)
+    return len(stanzas)
+
+def make_sources_line(path_to_index_dir=DEFAULT_PATH_TO_LOCAL_APT_INDEX):
+    """ Make the line for APT's sources list which points at our index. This
+    is a flat repository rooted at "/", so that the filenames in the index can
+    point anywhere. """
+    directory = os.path.abspath(path_to_index_dir).lstrip("/")+"/"
+    result = "deb [trusted=yes] file:/ "+directory+"\n"
+    return result
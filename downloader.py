@@ -0,0 +1,256 @@
+"""
+This code defines a class which downloads files over HTTP(S), streaming them
+to disk a chunk at a time, resuming interrupted downloads where they left off,
+checking what it gets, and keeping a content-addressed cache so that a file
+which is still current doesn't have to be downloaded again.
+"""
+
+# Standard imports.
+import hashlib
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass
+
+# Local imports.
+from config import (
+    DEFAULT_DOWNLOAD_ATTEMPTS,
+    DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    DEFAULT_DOWNLOAD_TIMEOUT,
+    DEFAULT_ENCODING,
+    DEFAULT_PATH_TO_DOWNLOAD_CACHE
+)
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class Downloader:
+    """ The class in question. """
+    # Fields.
+    path_to_cache: str = DEFAULT_PATH_TO_DOWNLOAD_CACHE
+    chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE
+    timeout: int = DEFAULT_DOWNLOAD_TIMEOUT
+    attempts: int = DEFAULT_DOWNLOAD_ATTEMPTS
+
+    def get_path_to_index(self):
+        """ Get the path to the file which maps URLs to cached objects. """
+        result = os.path.join(self.path_to_cache, "index.json")
+        return result
+
+    def load_index(self):
+        """ Load the cache's index, or an empty one if there isn't one. """
+        try:
+            with open(
+                self.get_path_to_index(),
+                "r",
+                encoding=DEFAULT_ENCODING
+            ) as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self, index):
+        """ Write the cache's index, atomically. """
+        os.makedirs(self.path_to_cache, exist_ok=True)
+        write_json_atomically(self.get_path_to_index(), index)
+
+    def get_object_path(self, sha256, url):
+        """ Get the path under which an object with a given hash lives. The
+        object keeps its original filename, since some consumers (e.g. APT)
+        care about the extension. """
+        filename = os.path.basename(urllib.parse.urlparse(url).path)
+        result = \
+            os.path.join(self.path_to_cache, "objects", sha256, filename)
+        return result
+
+    def get_partial_paths(self, url):
+        """ Get the paths to the partial download of a given URL, and to the
+        metadata we keep alongside it. """
+        stem = hashlib.sha256(url.encode(DEFAULT_ENCODING)).hexdigest()
+        partial_dir = os.path.join(self.path_to_cache, "partial")
+        path_to_partial = os.path.join(partial_dir, stem+".part")
+        path_to_metadata = os.path.join(partial_dir, stem+".json")
+        return path_to_partial, path_to_metadata
+
+    def open_url(self, url, method="GET", headers=None):
+        """ Open a URL, returning the response, even if it's an HTTP error. """
+        request = \
+            urllib.request.Request(url, method=method, headers=headers or {})
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as error:
+            return error
+
+    def check_current(self, url, entry):
+        """ Check whether a cached entry is still the current version of what
+        lives at a given URL. If we can't reach the server, we take it that
+        it is. """
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = self.open_url(url, method="HEAD", headers=headers)
+        except (OSError, urllib.error.URLError):
+            return True
+        with response:
+            if response.status == 304:
+                return True
+            if response.status != 200:
+                return False
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            length = response.headers.get("Content-Length")
+        if etag or last_modified:
+            return (
+                (etag == entry.get("etag")) and
+                (last_modified == entry.get("last_modified"))
+            )
+        if length is not None:
+            return int(length) == entry.get("size")
+        return False
+
+    def find_cached(self, url, expected_sha256=None, check_remote=True):
+        """ Find a cached copy of what lives at a given URL, if we have an
+        intact one which is still current. If we're told not to check with the
+        server, we take it that any intact copy is current. """
+        entry = self.load_index().get(url)
+        if not entry:
+            return None
+        if expected_sha256 and (entry["sha256"] != expected_sha256):
+            return None
+        path_to_object = self.get_object_path(entry["sha256"], url)
+        if (
+            (not os.path.isfile(path_to_object)) or
+            (os.path.getsize(path_to_object) != entry["size"])
+        ):
+            return None
+        if check_remote and not self.check_current(url, entry):
+            return None
+        return path_to_object
+
+    def download_once(self, url, path_to_partial, metadata):
+        """ Make a single attempt at getting the rest of a download. The
+        metadata dictionary is updated as we go. Return True if we now have the
+        whole thing. """
+        headers = {}
+        offset = 0
+        if os.path.exists(path_to_partial) and metadata.get("validator"):
+            offset = os.path.getsize(path_to_partial)
+            headers["Range"] = "bytes="+str(offset)+"-"
+            headers["If-Range"] = metadata["validator"]
+        response = self.open_url(url, headers=headers)
+        with response:
+            if response.status == 416:
+                # We asked for bytes beyond the end: we've got the lot.
+                return offset == metadata.get("size")
+            if response.status == 200:
+                offset = 0
+            elif response.status != 206:
+                raise OSError("HTTP status "+str(response.status))
+            length = response.headers.get("Content-Length")
+            metadata["etag"] = response.headers.get("ETag")
+            metadata["last_modified"] = response.headers.get("Last-Modified")
+            metadata["validator"] = \
+                metadata["etag"] or metadata["last_modified"]
+            if length is not None:
+                metadata["size"] = offset+int(length)
+            with open(path_to_partial, "r+b" if offset else "wb") as partial:
+                partial.seek(offset)
+                partial.truncate()
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    partial.write(chunk)
+        size = os.path.getsize(path_to_partial)
+        if metadata.get("size") is None:
+            metadata["size"] = size
+        return size == metadata["size"]
+
+    def fetch(self, url, expected_sha256=None):
+        """ Get a local copy of what lives at a given URL, from the cache if
+        possible, and return its path, or None if we couldn't get an intact
+        copy. """
+        cached = self.find_cached(url, expected_sha256=expected_sha256)
+        if cached:
+            return cached
+        path_to_partial, path_to_metadata = self.get_partial_paths(url)
+        os.makedirs(os.path.dirname(path_to_partial), exist_ok=True)
+        metadata = load_json(path_to_metadata)
+        complete = False
+        for _ in range(max(self.attempts, 1)):
+            try:
+                complete = \
+                    self.download_once(url, path_to_partial, metadata)
+            except (OSError, urllib.error.URLError):
+                complete = False
+            write_json_atomically(path_to_metadata, metadata)
+            if complete:
+                break
+        if not complete:
+            return None
+        sha256 = hash_file(path_to_partial, self.chunk_size)
+        if expected_sha256 and (sha256 != expected_sha256):
+            remove_if_present(path_to_partial)
+            remove_if_present(path_to_metadata)
+            return None
+        path_to_object = self.get_object_path(sha256, url)
+        os.makedirs(os.path.dirname(path_to_object), exist_ok=True)
+        os.replace(path_to_partial, path_to_object)
+        remove_if_present(path_to_metadata)
+        index = self.load_index()
+        old_entry = index.get(url)
+        index[url] = {
+            "sha256": sha256,
+            "size": metadata["size"],
+            "etag": metadata.get("etag"),
+            "last_modified": metadata.get("last_modified")
+        }
+        self.save_index(index)
+        if old_entry and (old_entry["sha256"] != sha256):
+            remove_if_present(self.get_object_path(old_entry["sha256"], url))
+        return path_to_object
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def hash_file(path_to, chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE):
+    """ Compute the SHA256 hash of a file, a chunk at a time. """
+    hasher = hashlib.sha256()
+    with open(path_to, "rb") as file_to_hash:
+        while True:
+            chunk = file_to_hash.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def load_json(path_to):
+    """ Load a JSON file, or an empty dictionary if we can't. """
+    try:
+        with open(path_to, "r", encoding=DEFAULT_ENCODING) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return {}
+
+def write_json_atomically(path_to, data):
+    """ Write some data to a JSON file, such that nobody ever sees a half
+    written file. """
+    path_to_temp = path_to+".tmp"
+    with open(path_to_temp, "w", encoding=DEFAULT_ENCODING) as json_file:
+        json.dump(data, json_file, indent=4)
+    os.replace(path_to_temp, path_to)
+
+def remove_if_present(path_to):
+    """ Remove a file, if it exists. """
+    try:
+        os.remove(path_to)
+    except FileNotFoundError:
+        pass
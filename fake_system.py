@@ -0,0 +1,496 @@
+"""
+This code defines a class which stands in for a real computer, so that the
+installer can be tested and benchmarked without touching the one it's running
+on. It fakes APT, DPKG, Git, PIP, virtual environments and downloads, keeping
+its state in a scratch directory, and can be told how slow and how flaky each
+command should be, and for how long some other process holds the DPKG lock.
+"""
+
+# Standard imports.
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+# Local imports.
+from async_runner import CommandResult
+from config import DEFAULT_ENCODING, DEFAULT_OUTPUT_RING_SIZE
+
+# Local constants.
+APT_LOCK_ERROR = (
+    "E: Could not get lock /var/lib/dpkg/lock-frontend. It is held by "+
+    "process 4242 (unattended-upgr)\n"
+)
+APT_LOCK_EXIT_CODE = 100
+APT_LOCK_HOLDER = (4242, "unattended-upgr")
+EXTRA_COMMANDS = { "google-chrome-stable": ("google-chrome",) }
+OPTIONS_WITH_VALUES = {
+    "--branch", "--depth", "--filter", "--origin", "--reference",
+    "--reference-if-able", "-b", "-c", "-C", "-o"
+}
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class FakeSystem:
+    """ The class in question. """
+    # Class attributes.
+    UPSTREAM_COMMANDS: ClassVar[tuple] = \
+        ("diff", "merge", "rev-list", "status")
+
+    # Fields.
+    root_dir: str
+    latencies: dict = field(default_factory=dict)
+    default_latency: float = 0.0
+    failure_rates: dict = field(default_factory=dict)
+    seed: int = 0
+    external_lock_seconds: float = 0.0
+    pending_upgrades: int = 0
+    display_resolution: tuple = None
+    command_count: int = 0
+    download_count: int = 0
+    commands_run: list = field(default_factory=list)
+    distributions: dict = field(default_factory=dict)
+    git_config: dict = field(default_factory=dict)
+    settings: dict = field(default_factory=dict)
+    upstreams: dict = field(default_factory=dict)
+    dpkg_lock: threading.Lock = \
+        field(default_factory=threading.Lock, repr=False)
+    state_lock: threading.Lock = \
+        field(default_factory=threading.Lock, repr=False)
+    started_at: float = field(default_factory=time.monotonic)
+    rng: random.Random = None
+
+    def __post_init__(self):
+        self.rng = random.Random(self.seed)
+        for directory in (
+            self.get_bin_dir(),
+            self.get_home_dir(),
+            self.get_wallpaper_dir(),
+            os.path.dirname(self.get_path_to_dpkg_status())
+        ):
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.get_path_to_dpkg_status()):
+            with open(
+                self.get_path_to_dpkg_status(),
+                "w",
+                encoding=DEFAULT_ENCODING
+            ):
+                pass
+        path_to_pat = os.path.join(self.get_home_dir(), "pat.txt")
+        with open(path_to_pat, "w", encoding=DEFAULT_ENCODING) as pat_file:
+            pat_file.write("fake-personal-access-token\n")
+
+    def get_bin_dir(self):
+        """ Get the directory which stands in for /usr/bin. """
+        return os.path.join(self.root_dir, "usr", "bin")
+
+    def get_home_dir(self):
+        """ Get the directory which stands in for the user's home. """
+        return os.path.join(self.root_dir, "home")
+
+    def get_wallpaper_dir(self):
+        """ Get the directory which stands in for HMSS's wallpaper folder. """
+        return os.path.join(self.get_home_dir(), "hmss", "wallpaper")
+
+    def get_path_to_dpkg_status(self):
+        """ Get the path to the fake DPKG status file. """
+        return os.path.join(self.root_dir, "var", "lib", "dpkg", "status")
+
+    def get_path_to_gitconfig(self):
+        """ Get the path to the fake global Git configuration. """
+        return os.path.join(self.get_home_dir(), ".gitconfig")
+
+    def get_apt_lists_dir(self):
+        """ Get the directory which stands in for APT's package lists. """
+        return os.path.join(self.root_dir, "var", "lib", "apt", "lists")
+
+    def make_installer_fields(self):
+        """ Make the fields with which to build an installer object which runs
+        against this fake system rather than the real one. """
+        home_dir = self.get_home_dir()
+        cache_dir = os.path.join(home_dir, ".cache", "hmss")
+        result = {
+            "this_os": "ubuntu",
+            "target_dir": home_dir,
+            "path_to_git_credentials": \
+                os.path.join(home_dir, ".git-credentials"),
+            "path_to_pat": os.path.join(home_dir, "pat.txt"),
+            "path_to_wallpaper_dir": self.get_wallpaper_dir(),
+            "path_to_download_cache": os.path.join(cache_dir, "downloads"),
+            "path_to_dpkg_status": self.get_path_to_dpkg_status(),
+            "path_to_apt_lists": self.get_apt_lists_dir(),
+            "path_to_apt_sources_list": \
+                os.path.join(self.root_dir, "etc", "apt", "sources.list"),
+            "path_to_apt_sources_dir": \
+                os.path.join(self.root_dir, "etc", "apt", "sources.list.d"),
+            "path_to_apt_periodic_stamp": \
+                os.path.join(
+                    self.root_dir, "var", "lib", "apt", "periodic",
+                    "update-success-stamp"
+                ),
+            "path_to_apt_update_stamp": \
+                os.path.join(cache_dir, "apt-update-stamp"),
+            "path_to_gitconfig": self.get_path_to_gitconfig(),
+            "path_to_history": os.path.join(cache_dir, "history.sqlite3"),
+            "path_to_journal": os.path.join(cache_dir, "journal.json"),
+            "path_to_local_apt_index": \
+                os.path.join(cache_dir, "local-apt-index"),
+            "path_to_prefetch_dir": os.path.join(cache_dir, "prefetch"),
+            "path_to_repo_cache": os.path.join(cache_dir, "repo-mirrors"),
+            "path_to_venv_dir": \
+                os.path.join(home_dir, ".local", "share", "hmss", "venvs"),
+            "search_path": self.get_bin_dir(),
+            "system": self
+        }
+        return result
+
+    def sleep_for(self, name):
+        """ Take as long as a given command is meant to take. """
+        latency = self.latencies.get(name, self.default_latency)
+        if latency:
+            time.sleep(latency)
+
+    def check_fails(self, name):
+        """ Decide, at random, whether a given command fails this time. """
+        rate = self.failure_rates.get(name, 0)
+        with self.state_lock:
+            return self.rng.random() < rate
+
+    def run(self, arguments, cwd=None, show_output=False):
+        """ Pretend to run a command, and return its exit code. """
+        result = \
+            self.run_capturing(arguments, cwd=cwd, show_output=show_output)
+        return result.return_code
+
+    def run_capturing(
+            self,
+            arguments,
+            cwd=None,
+            timeout=None,
+            log_name=None,
+            show_output=False,
+            keep=None
+        ):
+        """ Pretend to run a command, and return a record of what happened.
+        The fake commands never hang, and keep no logs. """
+        del timeout, log_name
+        with self.state_lock:
+            self.command_count += 1
+            self.commands_run.append(list(arguments))
+        arguments = list(arguments)
+        if arguments and (arguments[0] == "sudo"):
+            arguments = arguments[1:]
+        if arguments and (arguments[0] == "env"):
+            arguments = arguments[1:]
+            while arguments and ("=" in arguments[0]):
+                arguments = arguments[1:]
+        name = os.path.basename(arguments[0])
+        self.sleep_for(name)
+        if self.check_fails(name):
+            return CommandResult(return_code=1, tail=["E: Fake failure"])
+        handler = getattr(self, "run_"+name.replace("-", "_"), None)
+        if not handler:
+            return CommandResult(return_code=0)
+        output, return_code = handler(arguments[1:], cwd)
+        if show_output and output:
+            print(output, end="")
+        result = \
+            CommandResult(
+                return_code=return_code,
+                tail=output.splitlines()[-DEFAULT_OUTPUT_RING_SIZE:],
+                kept=[
+                    line for line in output.splitlines()
+                    if keep and re.match(keep, line)
+                ]
+            )
+        return result
+
+    def check_externally_locked(self):
+        """ Check whether some other process is holding the DPKG lock. """
+        elapsed = time.monotonic()-self.started_at
+        return elapsed < self.external_lock_seconds
+
+    def find_apt_lock_holder(self):
+        """ Say who, if anyone, is holding the DPKG lock. Our own fake APT
+        commands don't count, since they never hold it for long. """
+        if self.check_externally_locked():
+            return APT_LOCK_HOLDER
+        return None
+
+    def get_display_resolution(self):
+        """ Say how big the fake display is, if it has one. """
+        return self.display_resolution
+
+    def install_package(self, package_name):
+        """ Add a package to the DPKG status file, along with its command. """
+        if package_name.endswith(".deb"):
+            package_name = os.path.basename(package_name).split("_")[0]
+        stanza = (
+            "Package: "+package_name+"\n"+
+            "Status: install ok installed\n"+
+            "Version: 1.0\n\n"
+        )
+        with open(
+            self.get_path_to_dpkg_status(),
+            "a",
+            encoding=DEFAULT_ENCODING
+        ) as status_file:
+            status_file.write(stanza)
+        commands = (package_name,)+EXTRA_COMMANDS.get(package_name, ())
+        for command in commands:
+            path_to_command = os.path.join(self.get_bin_dir(), command)
+            with open(
+                path_to_command,
+                "w",
+                encoding=DEFAULT_ENCODING
+            ) as command_file:
+                command_file.write("#!/bin/sh\n")
+            os.chmod(path_to_command, 0o755)
+
+    def check_package_installed(self, package_name):
+        """ Check whether the fake DPKG knows about a given package. """
+        with open(
+            self.get_path_to_dpkg_status(),
+            "r",
+            encoding=DEFAULT_ENCODING
+        ) as status_file:
+            return ("Package: "+package_name+"\n") in status_file.read()
+
+    def run_apt_get(self, arguments, cwd):
+        """ Pretend to run APT. Downloading needs neither privileges nor the
+        DPKG lock. """
+        words = strip_options(arguments)
+        if words and (words[0] == "download"):
+            for package_name in words[1:]:
+                path_to_deb = \
+                    os.path.join(cwd or os.getcwd(), package_name+"_1.0.deb")
+                with open(path_to_deb, "wb"):
+                    pass
+            with self.state_lock:
+                self.download_count += len(words)-1
+            return "", 0
+        if ("--simulate" in arguments) and (words == ["upgrade"]):
+            # Like APT, the summary comes before a line or two per package.
+            summary = \
+                str(self.pending_upgrades)+ \
+                " upgraded, 0 newly installed, 0 to remove\n"
+            for index in range(self.pending_upgrades):
+                summary += \
+                    "Inst upgrade"+str(index)+" [1.0] (1.1 fake)\n"+ \
+                    "Conf upgrade"+str(index)+" (1.1 fake)\n"
+            return summary, 0
+        if self.check_externally_locked():
+            return APT_LOCK_ERROR, APT_LOCK_EXIT_CODE
+        with self.dpkg_lock:
+            if words and (words[0] == "install"):
+                if "--download-only" in arguments:
+                    return "", 0
+                for package_name in words[1:]:
+                    self.install_package(package_name)
+            if words and (words[0] == "upgrade"):
+                summary = \
+                    str(self.pending_upgrades)+ \
+                    " upgraded, 0 newly installed, 0 to remove\n"
+                with self.state_lock:
+                    self.pending_upgrades = 0
+                return summary, 0
+        return "", 0
+
+    def run_dpkg(self, arguments, _):
+        """ Pretend to run DPKG. """
+        if arguments and (arguments[0] == "--status"):
+            if self.check_package_installed(arguments[1]):
+                return "Status: install ok installed\n", 0
+            return "", 1
+        return "", 0
+
+    def run_git(self, arguments, cwd):
+        """ Pretend to run Git. """
+        if arguments and (arguments[0] == "clone"):
+            words = strip_options(arguments)
+            url = words[-2] if len(words) > 2 else words[-1]
+            if len(words) > 2:
+                destination = words[-1]
+            else:
+                destination = \
+                    os.path.basename(urllib.parse.urlparse(url).path)
+                destination = destination.removesuffix(".git")
+            destination = os.path.join(cwd or os.getcwd(), destination)
+            if os.path.exists(destination):
+                return "fatal: destination path already exists\n", 128
+            if "--mirror" in arguments:
+                os.makedirs(destination)
+            else:
+                os.makedirs(os.path.join(destination, ".git"))
+            return "", 0
+        if arguments and (arguments[0] in self.UPSTREAM_COMMANDS):
+            return self.run_git_against_upstream(arguments, cwd)
+        if arguments[:2] == ["config", "--global"]:
+            with self.state_lock:
+                self.git_config[arguments[2]] = arguments[3]
+                self.write_gitconfig()
+        return "", 0
+
+    def run_git_against_upstream(self, arguments, cwd):
+        """ Pretend to run one of those Git commands which compare a repo with
+        its upstream. What's happened upstream is set, per repo, in
+        upstreams, as a dictionary saying how many commits the repo is ahead
+        and behind, whether it's dirty, and which files the new commits
+        change. """
+        upstream = self.upstreams.get(os.path.basename(cwd), {})
+        if arguments[0] == "status":
+            if upstream.get("dirty"):
+                return " M README.md\n", 0
+            return "", 0
+        if arguments[0] == "rev-list":
+            ahead = upstream.get("ahead", 0)
+            behind = upstream.get("behind", 0)
+            return str(ahead)+"\t"+str(behind)+"\n", 0
+        if arguments[0] == "diff":
+            paths = arguments[arguments.index("--")+1:]
+            changed = [
+                path for path in upstream.get("changed", ()) if path in paths
+            ]
+            return "".join(path+"\n" for path in changed), 0
+        if arguments[0] == "merge":
+            if upstream.get("ahead"):
+                return "fatal: Not possible to fast-forward\n", 128
+            with self.state_lock:
+                upstream["behind"] = 0
+                upstream["changed"] = []
+        return "", 0
+
+    def write_gitconfig(self):
+        """ Write the fake Git configuration out, as Git would. """
+        sections = {}
+        for key, value in self.git_config.items():
+            section, name = key.rsplit(".", 1)
+            sections.setdefault(section, []).append(name+" = "+value)
+        with open(
+            self.get_path_to_gitconfig(),
+            "w",
+            encoding=DEFAULT_ENCODING
+        ) as config_file:
+            for section, lines in sections.items():
+                config_file.write("["+section+"]\n")
+                for line in lines:
+                    config_file.write("\t"+line+"\n")
+
+    def run_gsettings(self, arguments, _):
+        """ Pretend to run GSettings. """
+        if arguments and (arguments[0] == "set"):
+            with self.state_lock:
+                self.settings[tuple(arguments[1:3])] = arguments[3]
+        if arguments and (arguments[0] == "get"):
+            value = self.settings.get(tuple(arguments[1:3]), "")
+            return "'"+value+"'\n", 0
+        return "", 0
+
+    def get_desktop_settings(self, schema, keys):
+        """ Read some of the fake desktop's settings. """
+        with self.state_lock:
+            return {
+                key: self.settings.get((schema, key), "") for key in keys
+            }
+
+    def set_desktop_settings(self, schema, changes):
+        """ Change some of the fake desktop's settings. """
+        with self.state_lock:
+            for key, value in changes.items():
+                self.settings[(schema, key)] = value
+        return True
+
+    def run_pip(self, arguments, _):
+        """ Pretend to run PIP. """
+        if arguments and (arguments[0] == "install"):
+            for requirement in arguments[1:]:
+                if requirement.startswith("-"):
+                    continue
+                name = requirement
+                version = "99.0"
+                for operator_string in ("==", ">=", "<=", "!=", ">", "<"):
+                    if operator_string in requirement:
+                        name, version = requirement.split(operator_string, 1)
+                        break
+                with self.state_lock:
+                    self.distributions[name.lower()] = version
+        return "", 0
+
+    def run_pip3(self, arguments, cwd):
+        """ Pretend to run PIP for Python 3. """
+        return self.run_pip(arguments, cwd)
+
+    def run_python3(self, arguments, _):
+        """ Pretend to run Python 3, which can only make virtual environments.
+        A fake environment has a real interpreter, so that environments can be
+        derived from it, but a fake PIP. """
+        if arguments[:2] != ["-m", "venv"]:
+            return "", 0
+        path_to_venv = os.path.abspath(arguments[-1])
+        bin_dir = os.path.join(path_to_venv, "bin")
+        python_dirname = "python"+".".join(map(str, sys.version_info[:2]))
+        os.makedirs(
+            os.path.join(path_to_venv, "lib", python_dirname, "site-packages")
+        )
+        os.makedirs(bin_dir)
+        os.symlink(sys.executable, os.path.join(bin_dir, "python"))
+        path_to_pip = os.path.join(bin_dir, "pip")
+        with open(path_to_pip, "w", encoding=DEFAULT_ENCODING) as pip_file:
+            pip_file.write("#!"+os.path.join(bin_dir, "python")+"\n")
+        os.chmod(path_to_pip, 0o755)
+        with open(
+            os.path.join(path_to_venv, "pyvenv.cfg"),
+            "w",
+            encoding=DEFAULT_ENCODING
+        ) as cfg_file:
+            cfg_file.write("home = "+os.path.dirname(sys.executable)+"\n")
+        return "", 0
+
+    def get_installed_distributions(self, _, site_dirs=None):
+        """ Map the name of each distribution the fake PIP has installed,
+        wherever it was installed, to its version. """
+        del site_dirs
+        with self.state_lock:
+            return dict(self.distributions)
+
+    def fetch(self, url, path_to_cache, expected_sha256=None):
+        """ Pretend to download a file. The fake file has no meaningful hash,
+        so we don't check it. """
+        del expected_sha256
+        self.sleep_for("wget")
+        with self.state_lock:
+            self.download_count += 1
+        if self.check_fails("wget"):
+            return None
+        filename = os.path.basename(urllib.parse.urlparse(url).path)
+        path_to_file = os.path.join(path_to_cache, "objects", "fake", filename)
+        os.makedirs(os.path.dirname(path_to_file), exist_ok=True)
+        with open(path_to_file, "wb") as fake_file:
+            fake_file.write(b"fake")
+        return path_to_file
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def strip_options(arguments):
+    """ Remove the options, and any values they take, from a list of
+    arguments. """
+    result = []
+    skip_next = False
+    for word in arguments:
+        if skip_next:
+            skip_next = False
+        elif word in OPTIONS_WITH_VALUES:
+            skip_next = True
+        elif not word.startswith("-"):
+            result.append(word)
+    return result
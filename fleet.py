@@ -0,0 +1,260 @@
+"""
+This code defines a class which runs the installer on a whole fleet of
+computers at once, each with its own overrides of the installer's fields, via
+a transport which knows how to run commands on them, and then combines the
+report each computer sends back into one.
+"""
+
+# Standard imports.
+import json
+import os
+import shlex
+import subprocess
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# Local imports.
+from async_runner import AsyncCommandRunner
+from config import DEFAULT_ENCODING, DEFAULT_FLEET_JOBS
+
+# Local constants.
+FIELD_FLAGS = {
+    "this_os": "--os",
+    "thunderbird_num": "--thunderbird-num",
+    "target_dir": "--target-dir",
+    "jobs": "--jobs",
+    "clone_jobs": "--clone-jobs",
+    "command_timeout": "--command-timeout",
+    "path_to_local_apt_repo": "--local-apt-repo",
+    "path_to_repo_cache": "--repo-cache",
+    "path_to_venv_dir": "--venv-dir"
+}
+SWITCH_FLAGS = {
+    "minimal": "--min",
+    "resume": "--resume",
+    "update_repos": "--update-repos"
+}
+PATH_TO_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+##############
+# TRANSPORTS #
+##############
+
+@dataclass
+class SSHTransport:
+    """ Runs the installer on a remote computer over SSH. The remote user
+    needs to be able to sudo without a password, since nobody will be there
+    to type it in. """
+    # Fields.
+    remote_command: tuple = ("python3", "hmss")
+    ssh_options: tuple = ("-o", "BatchMode=yes")
+    runner: AsyncCommandRunner = \
+        field(default_factory=AsyncCommandRunner, repr=False)
+
+    def make_ssh_arguments(self, host, arguments):
+        """ Make the arguments with which to run a command on a given host. """
+        result = ["ssh"]+list(self.ssh_options)+[host, shlex.join(arguments)]
+        return result
+
+    def run(self, host, arguments, timeout=None):
+        """ Run a command on a given host, and return what happened. """
+        result = \
+            self.runner.run(
+                self.make_ssh_arguments(host, arguments),
+                timeout=timeout,
+                log_name="fleet "+host
+            )
+        return result
+
+    def make_path_to_report(self, host):
+        """ Make a path, on a given host, to which to write its report. """
+        del host
+        result = "/tmp/hmss-report-"+uuid.uuid4().hex+".json"
+        return result
+
+    def read_report(self, host, path_to_report):
+        """ Fetch, and then delete, the report a given host wrote. """
+        quoted = shlex.quote(path_to_report)
+        arguments = (
+            ["ssh"]+list(self.ssh_options)+
+            [host, "cat "+quoted+" && rm -f "+quoted]
+        )
+        process = \
+            subprocess.run(
+                arguments,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                check=False
+            )
+        if process.returncode != 0:
+            return None
+        return json.loads(process.stdout.decode(DEFAULT_ENCODING))
+
+@dataclass
+class LocalTransport:
+    """ Runs the installer, or something which stands in for it, on this
+    computer, pretending that it's the host in question. This is for testing
+    the fleet, and for provisioning the computer we're sitting at. """
+    # Fields.
+    remote_command: tuple = (sys.executable, PATH_TO_PACKAGE)
+    path_to_report_dir: str = None
+    runner: AsyncCommandRunner = \
+        field(default_factory=AsyncCommandRunner, repr=False)
+
+    def run(self, host, arguments, timeout=None):
+        """ Run a command here, on behalf of a given host. """
+        result = \
+            self.runner.run(
+                arguments,
+                timeout=timeout,
+                log_name="fleet "+host
+            )
+        return result
+
+    def make_path_to_report(self, host):
+        """ Make a path to which to write a given host's report. """
+        report_dir = self.path_to_report_dir or "/tmp"
+        result = \
+            os.path.join(
+                report_dir,
+                "hmss-report-"+host+"-"+uuid.uuid4().hex+".json"
+            )
+        return result
+
+    def read_report(self, host, path_to_report):
+        """ Read, and then delete, the report a given host wrote. """
+        del host
+        try:
+            with open(
+                path_to_report,
+                "r",
+                encoding=DEFAULT_ENCODING
+            ) as report_file:
+                result = json.load(report_file)
+        except (OSError, ValueError):
+            return None
+        os.remove(path_to_report)
+        return result
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class Fleet:
+    """ The class in question. """
+    # Fields.
+    hosts: list
+    transport: object = field(default_factory=SSHTransport)
+    max_hosts: int = DEFAULT_FLEET_JOBS
+    timeout: int = None
+    reports: dict = field(default_factory=dict)
+    history: object = None
+
+    def make_arguments(self, host, path_to_report):
+        """ Make the command which runs the installer on a given host, with
+        that host's overrides. """
+        result = list(self.transport.remote_command)
+        for field_name, flag in FIELD_FLAGS.items():
+            if host.get(field_name) is not None:
+                result = result+[flag, str(host[field_name])]
+        for field_name, flag in SWITCH_FLAGS.items():
+            if host.get(field_name):
+                result.append(flag)
+        result = result+["--report", path_to_report]
+        return result
+
+    def provision_host(self, host):
+        """ Run the installer on a given host, and return its report. If it
+        didn't send one back, make one up from what we saw. """
+        name = host["host"]
+        path_to_report = self.transport.make_path_to_report(name)
+        print("Provisioning "+name+"...")
+        command_result = \
+            self.transport.run(
+                name,
+                self.make_arguments(host, path_to_report),
+                timeout=self.timeout
+            )
+        result = self.transport.read_report(name, path_to_report)
+        if result is None:
+            result = {
+                "passed": False,
+                "with_flying_colours": False,
+                "failure_log": ["Run HMSS on "+name],
+                "failure_output": { "Run HMSS on "+name: command_result.tail }
+            }
+        result["return_code"] = command_result.return_code
+        print("Finished "+name+".")
+        return result
+
+    def run(self):
+        """ Provision every host, as many at once as we're allowed, and
+        return True if they all passed. """
+        with ThreadPoolExecutor(max_workers=max(self.max_hosts, 1)) as pool:
+            futures = {
+                host["host"]: pool.submit(self.provision_host, host)
+                for host in self.hosts
+            }
+        for name, future in futures.items():
+            self.reports[name] = future.result()
+        if self.history:
+            self.record_history()
+        result = all(report["passed"] for report in self.reports.values())
+        return result
+
+    def record_history(self):
+        """ Add how long each host's steps took to the history, so that we
+        can see which steps are getting slower across the fleet. """
+        for name, report in self.reports.items():
+            for imperative, step_time in report.get("step_times", {}).items():
+                self.history.record(
+                    imperative,
+                    step_time["duration"],
+                    step_time["passed"],
+                    this_os=report.get("this_os"),
+                    host=name
+                )
+        self.history.close()
+
+    def print_report(self):
+        """ Print how each host got on, and what failed where. """
+        passed = [
+            name for name, report in self.reports.items() if report["passed"]
+        ]
+        print(
+            "\n"+str(len(passed))+" of "+str(len(self.reports))+
+            " hosts PASSED.\n"
+        )
+        for name, report in self.reports.items():
+            if not report["passed"]:
+                verdict = "FAILED"
+            elif report.get("with_flying_colours"):
+                verdict = "PASSED"
+            else:
+                verdict = "PASSED with non-essential failures"
+            print(name+": "+verdict)
+            for item in report.get("failure_log", []):
+                print("    * "+item)
+        print(" ")
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def load_inventory(path_to_inventory):
+    """ Load a JSON inventory of hosts. This is a list of dictionaries, each
+    of which gives the name of a host, as SSH knows it, under "host", along
+    with any fields of the installer to override on that host. """
+    with open(
+        path_to_inventory,
+        "r",
+        encoding=DEFAULT_ENCODING
+    ) as inventory_file:
+        result = json.load(inventory_file)
+    for host in result:
+        if "host" not in host:
+            raise ValueError("Every host in the inventory needs a \"host\"")
+    return result
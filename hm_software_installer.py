@@ -4,22 +4,90 @@ required on this computer.
 """
 
 # Standard imports.
+import fcntl
 import os
 import pathlib
-import shutil
+import re
+import socket
+import string
 import subprocess
+import threading
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from typing import ClassVar
 
 # Local imports.
 from config import (
+    DEFAULT_APT_LOCK_POLL_INTERVAL,
+    DEFAULT_APT_LOCK_TIMEOUT,
+    DEFAULT_APT_MAX_AGE,
+    DEFAULT_CLONE_JOBS,
+    DEFAULT_ENCODING,
+    DEFAULT_JOBS,
+    DEFAULT_PATH_TO_APT_ARCHIVES,
+    DEFAULT_PATH_TO_APT_LISTS,
+    DEFAULT_PATH_TO_APT_PERIODIC_STAMP,
+    DEFAULT_PATH_TO_APT_SOURCES_DIR,
+    DEFAULT_PATH_TO_APT_SOURCES_LIST,
+    DEFAULT_PATH_TO_APT_UPDATE_STAMP,
+    DEFAULT_PATH_TO_DCONF_DB,
+    DEFAULT_PATH_TO_DOWNLOAD_CACHE,
+    DEFAULT_PATH_TO_DPKG_STATUS,
     DEFAULT_PATH_TO_GIT_CREDENTIALS,
+    DEFAULT_PATH_TO_GITCONFIG,
+    DEFAULT_PATH_TO_HISTORY,
+    DEFAULT_PATH_TO_JOURNAL,
+    DEFAULT_PATH_TO_LOCAL_APT_INDEX,
+    DEFAULT_PATH_TO_OS_RELEASE,
     DEFAULT_PATH_TO_PAT,
+    DEFAULT_PATH_TO_PCMANFM_CONFIG,
+    DEFAULT_PATH_TO_PREFETCH_DIR,
+    DEFAULT_PATH_TO_REPO_CACHE,
+    DEFAULT_PATH_TO_VENV_DIR,
     DEFAULT_GIT_USERNAME,
     DEFAULT_EMAIL_ADDRESS
 )
-from git_credentials import set_up_git_credentials
+from apt_catalogue import (
+    check_apt_lists_fresh,
+    load_apt_catalogue,
+    parse_depends
+)
+from config_files import apply_text, parse_ini, read_text, update_ini
+from deb_cache import (
+    build_packages_index,
+    export_debs,
+    make_sources_line,
+    read_deb_control
+)
+from downloader import Downloader, write_json_atomically
+from git_credentials import make_credential_changes, set_up_git_credentials
+from install_plan import (
+    InstallPlan,
+    find_apt_upgrades,
+    list_archived_debs,
+    measure_apt_downloads,
+    resolve_apt_packages
+)
+from package_index import build_package_index, parse_stanza
+from prefetch import Prefetcher
+from local_system import LocalSystem
+from pip_requirements import (
+    check_requirement_satisfied,
+    make_requirement_string
+)
+from step_history import StepHistory, format_duration
+from step_journal import load_journal, make_fingerprint
+from step_scheduler import StepScheduler
+from tracing import Tracer, get_current_step, run_in_current_context
+from venvs import (
+    check_venv_present,
+    derive_venv,
+    find_site_packages,
+    make_venv_arguments
+)
+from wallpaper_assets import choose_variant, find_source, load_manifest
 
 # Local constants.
 DEFAULT_OS = "ubuntu"
@@ -40,25 +108,133 @@ class HMSoftwareInstaller:
     target_dir: str = DEFAULT_TARGET_DIR
     thunderbird_num: int = None
     path_to_git_credentials: str = DEFAULT_PATH_TO_GIT_CREDENTIALS
+    path_to_gitconfig: str = DEFAULT_PATH_TO_GITCONFIG
+    path_to_dconf_db: str = DEFAULT_PATH_TO_DCONF_DB
+    path_to_pcmanfm_config: str = DEFAULT_PATH_TO_PCMANFM_CONFIG
     path_to_pat: str = DEFAULT_PATH_TO_PAT
     git_username: str = DEFAULT_GIT_USERNAME
     email_address: str = DEFAULT_EMAIL_ADDRESS
     path_to_wallpaper_dir: str = DEFAULT_PATH_TO_WALLPAPER_DIR
+    path_to_download_cache: str = DEFAULT_PATH_TO_DOWNLOAD_CACHE
+    path_to_deb_export: str = None
+    path_to_local_apt_repo: str = None
+    path_to_local_apt_index: str = DEFAULT_PATH_TO_LOCAL_APT_INDEX
+    path_to_repo_cache: str = DEFAULT_PATH_TO_REPO_CACHE
+    path_to_venv_dir: str = DEFAULT_PATH_TO_VENV_DIR
     python_version: int = DEFAULT_PYTHON_VERSION
     pip_version: int = DEFAULT_PYTHON_VERSION
     test_run: bool = False
     show_output: bool = False
     minimal: bool = True
+    jobs: int = DEFAULT_JOBS
+    clone_jobs: int = DEFAULT_CLONE_JOBS
     failure_log: list = field(default_factory=list)
+    failure_output: dict = field(default_factory=dict)
+    apt_installed: set = field(default_factory=set)
+    apt_failures: set = field(default_factory=set)
+    path_to_dpkg_status: str = DEFAULT_PATH_TO_DPKG_STATUS
+    path_to_apt_lists: str = DEFAULT_PATH_TO_APT_LISTS
+    path_to_apt_sources_list: str = DEFAULT_PATH_TO_APT_SOURCES_LIST
+    path_to_apt_sources_dir: str = DEFAULT_PATH_TO_APT_SOURCES_DIR
+    path_to_apt_periodic_stamp: str = DEFAULT_PATH_TO_APT_PERIODIC_STAMP
+    path_to_apt_update_stamp: str = DEFAULT_PATH_TO_APT_UPDATE_STAMP
+    apt_max_age: int = DEFAULT_APT_MAX_AGE
+    apt_lists_refreshed: bool = False
+    apt_lists_ready: threading.Event = \
+        field(default_factory=threading.Event, repr=False)
+    apt_catalogue: object = None
+    prefetch: bool = True
+    path_to_prefetch_dir: str = DEFAULT_PATH_TO_PREFETCH_DIR
+    prefetcher: object = None
+    package_index: object = None
+    index_lock: threading.Lock = \
+        field(default_factory=threading.Lock, repr=False)
+    resume: bool = False
+    path_to_journal: str = DEFAULT_PATH_TO_JOURNAL
+    journal: object = None
+    os_release: str = None
+    path_to_history: str = DEFAULT_PATH_TO_HISTORY
+    history: object = None
+    history_lock: threading.Lock = \
+        field(default_factory=threading.Lock, repr=False)
+    host: str = field(default_factory=socket.gethostname)
+    started_at: float = None
+    path_to_trace: str = None
+    path_to_report: str = None
+    report: dict = field(default_factory=dict)
+    tracer: Tracer = field(default_factory=Tracer, repr=False)
+    system: object = field(default_factory=LocalSystem, repr=False)
+    search_path: str = None
+    command_timeout: int = None
+    update_repos: bool = False
+    apt_lock_timeout: int = DEFAULT_APT_LOCK_TIMEOUT
+    apt_lock_poll_interval: float = DEFAULT_APT_LOCK_POLL_INTERVAL
 
     # Class attributes.
+    APT_LOCK_ERRORS: ClassVar[tuple] = (
+        "Could not get lock",
+        "Unable to acquire the dpkg frontend lock",
+        "Unable to lock the administration directory"
+    )
+    APT_LOCK_REPORT_INTERVAL: ClassVar[int] = 10
+    BACKGROUND_SCHEMA: ClassVar[str] = "org.gnome.desktop.background"
+    BASE_VENV_NAME: ClassVar[str] = "base"
     CHROME_DEB: ClassVar[str] = "google-chrome-stable_current_amd64.deb"
     CHROME_STEM: ClassVar[str] = "https://dl.google.com/linux/direct/"
     EXPECTED_PATH_TO_GOOGLE_CHROME_COMMAND: ClassVar[str] = \
         "/usr/bin/google-chrome"
     GIT_URL_STEM: ClassVar[str] = "https://github.com/"
+    LOCAL_APT_SOURCES: ClassVar[str] = "hmss-local.list"
     MISSING_FROM_CHROME: ClassVar[tuple] = ("eog", "nautilus")
     OTHER_THIRD_PARTY: ClassVar[tuple] = ("gedit-plugins", "inkscape")
+    PCMANFM_SECTION: ClassVar[str] = "*"
+    OWN_REPOS: ClassVar[tuple] = (
+        {
+            "name": "hmss",
+            "imperative": "Install HMSS",
+            # Only check out this computer's own wallpaper, and only fetch
+            # the contents of the files we check out.
+            "clone_options": {
+                "filter": "blob:none",
+                "sparse_paths": (
+                    "/*",
+                    "!/wallpaper/",
+                    "/wallpaper/manifest.json",
+                    "/wallpaper/{wallpaper}.*",
+                    "/wallpaper/{wallpaper}_*",
+                    "/wallpaper/thunderbird_infographics/t{thunderbird_num}.*"
+                )
+            }
+        },
+        {
+            "name": "kingdom-of-cyprus",
+            "imperative": "Install Kingdom of Cyprus",
+            "underpinning_packages": ("nodejs", "npm")
+        },
+        { "name": "chancery", "imperative": "Install Chancery" },
+        {
+            "name": "chancery-b",
+            "imperative": "Install Chancery-B",
+            "installation_arguments": ("sh", "install_3rd_party")
+        },
+        {
+            "name": "hgmj",
+            "imperative": "Install HGMJ",
+            "installation_arguments": ("sh", "install_3rd_party")
+        }
+    )
+    REPO_UPDATE_FAILURES: ClassVar[tuple] = (
+        "dirty",
+        "diverged",
+        "fetch failed",
+        "merge failed",
+        "no upstream",
+        "reinstall failed",
+        "status failed"
+    )
+    REQUIREMENTS_FILENAME: ClassVar[str] = "requirements.txt"
+    SQLITE_PACKAGES: ClassVar[tuple] = ("sqlite", "sqlitebrowser")
+    TAIL_LENGTH: ClassVar[int] = 10
     SUPPORTED_OSS: ClassVar[set] = {
         "ubuntu", "chrome-os", "raspian", "linux-based"
     }
@@ -71,26 +247,86 @@ class HMSoftwareInstaller:
     )
 
     def make_essentials(self):
-        """ Build a tuple of essential processes to run. """
+        """ Build a tuple of essential processes to run. Each process
+        declares the other processes on which it depends, and the resources
+        which it uses, so that the scheduler knows what can run at once. It
+        may also declare its inputs, and a method which verifies that its work
+        is still in place, for the benefit of the journal, along with the
+        paths at which its work shows up, for the benefit of the agent. """
         result = (
             {
                 "imperative": "Check OS",
                 "gerund": "Checking OS",
-                "method": self.check_os
+                "method": self.check_os,
+                "depends_on": (),
+                "resources": (),
+                "verify": self.check_os
+            }, {
+                "imperative": "Start prefetching",
+                "gerund": "Starting prefetching",
+                "method": self.start_prefetching,
+                "depends_on": ("Check OS", "Add local APT repo"),
+                "resources": (),
+                "verify": self.check_prefetching
             }, {
                 "imperative": "Update and upgrade",
                 "gerund": "Updating and upgrading",
-                "method": self.update_and_upgrade
+                "method": self.update_and_upgrade,
+                "depends_on": ("Start prefetching",),
+                "resources": ("apt", "network"),
+                "apt_packages": ("software-properties-common",)
+            }, {
+                "imperative": "Install APT packages",
+                "gerund": "Installing APT packages",
+                "method": self.install_apt_batch,
+                "depends_on": ("Update and upgrade",),
+                "resources": ("apt", "network"),
+                "verify": self.check_apt_batch_present,
+                "watches": (self.path_to_dpkg_status,)
             }, {
                 "imperative": "Upgrade Python",
                 "gerund": "Upgrading Python",
-                "method": self.upgrade_python
+                "method": self.upgrade_python,
+                "depends_on": ("Install APT packages",),
+                "resources": ("apt", "network"),
+                "apt_packages": self.make_python_packages(),
+                "inputs": {
+                    "pip_packages": self.PIP_PACKAGES,
+                    "venv_dir": self.path_to_venv_dir
+                },
+                "verify": self.check_pip_packages_present,
+                "watches": (self.path_to_dpkg_status,)
             }, {
                 "imperative": "Set up Git",
                 "gerund": "Setting up Git",
-                "method": self.set_up_git
+                "method": self.set_up_git,
+                "depends_on": ("Install APT packages",),
+                "resources": ("apt",),
+                "apt_packages": ("git",),
+                "inputs": {
+                    "username": self.git_username,
+                    "email_address": self.email_address,
+                    "path_to_git_credentials": self.path_to_git_credentials
+                },
+                "verify": self.check_git_credentials_present,
+                "watches": (
+                    self.path_to_dpkg_status,
+                    self.path_to_git_credentials,
+                    self.path_to_gitconfig
+                )
             }
         )
+        if self.path_to_local_apt_repo:
+            local_apt_repo_step = {
+                "imperative": "Add local APT repo",
+                "gerund": "Adding local APT repo",
+                "method": self.add_local_apt_repo,
+                "depends_on": ("Check OS",),
+                "resources": ("apt",),
+                "inputs": { "repo": self.path_to_local_apt_repo },
+                "verify": self.check_local_apt_repo_present
+            }
+            result = result[:1]+(local_apt_repo_step,)+result[1:]
         return result
 
     def make_non_essentials(self):
@@ -99,31 +335,49 @@ class HMSoftwareInstaller:
             {
                 "imperative": "Install Google Chrome",
                 "gerund": "Installing Google Chrome",
-                "method": self.install_google_chrome
-            }, {
-                "imperative": "Install HMSS",
-                "gerund": "Installing HMSS",
-                "method": self.install_hmss
-            }, {
-                "imperative": "Install Kingdom of Cyprus",
-                "gerund": "Installing Kingdom of Cyprus",
-                "method": self.install_kingdom_of_cyprus
-            }, {
-                "imperative": "Install Chancery repos",
-                "gerund": "Installing Chancery repos",
-                "method": self.install_chancery
+                "method": self.install_google_chrome,
+                "depends_on": (),
+                "resources": ("apt", "network"),
+                "inputs": { "url": self.CHROME_STEM+self.CHROME_DEB },
+                "verify": self.check_google_chrome_present,
+                "watches": (self.path_to_dpkg_status,)
             }, {
-                "imperative": "Install HGMJ",
-                "gerund": "Installing HGMJ",
-                "method": self.install_hgmj
+                "imperative": "Install own repos",
+                "gerund": "Installing own repos",
+                "method": self.install_own_repos,
+                # The repos' underpinnings come in with the APT batch, which,
+                # when it runs alongside, we wait for.
+                "depends_on": ("Install APT packages",),
+                "resources": ("network",),
+                "apt_packages": self.make_own_repo_underpinnings(),
+                "inputs": {
+                    "repos": [
+                        self.make_git_url(repo["name"])
+                        for repo in self.OWN_REPOS
+                    ],
+                    "target_dir": self.target_dir
+                },
+                "verify": self.check_own_repos_present,
+                "watches": tuple(
+                    self.get_repo_path(repo["name"])
+                    for repo in self.OWN_REPOS
+                )
             }, {
                 "imperative": "Install SQLite",
                 "gerund": "Installing SQLite",
-                "method": self.install_sqlite
+                "method": self.install_sqlite,
+                "depends_on": (),
+                "resources": ("apt", "network"),
+                "apt_packages": self.SQLITE_PACKAGES,
+                "watches": (self.path_to_dpkg_status,)
             }, {
                 "imperative": "Install other third party",
                 "gerund": "Installing other third party",
-                "method": self.install_other_third_party
+                "method": self.install_other_third_party,
+                "depends_on": (),
+                "resources": ("apt", "network"),
+                "apt_packages": self.make_other_third_party_packages(),
+                "watches": (self.path_to_dpkg_status,)
             }
         )
         return result
@@ -138,67 +392,190 @@ class HMSoftwareInstaller:
         """ Change into the directory where we want to install stuff. """
         os.chdir(self.target_dir)
 
+    def check_git_credentials_present(self):
+        """ Check whether the Git credentials file is in place. """
+        return os.path.exists(self.path_to_git_credentials)
+
     def set_up_git(self):
         """ Install Git and set up a personal access token. """
         install_result = self.install_via_apt("git")
         if not install_result:
             return False
-        pat_result = \
-            set_up_git_credentials(
-                username=self.git_username,
-                email_address=self.email_address,
-                path_to_git_credentials=self.path_to_git_credentials,
-                path_to_pat=self.path_to_pat
-            )
+        with self.tracer.span("set_up_git_credentials", "function") as args:
+            pat_result = \
+                set_up_git_credentials(
+                    username=self.git_username,
+                    email_address=self.email_address,
+                    path_to_git_credentials=self.path_to_git_credentials,
+                    path_to_pat=self.path_to_pat,
+                    path_to_gitconfig=self.path_to_gitconfig
+                )
+            args["result"] = pat_result
         if not pat_result:
             return False
         return True
 
+    def get_pip_package_name(self):
+        """ Get the name of the APT package which provides PIP. """
+        result = "python"+str(self.python_version)+"-pip"
+        return result
+
+    def get_venv_package_name(self):
+        """ Get the name of the APT package which provides virtual
+        environments. """
+        result = "python"+str(self.python_version)+"-venv"
+        return result
+
+    def make_python_packages(self):
+        """ Build a tuple of the APT packages which upgrading Python
+        installs. """
+        result = (self.get_pip_package_name(),)
+        if self.path_to_venv_dir:
+            result = result+(self.get_venv_package_name(),)
+        return result
+
+    def get_venv_path(self, name):
+        """ Get the path to a given virtual environment. """
+        result = os.path.join(self.path_to_venv_dir, name)
+        return result
+
+    def get_base_venv_path(self):
+        """ Get the path to the base virtual environment, into which the
+        common PIP packages are installed, and from which each of our own
+        repos' environments is derived. """
+        return self.get_venv_path(self.BASE_VENV_NAME)
+
+    def make_base_venv(self):
+        """ Make the base virtual environment, if we haven't already. """
+        path_to_base = self.get_base_venv_path()
+        if check_venv_present(path_to_base):
+            return True
+        os.makedirs(self.path_to_venv_dir, exist_ok=True)
+        arguments = [
+            "python"+str(self.python_version), "-m", "venv", path_to_base
+        ]
+        result = self.run_with_indulgence(arguments)
+        return result
+
+    def get_pip_command(self):
+        """ Get the command which runs the PIP into which we install the
+        common PIP packages. """
+        if self.path_to_venv_dir:
+            return os.path.join(self.get_base_venv_path(), "bin", "pip")
+        return "pip"+str(self.pip_version)
+
     def upgrade_python(self):
-        """ Install PIP and other useful Python hangers-on. """
-        pip_package_name = "python"+str(self.python_version)+"-pip"
+        """ Install PIP and other useful Python hangers-on, in the base
+        virtual environment, if we're using one. """
         result = True
-        if not self.install_via_apt(pip_package_name):
-            result = False
+        for package_name in self.make_python_packages():
+            if not self.install_via_apt(package_name):
+                result = False
+        if self.path_to_venv_dir and not self.make_base_venv():
+            return False
         if not self.install_pip_packages():
             result = False
         return result
 
+    def get_installed_pip_distributions(self):
+        """ Map the normalised name of each distribution installed for the
+        PIP we install into to its version, or return None if we can't tell.
+        The base virtual environment's distributions are read straight off
+        the disk, and, if it hasn't been made yet, it has none. """
+        if not self.path_to_venv_dir:
+            return self.system.get_installed_distributions(self.pip_version)
+        site_packages = find_site_packages(self.get_base_venv_path())
+        if not site_packages:
+            return {}
+        result = \
+            self.system.get_installed_distributions(
+                self.pip_version,
+                site_dirs=[site_packages]
+            )
+        return result
+
+    def make_missing_pip_packages(self):
+        """ Build a list of those PIP packages specified in the class attribute
+        above which aren't already installed at a suitable version. We can only
+        check this in-process if we're running under the same Python as the
+        PIP in question, or if it's in a virtual environment; otherwise, we
+        take it that they're all missing. """
+        installed = self.get_installed_pip_distributions()
+        if installed is None:
+            return [
+                make_requirement_string(package)
+                for package in self.PIP_PACKAGES
+            ]
+        result = [
+            make_requirement_string(package)
+            for package in self.PIP_PACKAGES
+            if not check_requirement_satisfied(package, installed)
+        ]
+        return result
+
+    def check_pip_packages_present(self):
+        """ Check whether all the PIP packages we want are installed. """
+        if self.make_missing_pip_packages():
+            return False
+        return True
+
     def install_pip_packages(self):
-        """ Install the various PIP packages specified in the class
-        attribute above. """
-        pip_command = "pip"+str(self.pip_version)
-        result = True
-        for package in self.PIP_PACKAGES:
-            id_string = package["name"]
-            if package["operator"] and package["version"]:
-                id_string = id_string+package["operator"]+package["version"]
-            command_to_run = [pip_command, "install", id_string]
-            if not self.run_with_indulgence(command_to_run):
-                result = False
+        """ Install, in one go, those of the various PIP packages specified in
+        the class attribute above which we don't already have. """
+        missing = self.make_missing_pip_packages()
+        if not missing:
+            return True
+        pip_command = self.get_pip_command()
+        if self.wait_for_prefetch("pip"):
+            arguments = [
+                pip_command, "install", "--no-index", "--find-links",
+                self.prefetcher.get_pip_dir()
+            ]
+            if self.run_command(arguments+missing).return_code == 0:
+                return True
+            # Something's missing from what we prefetched, so go online.
+        result = self.run_with_indulgence([pip_command, "install"]+missing)
         return result
 
-    def install_google_chrome(self):
-        """ Ronseal. """
+    def check_google_chrome_present(self):
+        """ Check whether we have, or need not have, Google Chrome. """
         if (
-            check_command_exists("google-chrome") or
+            self.get_package_index().check_command_exists("google-chrome") or
             (self.this_os == "chrome-os")
         ):
             return True
+        return False
+
+    def install_google_chrome(self):
+        """ Ronseal. """
+        if self.check_google_chrome_present():
+            return True
         chrome_url = urllib.parse.urljoin(self.CHROME_STEM, self.CHROME_DEB)
-        chrome_deb_path = "./"+self.CHROME_DEB
-        download_process = subprocess.run(["wget", chrome_url])
-        if download_process.returncode != 0:
+        self.wait_for_prefetch("chrome")
+        chrome_deb_path = self.download(chrome_url)
+        if not chrome_deb_path:
             return False
         if not self.install_via_apt(chrome_deb_path):
             return False
-        os.remove(chrome_deb_path)
         return True
 
-    def change_wallpaper(self):
-        """ Change the wallpaper on the desktop of this computer. """
-        if not os.path.exists(self.path_to_wallpaper_dir):
-            return False
+    def download(self, url, expected_sha256=None):
+        """ Get a local copy of a file, via the download cache, and return its
+        path, or None if that didn't work. """
+        if self.test_run:
+            downloader = Downloader(path_to_cache=self.path_to_download_cache)
+            return downloader.get_object_path("test-run", url)
+        result = \
+            self.system.fetch(
+                url,
+                self.path_to_download_cache,
+                expected_sha256=expected_sha256
+            )
+        return result
+
+    def get_source_wallpaper_path(self):
+        """ Get the path to the full-size wallpaper we want on this computer,
+        going by its filename alone. """
         if self.thunderbird_num:
             wallpaper_filename = (
                 self.WALLPAPER_STEM+
@@ -207,21 +584,170 @@ class HMSoftwareInstaller:
             )
         else:
             wallpaper_filename = "default.jpg"
-        wallpaper_path = \
-            os.path.join(self.path_to_wallpaper_dir, wallpaper_filename)
-        if self.this_os == "ubuntu":
-            arguments = [
-                "gsettings",
-                "set",
-                "org.gnome.desktop.background",
-                "picture-uri",
-                "file:///"+wallpaper_path
+        result = os.path.join(self.path_to_wallpaper_dir, wallpaper_filename)
+        return result
+
+    def locate_wallpaper_image(self, image):
+        """ Find a given image from the manifest, returning its local path,
+        if we have it, or else its manifest entry, if it can be fetched, or
+        else None. """
+        path_to_image = \
+            os.path.join(self.path_to_wallpaper_dir, image["filename"])
+        if os.path.exists(path_to_image):
+            return path_to_image, None
+        if image.get("url"):
+            return None, image
+        return None
+
+    def choose_wallpaper(self):
+        """ Choose the variant of our wallpaper which best fits this
+        computer's display. Variants are hosted rather than shipped, so we
+        only consider those we have, or can fetch. If no variant fits, fall
+        back on the source image. Return the path to the wallpaper, or, if
+        it has to be fetched first, None along with its manifest entry. """
+        manifest = load_manifest(self.path_to_wallpaper_dir)
+        if manifest is None:
+            return self.get_source_wallpaper_path(), None
+        source = find_source(manifest, self.thunderbird_num)
+        if source is None:
+            return self.get_source_wallpaper_path(), None
+        obtainable = dict(
+            manifest,
+            variants=[
+                variant for variant in manifest["variants"]
+                if self.locate_wallpaper_image(variant)
             ]
+        )
+        variant = \
+            choose_variant(
+                obtainable,
+                source,
+                self.system.get_display_resolution()
+            )
+        # Failing that, better a variant which is too small than no
+        # wallpaper at all.
+        for image in (variant, source, choose_variant(obtainable, source)):
+            location = image and self.locate_wallpaper_image(image)
+            if location:
+                return location
+        path_to_source = \
+            os.path.join(self.path_to_wallpaper_dir, source["filename"])
+        return path_to_source, None
+
+    def get_wallpaper_path(self):
+        """ Get the path to the wallpaper we want on this computer, fetching
+        it if need be. """
+        result, image = self.choose_wallpaper()
+        if image:
+            result = \
+                self.download(image["url"], expected_sha256=image["sha256"])
+        return result
+
+    def make_wanted_wallpaper_settings(self, wallpaper_path):
+        """ Map each desktop setting which shows a given wallpaper to the
+        value it should have, or return None if we don't know how to set the
+        wallpaper on this desktop. """
+        if self.this_os == "ubuntu":
+            uri = "file:///"+wallpaper_path
+            return { "picture-uri": uri, "picture-uri-dark": uri }
+        if self.this_os == "raspbian":
+            return { "wallpaper": wallpaper_path }
+        return None
+
+    def read_wallpaper_settings(self):
+        """ Read, in one go, the current values of the desktop settings which
+        show the wallpaper, or return None if we can't. """
+        if self.this_os == "ubuntu":
+            result = \
+                self.system.get_desktop_settings(
+                    self.BACKGROUND_SCHEMA,
+                    ("picture-uri", "picture-uri-dark")
+                )
+            return result
+        if self.this_os == "raspbian":
+            text = read_text(self.path_to_pcmanfm_config)
+            return parse_ini(text).get(self.PCMANFM_SECTION, {})
+        return None
+
+    def make_wallpaper_changes(self, wallpaper_path):
+        """ Work out which desktop settings would have to change to show a
+        given wallpaper, or return None if we can't tell. """
+        wanted = self.make_wanted_wallpaper_settings(wallpaper_path)
+        current = self.read_wallpaper_settings()
+        if (wanted is None) or (current is None):
+            return None
+        result = {}
+        for key, value in wanted.items():
+            if current.get(key) == value:
+                continue
+            # Older versions of GNOME haven't got a dark wallpaper.
+            if (key == "picture-uri-dark") and (key not in current):
+                continue
+            result[key] = value
+        return result
+
+    def check_wallpaper_current(self, wallpaper_path):
+        """ Check whether the desktop already shows the wallpaper we want. """
+        if self.make_wallpaper_changes(wallpaper_path) == {}:
+            return True
+        return False
+
+    def check_wallpaper_set(self):
+        """ Check whether the desktop shows the wallpaper we want, without
+        fetching anything. """
+        wallpaper_path, image = self.choose_wallpaper()
+        if image or not wallpaper_path:
+            return False
+        return self.check_wallpaper_current(wallpaper_path)
+
+    def make_wallpaper_step(self):
+        """ Build a process which changes the wallpaper. A normal run changes
+        it after everything else, and doesn't mind if that fails, but the
+        agent repairs it like any other process. """
+        result = {
+            "imperative": "Change wallpaper",
+            "gerund": "Changing wallpaper",
+            "method": self.change_wallpaper,
+            "depends_on": (),
+            "resources": (),
+            "verify": self.check_wallpaper_set,
+            "watches": ()
+        }
+        if self.this_os == "ubuntu":
+            result["watches"] = (self.path_to_dconf_db,)
         elif self.this_os == "raspbian":
-            arguments = ["pcmanfm", "--set-wallpaper", wallpaper_path]
-        else:
+            result["watches"] = (self.path_to_pcmanfm_config,)
+        return result
+
+    def change_wallpaper(self):
+        """ Change the wallpaper on the desktop of this computer, changing only
+        those settings which need it, and nothing at all if it's already
+        showing. """
+        if not os.path.exists(self.path_to_wallpaper_dir):
             return False
-        result = self.run_with_indulgence(arguments)
+        wallpaper_path = self.get_wallpaper_path()
+        if not wallpaper_path:
+            return False
+        changes = self.make_wallpaper_changes(wallpaper_path)
+        if changes is None:
+            return False
+        if (not changes) or self.test_run:
+            return True
+        if self.this_os == "ubuntu":
+            result = \
+                self.system.set_desktop_settings(
+                    self.BACKGROUND_SCHEMA,
+                    changes
+                )
+            return result
+        text = read_text(self.path_to_pcmanfm_config)
+        apply_text(
+            self.path_to_pcmanfm_config,
+            text,
+            update_ini(text, self.PCMANFM_SECTION, changes)
+        )
+        # Ask PCManFM to show what we've written.
+        result = self.run_with_indulgence(["pcmanfm", "--reconfigure"])
         return result
 
     def make_git_url(self, repo_name):
@@ -230,75 +756,349 @@ class HMSoftwareInstaller:
         result = urllib.parse.urljoin(self.GIT_URL_STEM, suffix)
         return result
 
+    def get_repo_path(self, repo_name):
+        """ Get the path to where a given repo lives, or will live. """
+        result = os.path.join(self.target_dir, repo_name)
+        return result
+
+    def get_mirror_path(self, repo_name):
+        """ Get the path to the bare mirror of a given repo in the cache. """
+        result = os.path.join(self.path_to_repo_cache, repo_name+".git")
+        return result
+
+    def refresh_mirror(self, repo_name):
+        """ Bring the cached mirror of a given repo up to date, making it if
+        need be, and return its path, or None if we have no usable mirror.
+        The cache may be shared between computers, so we lock each mirror
+        while we fetch into it. """
+        if not self.path_to_repo_cache:
+            return None
+        mirror_path = self.get_mirror_path(repo_name)
+        if self.test_run:
+            return mirror_path
+        os.makedirs(self.path_to_repo_cache, exist_ok=True)
+        with open(
+            mirror_path+".lock",
+            "a",
+            encoding=DEFAULT_ENCODING
+        ) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if os.path.isdir(mirror_path):
+                arguments = [
+                    "git", "--git-dir", mirror_path, "fetch", "--prune",
+                    "--quiet"
+                ]
+            else:
+                arguments = [
+                    "git", "clone", "--mirror", "--quiet",
+                    self.make_git_url(repo_name), mirror_path
+                ]
+            refreshed = self.run_with_indulgence(arguments)
+        if not refreshed:
+            print("Couldn't refresh the mirror of "+repo_name+"...")
+            return None
+        return mirror_path
+
+    def make_clone_arguments(self, repo_name, clone_options=None):
+        """ Make the arguments with which to clone a given repo, borrowing
+        objects from its mirror, if we have one, so that only what the mirror
+        lacks is fetched over the network. The clone then copies what it
+        borrowed, so that it doesn't depend on the cache afterwards.
+
+        A repo may limit how much history the clone fetches, filter out
+        file contents until they're needed, and check out only some of its
+        paths. A full mirror would fetch everything the clone leaves out, so
+        a clone which limits what it fetches doesn't use one. """
+        clone_options = clone_options or {}
+        repo_path = self.get_repo_path(repo_name)
+        result = ["git", "clone"]
+        if clone_options.get("depth"):
+            result = result+["--depth", str(clone_options["depth"])]
+        if clone_options.get("filter"):
+            result = result+["--filter", clone_options["filter"]]
+        if clone_options.get("sparse_paths"):
+            result.append("--sparse")
+        if not (clone_options.get("depth") or clone_options.get("filter")):
+            mirror_path = self.refresh_mirror(repo_name)
+            if mirror_path:
+                result = \
+                    result+["--reference-if-able", mirror_path, "--dissociate"]
+        result = result+[self.make_git_url(repo_name), repo_path]
+        return result
+
+    def make_sparse_paths(self, clone_options):
+        """ Make the patterns, in the style of .gitignore, of those paths
+        in a repo which we want to check out. A pattern may mention the
+        wallpaper, or the number of the Thunderbird, we want on this
+        computer; a pattern which mentions something we don't know is left
+        out. """
+        values = {
+            "wallpaper": \
+                os.path.splitext(
+                    os.path.basename(self.get_source_wallpaper_path())
+                )[0],
+            "thunderbird_num": self.thunderbird_num
+        }
+        result = []
+        for pattern in clone_options.get("sparse_paths", ()):
+            names = [
+                name for _, name, _, _ in string.Formatter().parse(pattern)
+                if name is not None
+            ]
+            if all(values.get(name) is not None for name in names):
+                result.append(pattern.format(**values))
+        return result
+
     def install_own_repo(
             self,
             repo_name,
             underpinning_packages=None,
-            installation_arguments=None
+            installation_arguments=None,
+            clone_options=None
         ):
-        """ Install a custom repo. """
-        if os.path.exists(repo_name):
+        """ Install a custom repo. This doesn't touch the current working
+        directory, so several of these can run at once. """
+        repo_path = self.get_repo_path(repo_name)
+        if os.path.exists(repo_path):
             print("Looks like "+repo_name+" already exists...")
             return True
-        if underpinning_packages:
-            for package_name in underpinning_packages:
-                if not self.install_via_apt(package_name):
-                    return False
-        arguments = ["git", "clone", self.make_git_url(repo_name)]
+        # The APT batch installs the underpinnings, so that the clones never
+        # race any other process for the DPKG lock: all we do is check.
+        missing = [
+            package_name for package_name in underpinning_packages or ()
+            if not self.check_apt_package_present(package_name)
+        ]
+        if missing:
+            print(
+                "Missing underpinnings for "+repo_name+": "+
+                ", ".join(missing)
+            )
+            return False
+        arguments = self.make_clone_arguments(repo_name, clone_options)
         if not self.run_with_indulgence(arguments):
             return False
-        os.chdir(repo_name)
+        sparse_paths = self.make_sparse_paths(clone_options or {})
+        if sparse_paths:
+            if not self.run_with_indulgence(
+                ["git", "sparse-checkout", "set", "--no-cone"]+sparse_paths,
+                cwd=repo_path
+            ):
+                return False
+        if not self.make_repo_venv(repo_name):
+            return False
         if installation_arguments:
+            if not self.run_with_indulgence(
+                self.make_repo_arguments(repo_name, installation_arguments),
+                cwd=repo_path
+            ):
+                return False
+        return True
+
+    def make_repo_venv(self, repo_name):
+        """ Derive a virtual environment for a given repo from the base, and
+        install into it those of the repo's requirements which the base
+        doesn't already meet. If there's no base to derive from, the repo
+        makes do with the system's Python, as it used to. """
+        if (not self.path_to_venv_dir) or self.test_run:
+            return True
+        path_to_base = self.get_base_venv_path()
+        if not check_venv_present(path_to_base):
+            print("No base virtual environment for "+repo_name+"...")
+            return True
+        path_to_venv = self.get_venv_path(repo_name)
+        try:
+            derive_venv(path_to_base, path_to_venv)
+        except OSError as error:
+            print("Error deriving a virtual environment: "+str(error))
+            return False
+        path_to_requirements = \
+            os.path.join(
+                self.get_repo_path(repo_name),
+                self.REQUIREMENTS_FILENAME
+            )
+        if os.path.isfile(path_to_requirements):
+            arguments = [
+                os.path.join(path_to_venv, "bin", "pip"), "install", "-r",
+                path_to_requirements
+            ]
             if not self.run_with_indulgence(arguments):
-                os.chdir(self.target_dir)
                 return False
-        os.chdir(self.target_dir)
         return True
 
-    def install_kingdom_of_cyprus(self):
-        """ Install the Kingdom of Cyprus repo. """
-        result = \
-            self.install_own_repo(
-                "kingdom-of-cyprus",
-                underpinning_packages=("nodejs", "npm")
+    def make_repo_arguments(self, repo_name, arguments):
+        """ Make the arguments with which to run a command for a given repo,
+        within its virtual environment, if it has one. """
+        if self.path_to_venv_dir:
+            path_to_venv = self.get_venv_path(repo_name)
+            if check_venv_present(path_to_venv):
+                return make_venv_arguments(path_to_venv, arguments)
+        return list(arguments)
+
+    def check_own_repos_present(self):
+        """ Check whether all our own repos have been cloned. """
+        for repo in self.OWN_REPOS:
+            if not os.path.isdir(self.get_repo_path(repo["name"])):
+                return False
+        return True
+
+    def get_install_scripts(self, repo):
+        """ Get the paths, within a given repo, of the scripts which its
+        installation arguments run. """
+        result = repo.get("install_scripts")
+        if result is None:
+            repo_path = self.get_repo_path(repo["name"])
+            result = [
+                argument for argument in repo.get("installation_arguments", ())
+                if os.path.isfile(os.path.join(repo_path, argument))
+            ]
+        return list(result)
+
+    def compare_with_upstream(self, repo_path):
+        """ Fetch the repo at a given path, and compare it with its upstream.
+        Return a word or two saying why it can't be fast-forwarded, or None if
+        it can. """
+        if not self.run_with_indulgence(
+            ["git", "fetch", "--quiet"],
+            cwd=repo_path
+        ):
+            return "fetch failed"
+        status = \
+            self.run_command(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=repo_path
             )
-        return result
+        if status.return_code != 0:
+            return "status failed"
+        if status.tail:
+            return "dirty"
+        counts = \
+            self.run_command(
+                ["git", "rev-list", "--left-right", "--count", "HEAD...@{u}"],
+                cwd=repo_path
+            )
+        if (counts.return_code != 0) or (not counts.tail):
+            return "no upstream"
+        ahead, behind = (int(count) for count in counts.tail[-1].split())
+        if behind == 0:
+            return "ahead" if ahead else "up to date"
+        if ahead:
+            return "diverged"
+        return None
 
-    def install_chancery(self):
-        """ Install the Chancery repos. """
-        if not self.install_own_repo("chancery"):
+    def check_install_scripts_changed(self, repo, repo_path):
+        """ Check whether upstream has changed any of a given repo's install
+        scripts. """
+        scripts = self.get_install_scripts(repo)
+        if not scripts:
             return False
-        result = \
-            self.install_own_repo(
-                "chancery-b",
-                installation_arguments=("sh", "install_3rd_party")
+        diff = \
+            self.run_command(
+                ["git", "diff", "--name-only", "HEAD", "@{u}", "--"]+scripts,
+                cwd=repo_path
             )
+        if (diff.return_code != 0) or diff.tail:
+            return True
+        return False
+
+    def update_own_repo(self, repo):
+        """ Fetch a given repo, and fast-forward it if it's clean and hasn't
+        diverged from upstream, re-running its installation arguments, if it
+        has any, if the changes touched its install scripts. Return a word or
+        two saying how that went. """
+        repo_path = self.get_repo_path(repo["name"])
+        if not os.path.exists(repo_path):
+            return "not cloned"
+        if self.test_run:
+            return "up to date"
+        blocker = self.compare_with_upstream(repo_path)
+        if blocker:
+            return blocker
+        installation_arguments = repo.get("installation_arguments")
+        scripts_changed = \
+            bool(installation_arguments) and \
+            self.check_install_scripts_changed(repo, repo_path)
+        if not self.run_with_indulgence(
+            ["git", "merge", "--ff-only", "--quiet", "@{u}"],
+            cwd=repo_path
+        ):
+            return "merge failed"
+        if not scripts_changed:
+            return "updated"
+        if not self.run_with_indulgence(
+            self.make_repo_arguments(repo["name"], installation_arguments),
+            cwd=repo_path
+        ):
+            return "reinstall failed"
+        return "updated and reinstalled"
+
+    def update_own_repos(self):
+        """ Bring all our own repos which have been cloned up to date, several
+        at once. A repo which can't be fast-forwarded is reported, and
+        doesn't hold up the others. """
+        with ThreadPoolExecutor(max_workers=max(self.clone_jobs, 1)) as pool:
+            futures = {
+                repo["name"]: \
+                    run_in_current_context(pool, self.update_own_repo, repo)
+                for repo in self.OWN_REPOS
+            }
+        outcomes = {name: future.result() for name, future in futures.items()}
+        self.report["repos"] = outcomes
+        result = True
+        for name, outcome in outcomes.items():
+            print(name+": "+outcome)
+            if outcome in self.REPO_UPDATE_FAILURES:
+                self.failure_log.append("Update "+name+" ("+outcome+")")
+                result = False
         return result
 
-    def install_hmss(self):
-        """ Install the HMSS repo. """
-        result = self.install_own_repo("hmss")
+    def make_own_repo_underpinnings(self):
+        """ Build a tuple of the APT packages on which our own repos rely. """
+        result = ()
+        for repo in self.OWN_REPOS:
+            result = result+tuple(repo.get("underpinning_packages", ()))
         return result
 
-    def install_hgmj(self):
-        """ Install the HGMJ repo. """
-        result = \
-            self.install_own_repo(
-                "hgmj",
-                installation_arguments=("sh", "install_3rd_party")
-            )
+    def install_own_repos(self, repo_names=None):
+        """ Clone our own repos, several at once, running each repo's
+        installation arguments as soon as its clone has finished. """
+        repos = [
+            repo for repo in self.OWN_REPOS
+            if (repo_names is None) or (repo["name"] in repo_names)
+        ]
+        with ThreadPoolExecutor(max_workers=max(self.clone_jobs, 1)) as pool:
+            futures = {
+                run_in_current_context(
+                    pool,
+                    self.install_own_repo,
+                    repo["name"],
+                    underpinning_packages=repo.get("underpinning_packages"),
+                    installation_arguments=\
+                        repo.get("installation_arguments"),
+                    clone_options=repo.get("clone_options")
+                ): repo
+                for repo in repos
+            }
+        result = True
+        for future, repo in futures.items():
+            if not future.result():
+                self.failure_log.append(repo["imperative"])
+                result = False
+        return result
+
+    def make_other_third_party_packages(self):
+        """ Build a tuple of the other useful packages we want on this
+        computer. """
+        result = self.OTHER_THIRD_PARTY
+        if self.this_os == "chrome-os":
+            result = result+self.MISSING_FROM_CHROME
         return result
 
     def install_other_third_party(self):
         """ Install some other useful packages. """
         result = True
-        for package in self.OTHER_THIRD_PARTY:
+        for package in self.make_other_third_party_packages():
             if not self.install_via_apt(package):
                 result = False
-        if self.this_os == "chrome-os":
-            for package in self.MISSING_FROM_CHROME:
-                if not self.install_via_apt(package):
-                    result = False
         return result
 
     def get_sudo(self):
@@ -306,93 +1106,717 @@ class HMSoftwareInstaller:
         if self.test_run:
             return
         print("I'm going to need superuser privileges for this...")
-        subprocess.run(
-            ["sudo", "echo", "Superuser privileges: activate!"],
-            check=True
-        )
+        arguments = ["sudo", "echo", "Superuser privileges: activate!"]
+        return_code = self.system.run(arguments, show_output=True)
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, arguments)
+
+    def run_command(self, arguments, cwd=None, timeout=None, keep=None):
+        """ Run a command, as part of the current step, and return a record of
+        what happened, including any line of output matching the pattern to
+        keep. """
+        with self.tracer.span(
+            " ".join(arguments),
+            "command",
+            args={ "arguments": list(arguments), "cwd": cwd }
+        ) as trace_args:
+            if self.show_output:
+                print("Running command with arguments:")
+                print(arguments)
+            command_result = \
+                self.system.run_capturing(
+                    arguments,
+                    cwd=cwd,
+                    timeout=timeout or self.command_timeout,
+                    log_name=get_current_step(),
+                    show_output=self.show_output,
+                    keep=keep
+                )
+            trace_args["exit_code"] = command_result.return_code
+        return command_result
 
-    def run_with_indulgence(self, arguments):
+    def record_failure_output(self, arguments, command_result):
+        """ Keep the tail of a failed command's output, under the step which
+        ran it, so that we can say what went wrong. """
+        step = get_current_step()
+        if step:
+            self.failure_output[step] = \
+                ["$ "+" ".join(arguments)]+command_result.tail
+
+    def run_with_indulgence(self, arguments, cwd=None, timeout=None):
         """ Run a command, and don't panic immediately if we get a non-zero
         return code. """
         if self.test_run:
             return True
-        if self.show_output:
-            print("Running subprocess.run() with arguments:")
-            print(arguments)
-            process = subprocess.run(arguments)
-        else:
-            process = subprocess.run(arguments, stdout=subprocess.DEVNULL)
-        if process.returncode == 0:
+        command_result = self.run_command(arguments, cwd=cwd, timeout=timeout)
+        if command_result.return_code == 0:
             return True
+        self.record_failure_output(arguments, command_result)
         return False
 
+    def check_apt_lock_error(self, command_result):
+        """ Check whether APT failed because someone else held its lock. """
+        for line in command_result.tail:
+            for error in self.APT_LOCK_ERRORS:
+                if error in line:
+                    return True
+        return False
+
+    def wait_for_apt_lock(self, deadline):
+        """ Wait until nobody holds APT's lock, saying who does every so
+        often, or until the deadline passes. Return True if the lock is
+        free. """
+        with self.tracer.span("Wait for APT lock", "wait") as trace_args:
+            last_reported = None
+            while True:
+                if time.monotonic() >= deadline:
+                    print("Gave up waiting for the APT lock.")
+                    trace_args["result"] = False
+                    return False
+                # Sleep at least once, in case the lock is between holders.
+                time.sleep(self.apt_lock_poll_interval)
+                holder = self.system.find_apt_lock_holder()
+                if holder is None:
+                    trace_args["result"] = True
+                    return True
+                now = time.monotonic()
+                if (
+                    (last_reported is None) or
+                    (now-last_reported >= self.APT_LOCK_REPORT_INTERVAL)
+                ):
+                    pid, name = holder
+                    print(
+                        "Waiting for "+name+" (process "+str(pid)+") to "+
+                        "release the APT lock, for up to "+
+                        str(max(int(deadline-now), 0))+" more seconds..."
+                    )
+                    last_reported = now
+                    trace_args["holder"] = name
+
+    def run_apt(self, arguments):
+        """ Run an APT command. If someone else, such as unattended-upgrades,
+        holds the lock, wait for them to finish and try again, rather than
+        failing. Only this step waits; steps which don't need APT carry on. """
+        if self.test_run:
+            return True
+        deadline = time.monotonic()+self.apt_lock_timeout
+        while True:
+            command_result = self.run_command(arguments)
+            if command_result.return_code == 0:
+                return True
+            if (
+                (not self.check_apt_lock_error(command_result)) or
+                (not self.wait_for_apt_lock(deadline))
+            ):
+                self.record_failure_output(arguments, command_result)
+                return False
+
     def run_apt_with_argument(self, argument):
         """ Run APT with an argument, and tell me how it went. """
         arguments = ["sudo", "apt-get", "--yes", argument]
-        result = self.run_with_indulgence(arguments)
+        result = self.run_apt(arguments)
         return result
 
+    def get_package_index(self):
+        """ Get the index of installed packages and commands, building it if
+        we haven't done so already this run. """
+        with self.index_lock:
+            if self.package_index is None:
+                self.package_index = \
+                    build_package_index(
+                        path_to_dpkg_status=self.path_to_dpkg_status,
+                        search_path=self.search_path
+                    )
+        return self.package_index
+
     def check_against_dpkg(self, package_name):
         """ Check whether a given package is on the books with DPKG. """
-        result = self.run_with_indulgence(["dpkg", "--status", package_name])
+        result = self.get_package_index().check_package_installed(package_name)
         return result
 
-    def install_via_apt(self, package_name, command=None):
-        """ Attempt to install a package, and tell me how it went. """
+    def check_apt_package_present(self, package_name, command=None):
+        """ Check whether a given APT package, or the command it provides, is
+        already on this computer. """
         if not command:
             command = package_name
-        if check_command_exists(command):
+        index = self.get_package_index()
+        if (
+            (package_name in self.apt_installed) or
+            index.check_package_installed(package_name) or
+            index.check_command_exists(command)
+        ):
             return True
-        arguments = ["sudo", "apt-get", "--yes", "install", package_name]
+        return False
+
+    def install_via_apt(self, package_name, command=None):
+        """ Attempt to install a package, and tell me how it went. """
+        if package_name in self.apt_failures:
+            return False
+        if self.check_apt_package_present(package_name, command=command):
+            return True
+        arguments = \
+            self.make_apt_arguments("install", package_name, batch="apt")
+        result = self.run_apt(arguments)
+        self.get_package_index().refresh()
+        return result
+
+    def add_local_apt_repo(self):
+        """ Index the .deb files in a local directory, and tell APT to use
+        that directory as a repository. """
+        if self.test_run:
+            return True
+        count = \
+            build_packages_index(
+                self.path_to_local_apt_repo,
+                path_to_index_dir=self.path_to_local_apt_index
+            )
+        print("Indexed "+str(count)+" local .deb files.")
+        path_to_sources = \
+            os.path.join(self.path_to_local_apt_index, self.LOCAL_APT_SOURCES)
+        with open(
+            path_to_sources,
+            "w",
+            encoding=DEFAULT_ENCODING
+        ) as sources_file:
+            sources_file.write(make_sources_line(self.path_to_local_apt_index))
+        destination = \
+            os.path.join(self.path_to_apt_sources_dir, self.LOCAL_APT_SOURCES)
+        arguments = ["sudo", "cp", path_to_sources, destination]
         result = self.run_with_indulgence(arguments)
         return result
 
-    def update_and_upgrade(self):
-        """ Update and upgrade the existing software. """
-        if not self.run_apt_with_argument("update"):
+    def check_local_apt_repo_present(self):
+        """ Check whether APT has been told about our local repository. """
+        path_to_sources = \
+            os.path.join(self.path_to_apt_sources_dir, self.LOCAL_APT_SOURCES)
+        return os.path.exists(path_to_sources)
+
+    def export_apt_archives(self):
+        """ Copy the .deb files this run has downloaded into the export
+        directory, if we've been given one, so that other machines can use
+        them. """
+        if (not self.path_to_deb_export) or self.test_run:
+            return True
+        try:
+            count = \
+                export_debs(
+                    self.path_to_deb_export,
+                    source_dirs=(
+                        DEFAULT_PATH_TO_APT_ARCHIVES,
+                        os.path.join(self.path_to_prefetch_dir, "apt"),
+                        self.path_to_download_cache
+                    )
+                )
+        except OSError as error:
+            print("Error exporting .deb files: "+str(error))
+            self.failure_log.append("Export .deb files")
             return False
-        if not self.run_apt_with_argument("upgrade"):
+        print("Exported "+str(count)+" new .deb files.")
+        return True
+
+    def check_apt_update_needed(self):
+        """ Decide whether we need to update APT's lists, and record the
+        decision, and why, in the report. """
+        if self.test_run:
+            return True
+        fresh, reason = \
+            check_apt_lists_fresh(
+                self.apt_max_age,
+                (
+                    self.path_to_apt_update_stamp,
+                    self.path_to_apt_periodic_stamp
+                ),
+                path_to_apt_lists=self.path_to_apt_lists,
+                path_to_sources_list=self.path_to_apt_sources_list,
+                path_to_sources_dir=self.path_to_apt_sources_dir
+            )
+        self.report["apt_update"] = { "run": not fresh, "reason": reason }
+        return not fresh
+
+    def record_apt_update(self):
+        """ Touch our stamp, so that later runs know the lists are fresh. """
+        if self.test_run:
+            return
+        directory = os.path.dirname(self.path_to_apt_update_stamp)
+        os.makedirs(directory, exist_ok=True)
+        pathlib.Path(self.path_to_apt_update_stamp).touch()
+
+    def check_apt_upgrade_needed(self):
+        """ Ask APT, without privileges, whether an upgrade would upgrade
+        anything, and record the answer in the report. If we can't tell, we
+        take it that it would. """
+        if self.test_run:
+            return True
+        # APT gives its summary before a line or two per package, so, with
+        # enough upgrades, it's long gone from the tail.
+        command_result = \
+            self.run_command(
+                ["apt-get", "--simulate", "upgrade"],
+                keep=r"\d+ upgraded"
+            )
+        upgrades = None
+        if command_result.return_code == 0:
+            for line in command_result.kept:
+                match = re.match(r"(\d+) upgraded", line)
+                if match:
+                    upgrades = int(match.group(1))
+        self.report["apt_upgrade"] = {
+            "run": upgrades != 0,
+            "packages": upgrades
+        }
+        if upgrades == 0:
             return False
+        return True
+
+    def refresh_apt_lists(self):
+        """ Update APT's lists, unless they're fresh, or we've already done so
+        this run. Either way, let prefetching know that it can go by them. """
+        try:
+            if self.apt_lists_refreshed:
+                return True
+            if self.check_apt_update_needed():
+                if not self.run_apt_with_argument("update"):
+                    return False
+                self.record_apt_update()
+            else:
+                print("APT's lists are fresh; not updating them.")
+            self.apt_lists_refreshed = True
+            return True
+        finally:
+            self.apt_lists_ready.set()
+
+    def get_apt_catalogue(self):
+        """ Get the catalogue of what APT could install, loading it if we
+        haven't done so already this run. """
+        if self.apt_catalogue is None:
+            self.apt_catalogue = load_apt_catalogue(self.path_to_apt_lists)
+        return self.apt_catalogue
+
+    def make_prefetchable_upgrades(self):
+        """ List the packages an upgrade would download, once APT's lists are
+        up to date. """
+        self.apt_lists_ready.wait()
+        result = \
+            find_apt_upgrades(
+                self.get_package_index(),
+                self.get_apt_catalogue()
+            )
+        return result
+
+    def make_prefetchable_packages(self):
+        """ List the packages, dependencies included, which installing the APT
+        batch would download, once APT's lists are up to date. """
+        self.apt_lists_ready.wait()
+        result, _ = \
+            resolve_apt_packages(
+                self.make_apt_batch(),
+                self.get_package_index(),
+                self.get_apt_catalogue()
+            )
+        return result
+
+    def start_prefetching(self):
+        """ Queue the downloading, in the background, of everything the run is
+        going to need, in the order in which the steps will need it: the
+        upgrades, the APT batch, the PIP requirements and Google Chrome. This
+        step only queues; the APT batches are worked out once the next step
+        has updated APT's lists, since that needs APT's lock. """
+        if self.test_run or (not self.prefetch) or self.prefetcher:
+            return True
+        prefetcher = \
+            Prefetcher(
+                self.run_command,
+                path_to_prefetch_dir=self.path_to_prefetch_dir
+            )
+        prefetcher.add_apt_batch("upgrade", self.make_prefetchable_upgrades)
+        prefetcher.add_apt_batch("apt", self.make_prefetchable_packages)
+        pip_command = self.get_pip_command()
+        # Until PIP itself is installed, there's nothing to download with.
+        if self.get_package_index().check_command_exists(pip_command):
+            prefetcher.add_pip_batch(
+                "pip",
+                pip_command,
+                self.make_missing_pip_packages
+            )
+        if not (self.minimal or self.check_google_chrome_present()):
+            chrome_url = \
+                urllib.parse.urljoin(self.CHROME_STEM, self.CHROME_DEB)
+            prefetcher.add_batch("chrome", self.download, chrome_url)
+        self.prefetcher = prefetcher
+        return True
+
+    def check_prefetching(self):
+        """ Check whether there's nothing left which prefetching would
+        download, not counting upgrades, which are checked for later. """
+        if (
+            self.check_apt_batch_present() and
+            self.check_pip_packages_present() and
+            (self.minimal or self.check_google_chrome_present())
+        ):
+            return True
+        return False
+
+    def wait_for_prefetch(self, batch):
+        """ Wait for a given batch of prefetching to finish, and say whether
+        it downloaded anything. """
+        if not self.prefetcher:
+            return False
+        return self.prefetcher.wait(batch)
+
+    def make_apt_arguments(self, command, *packages, batch=None):
+        """ Make the arguments with which to run an APT command, pointing APT
+        at what we've prefetched for it, once that's arrived. """
+        result = ["sudo", "apt-get", "--yes"]
+        if batch and self.wait_for_prefetch(batch):
+            result = result+self.prefetcher.make_apt_options()
+        result = result+[command]+list(packages)
+        return result
+
+    def update_and_upgrade(self):
+        """ Update and upgrade the existing software, skipping the update if
+        the lists are fresh, and the upgrade if there's nothing to upgrade. """
+        if not self.refresh_apt_lists():
+            return False
+        if self.check_apt_upgrade_needed():
+            if not self.run_apt(
+                self.make_apt_arguments("upgrade", batch="upgrade")
+            ):
+                return False
+        else:
+            print("Nothing to upgrade.")
         if not self.install_via_apt("software-properties-common"):
             return False
         return True
 
     def install_sqlite(self):
         """ Install both SQLite and a browser for it. """
-        if not self.install_via_apt("sqlite"):
+        for package in self.SQLITE_PACKAGES:
+            if not self.install_via_apt(package):
+                return False
+        return True
+
+    def make_apt_packages(self):
+        """ Build a list of every APT package which the processes we're going
+        to run will need. """
+        steps = self.make_essentials()
+        if not self.minimal:
+            steps = steps+self.make_non_essentials()
+        result = []
+        for step in steps:
+            for package in step.get("apt_packages", ()):
+                if package not in result:
+                    result.append(package)
+        return result
+
+    def make_apt_batch(self):
+        """ Build a list of every APT package which the processes we're going
+        to run will need, and which isn't obviously installed already. """
+        result = [
+            package for package in self.make_apt_packages()
+            if not self.check_apt_package_present(package)
+        ]
+        return result
+
+    def check_apt_batch_present(self):
+        """ Check whether every APT package we need is installed. """
+        if self.make_apt_batch():
             return False
-        if not self.install_via_apt("sqlitebrowser"):
+        return True
+
+    def install_apt_batch(self):
+        """ Install, in a single APT transaction, every package which the
+        processes we're going to run need. If that fails, fall back on
+        installing them one at a time, so that we know which package broke. """
+        packages = self.make_apt_batch()
+        if not packages:
+            return True
+        arguments = self.make_apt_arguments("install", *packages, batch="apt")
+        if self.run_apt(arguments):
+            self.apt_installed.update(packages)
+            self.get_package_index().refresh()
+            return True
+        for package in packages:
+            arguments = \
+                self.make_apt_arguments("install", package, batch="apt")
+            if self.run_apt(arguments):
+                self.apt_installed.add(package)
+            else:
+                self.apt_failures.add(package)
+                self.failure_log.append("Install "+package+" via APT")
+        self.get_package_index().refresh()
+        # The processes which needed a broken package will fail in their turn.
+        return True
+
+    def get_journal(self):
+        """ Get the journal of completed steps, loading it if we haven't done
+        so already this run. """
+        if self.journal is None:
+            self.journal = load_journal(self.path_to_journal)
+        return self.journal
+
+    def get_os_release(self):
+        """ Get the line which identifies this OS, reading it if we haven't
+        done so already this run. """
+        if self.os_release is None:
+            self.os_release = read_os_release() or ""
+        return self.os_release
+
+    def make_step_fingerprint(self, item):
+        """ Fingerprint the inputs to a given process, along with those things
+        about this computer which might change what it does. """
+        inputs = {
+            "imperative": item["imperative"],
+            "apt_packages": item.get("apt_packages", ()),
+            "inputs": item.get("inputs", {}),
+            "this_os": self.this_os,
+            "os_release": self.get_os_release() or None,
+            "python_version": self.python_version,
+            "pip_version": self.pip_version
+        }
+        return make_fingerprint(inputs)
+
+    def verify_step(self, item):
+        """ Check that the work a given process did is still in place. """
+        for package in item.get("apt_packages", ()):
+            if not self.check_apt_package_present(package):
+                return False
+        verify = item.get("verify")
+        if verify and not verify():
             return False
         return True
 
+    def make_journalled_method(self, item):
+        """ Wrap a process's method so that it's traced, it records its outcome
+        in the journal, and, if we're resuming, it's skipped if it's been
+        done. """
+        def run_journalled():
+            fingerprint = self.make_step_fingerprint(item)
+            journal = self.get_journal()
+            if (
+                self.resume and
+                journal.check_completed(item["imperative"], fingerprint) and
+                self.verify_step(item)
+            ):
+                print("Already done: "+item["imperative"])
+                return True
+            started_at = time.monotonic()
+            result = item["method"]()
+            self.record_step_time(
+                item["imperative"],
+                time.monotonic()-started_at,
+                result
+            )
+            if not self.test_run:
+                if result:
+                    journal.record_success(item["imperative"], fingerprint)
+                else:
+                    journal.record_failure(item["imperative"])
+            return result
+        def method():
+            with self.tracer.span(item["imperative"], "step") as trace_args:
+                result = run_journalled()
+                trace_args["result"] = result
+            return result
+        return method
+
+    def get_history(self):
+        """ Get the history of how long steps took, opening it if we haven't
+        done so already this run, or return None if we're not keeping one. """
+        if self.test_run or not self.path_to_history:
+            return None
+        with self.history_lock:
+            if self.history is None:
+                self.history = StepHistory(self.path_to_history)
+        return self.history
+
+    def make_run_key(self):
+        """ Make the name under which the history records whole runs. Minimal
+        and full runs take very different times, so we keep them apart. """
+        if self.minimal:
+            return "Whole run (minimal)"
+        return "Whole run (full)"
+
+    def record_step_time(self, imperative, duration, passed):
+        """ Record how long a step took in the report and in the history. """
+        self.report.setdefault("step_times", {})[imperative] = {
+            "duration": round(duration, 3),
+            "passed": bool(passed)
+        }
+        history = self.get_history()
+        if history:
+            history.record(
+                imperative,
+                duration,
+                passed,
+                this_os=self.this_os,
+                host=self.host
+            )
+
+    def make_eta(self, item):
+        """ Say, going by the history, how long a given process will probably
+        take, and how long the whole run has probably got left. """
+        history = self.get_history()
+        if not history:
+            return ""
+        estimates = []
+        step_estimate = \
+            history.estimate(item["imperative"], self.this_os, self.host)
+        if step_estimate is not None:
+            estimates.append("usually "+format_duration(step_estimate))
+        run_estimate = \
+            history.estimate(self.make_run_key(), self.this_os, self.host)
+        if (run_estimate is not None) and self.started_at:
+            left = max(run_estimate-(time.monotonic()-self.started_at), 0)
+            estimates.append("about "+format_duration(left)+" left in all")
+        if not estimates:
+            return ""
+        return " ("+"; ".join(estimates)+")"
+
+    def announce_step(self, item):
+        """ Tell the user that a given process is starting, and, if we know,
+        how long it and the whole run are likely to take. """
+        print(item["gerund"]+"..."+self.make_eta(item))
+
+    def finish_step(self, item, outcome):
+        """ Write what the history has kept back as soon as a given process
+        finishes, so that the timings of the processes which have finished
+        survive the run being cut short. """
+        del item, outcome
+        if self.history:
+            self.history.flush()
+
+    def run_steps(self, steps, stop_on_failure=False):
+        """ Run a tuple of processes, as many at once as the resources they
+        use allow, and log any which fail. """
+        steps = tuple(
+            dict(item, method=self.make_journalled_method(item))
+            for item in steps
+        )
+        scheduler = \
+            StepScheduler(
+                steps,
+                jobs=self.jobs,
+                stop_on_failure=stop_on_failure,
+                on_start=self.announce_step,
+                on_finish=self.finish_step
+            )
+        outcomes = scheduler.run()
+        result = True
+        for imperative, outcome in outcomes.items():
+            if not outcome:
+                self.failure_log.append(imperative)
+                result = False
+        return result
+
     def run_essentials(self):
         """ Run those processes which, if they fail, we will have to stop
         the entire program there. """
-        for item in self.make_essentials():
-            print(item["gerund"]+"...")
-            method_to_run = item["method"]
-            if not method_to_run():
-                self.failure_log.append(item["imperative"])
-                return False
-        return True
+        result = self.run_steps(self.make_essentials(), stop_on_failure=True)
+        return result
 
     def run_non_essentials(self):
         """ Run the installation processes. """
-        result = True
-        for item in self.make_non_essentials():
-            print(item["gerund"]+"...")
-            method_to_run = item["method"]
-            if not method_to_run():
-                self.failure_log.append(item["imperative"])
-                result = False
+        result = self.run_steps(self.make_non_essentials())
         print("Changing wallpaper...")
-        if not self.change_wallpaper():
+        with self.tracer.span("Change wallpaper", "step") as trace_args:
+            wallpaper_result = self.change_wallpaper()
+            trace_args["result"] = wallpaper_result
+        if not wallpaper_result:
             self.failure_log.append("Change wallpaper")
             # It doesn't matter too much if this fails.
         return result
 
+    def plan_google_chrome(self, plan):
+        """ Add downloading and installing Google Chrome to a plan, if we'd
+        need to. Return the APT packages on which it depends, if we can tell
+        without going online. """
+        if self.check_google_chrome_present():
+            return []
+        chrome_url = urllib.parse.urljoin(self.CHROME_STEM, self.CHROME_DEB)
+        downloader = Downloader(path_to_cache=self.path_to_download_cache)
+        path_to_deb = downloader.find_cached(chrome_url, check_remote=False)
+        if not path_to_deb:
+            plan.downloads.append(chrome_url)
+            plan.unsized.append(self.CHROME_DEB)
+            return []
+        try:
+            control = parse_stanza(read_deb_control(path_to_deb))
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            return []
+        result = [
+            alternatives[0]
+            for alternatives in parse_depends(control.get("Depends"))
+            if not any(
+                self.check_against_dpkg(alternative)
+                for alternative in alternatives
+            )
+        ]
+        return result
+
+    def plan_wallpaper(self, plan):
+        """ Add changing the wallpaper to a plan, if it needs changing, along
+        with fetching the image, if we haven't got it. """
+        wallpaper_path, image = self.choose_wallpaper()
+        if image:
+            plan.downloads.append(image["url"])
+            if image.get("size"):
+                plan.download_bytes += image["size"]
+            else:
+                plan.unsized.append(image["filename"])
+            plan.wallpaper = image["filename"]
+        elif not self.check_wallpaper_current(wallpaper_path):
+            plan.wallpaper = wallpaper_path
+
+    def make_plan(self):
+        """ Work out what a real run would change on this computer, and how
+        much it would download, without changing anything, without privileges,
+        and without starting any subprocesses beyond asking the desktop what
+        its wallpaper is. Upgrades are judged against the package lists as
+        they are now, i.e. before any "apt-get update". """
+        plan = InstallPlan()
+        index = self.get_package_index()
+        catalogue = load_apt_catalogue(self.path_to_apt_lists)
+        plan.apt_packages = self.make_apt_batch()
+        wanted = list(plan.apt_packages)
+        if not self.minimal:
+            wanted = wanted+self.plan_google_chrome(plan)
+            plan.repos = [
+                repo["name"] for repo in self.OWN_REPOS
+                if not os.path.exists(self.get_repo_path(repo["name"]))
+            ]
+            if os.path.exists(self.path_to_wallpaper_dir):
+                self.plan_wallpaper(plan)
+        to_install, unknown = resolve_apt_packages(wanted, index, catalogue)
+        plan.apt_dependencies = [
+            package for package in to_install
+            if package not in plan.apt_packages
+        ]
+        plan.apt_upgrades = find_apt_upgrades(index, catalogue)
+        plan.download_bytes = \
+            measure_apt_downloads(
+                to_install+plan.apt_upgrades,
+                catalogue,
+                list_archived_debs()
+            )
+        plan.unsized = plan.unsized+unknown
+        plan.pip_requirements = self.make_missing_pip_packages()
+        if plan.pip_requirements:
+            plan.unsized.append("PIP requirements")
+        if plan.repos:
+            plan.unsized.append("repo clones")
+        plan.credential_writes = \
+            make_credential_changes(
+                username=self.git_username,
+                email_address=self.email_address,
+                path_to_git_credentials=self.path_to_git_credentials,
+                path_to_pat=self.path_to_pat,
+                path_to_gitconfig=self.path_to_gitconfig
+            )
+        return plan
+
     def print_outcome(self, passed, with_flying_colours):
-        """ Print a list of what failed to the screen. """
+        """ Print a list of what failed to the screen, along with the tail of
+        the output of the last command each item ran, if it ran one. """
         if passed and with_flying_colours:
             print("Installation PASSED with flying colours!")
             return
@@ -403,31 +1827,119 @@ class HMSoftwareInstaller:
         print("\nThe following items failed:\n")
         for item in self.failure_log:
             print("    * "+item)
+            for line in self.failure_output.get(item, [])[-self.TAIL_LENGTH:]:
+                print("        | "+line)
         print(" ")
 
+    def conclude(self, passed, with_flying_colours):
+        """ Record how the run went in the report, and tell the user. """
+        self.report.update({
+            "passed": passed,
+            "with_flying_colours": passed and with_flying_colours,
+            "failure_log": list(self.failure_log),
+            "failure_output": dict(self.failure_output)
+        })
+        self.print_outcome(passed, with_flying_colours)
+
+    def save_report(self):
+        """ Write the report of this run to a JSON file. """
+        report = {
+            "this_os": self.this_os,
+            "thunderbird_num": self.thunderbird_num,
+            "target_dir": self.target_dir,
+            "passed": False,
+            "with_flying_colours": False,
+            "failure_log": list(self.failure_log),
+            "failure_output": dict(self.failure_output)
+        }
+        report.update(self.report)
+        directory = os.path.dirname(os.path.abspath(self.path_to_report))
+        os.makedirs(directory, exist_ok=True)
+        write_json_atomically(self.path_to_report, report)
+
+    def save_outputs(self):
+        """ Save a trace and a report of the run, if we've been asked for
+        them. """
+        if self.path_to_trace:
+            self.tracer.save(self.path_to_trace)
+        if self.path_to_report:
+            self.save_report()
+
     def run(self):
-        """ Run the software installer. """
+        """ Run the software installer, or, if we've been asked to, just
+        update our own repos, and save a trace and a report of the run. """
+        self.started_at = time.monotonic()
+        result = False
+        try:
+            with self.tracer.span("Run", "run"):
+                if self.update_repos:
+                    result = self.run_repo_updates()
+                else:
+                    result = self.run_steps_in_order()
+                    # A resumed run skips whatever's been done, so it says
+                    # nothing about how long a whole run takes.
+                    if not self.resume:
+                        self.record_step_time(
+                            self.make_run_key(),
+                            time.monotonic()-self.started_at,
+                            result
+                        )
+        finally:
+            if self.prefetcher:
+                # In case we stopped before updating APT's lists.
+                self.apt_lists_ready.set()
+                self.prefetcher.close(clean=result)
+            self.save_outputs()
+            if self.history:
+                self.history.close()
+        return result
+
+    def run_repo_updates(self):
+        """ Update our own repos, and say how it went. """
+        print("Updating own repos...")
+        with self.tracer.span("Update own repos", "step") as trace_args:
+            result = self.update_own_repos()
+            trace_args["result"] = result
+        print("\nFinished.\n")
+        self.conclude(True, result)
+        return True
+
+    def run_steps_in_order(self):
+        """ Run the essentials, then, unless this is a minimal install, the
+        non-essentials. """
         print("Running His Majesty's Software Installer...")
         self.get_sudo()
         self.move_to_target_dir()
         if not self.run_essentials():
             print("\nFinished.\n\n")
-            self.print_outcome(False, False)
+            self.conclude(False, False)
             return False
         if self.minimal:
-            self.print_outcome(True, True)
+            with_flying_colours = self.export_apt_archives()
+            self.conclude(True, with_flying_colours)
             return True
         with_flying_colours = self.run_non_essentials()
+        if not self.export_apt_archives():
+            with_flying_colours = False
         print("\nComplete!\n")
-        self.print_outcome(True, with_flying_colours)
+        self.conclude(True, with_flying_colours)
         return True
 
 ####################
 # HELPER FUNCTIONS #
 ####################
 
-def check_command_exists(command):
-    """ Check whether a given command exists on this computer. """
-    if shutil.which(command):
-        return True
-    return False
+def read_os_release(path_to_os_release=DEFAULT_PATH_TO_OS_RELEASE):
+    """ Read the line of the OS release file which identifies this OS. """
+    try:
+        with open(
+            path_to_os_release,
+            "r",
+            encoding=DEFAULT_ENCODING
+        ) as os_release_file:
+            for line in os_release_file:
+                if line.startswith("PRETTY_NAME="):
+                    return line.split("=", 1)[1].strip().strip('"')
+    except OSError:
+        pass
+    return None
@@ -0,0 +1,170 @@
+"""
+This code defines a class which holds a plan of what a real run of the
+installer would change on this computer, along with some functions which work
+out which APT packages would be pulled in, and how much would be downloaded,
+from the package lists APT already has.
+"""
+
+# Standard imports.
+import os
+from dataclasses import dataclass, field
+
+# Local imports.
+from apt_catalogue import compare_debian_versions, parse_depends
+from config import DEFAULT_PATH_TO_APT_ARCHIVES
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class InstallPlan:
+    """ The class in question. """
+    # Fields.
+    apt_packages: list = field(default_factory=list)
+    apt_dependencies: list = field(default_factory=list)
+    apt_upgrades: list = field(default_factory=list)
+    pip_requirements: list = field(default_factory=list)
+    repos: list = field(default_factory=list)
+    credential_writes: list = field(default_factory=list)
+    wallpaper: str = None
+    downloads: list = field(default_factory=list)
+    download_bytes: int = 0
+    unsized: list = field(default_factory=list)
+
+    def check_empty(self):
+        """ Check whether a real run would change nothing. """
+        if (
+            self.apt_packages or
+            self.apt_upgrades or
+            self.pip_requirements or
+            self.repos or
+            self.credential_writes or
+            self.wallpaper or
+            self.downloads
+        ):
+            return False
+        return True
+
+    def make_lines(self):
+        """ Describe the plan, one line at a time. """
+        result = []
+        sections = (
+            ("APT packages to install", self.apt_packages),
+            ("APT packages pulled in as dependencies", self.apt_dependencies),
+            ("APT packages to upgrade", self.apt_upgrades),
+            ("PIP requirements to install", self.pip_requirements),
+            ("Repos to clone", self.repos),
+            ("Credential writes", self.credential_writes),
+            ("Files to download", self.downloads)
+        )
+        for heading, items in sections:
+            if not items:
+                continue
+            result.append(heading+" ("+str(len(items))+"):")
+            for item in items:
+                result.append("    * "+item)
+        if self.wallpaper:
+            result.append("Wallpaper to set: "+self.wallpaper)
+        if self.check_empty():
+            result.append("Nothing to do.")
+            return result
+        estimate = "Estimated download: "+format_size(self.download_bytes)
+        if self.unsized:
+            estimate = \
+                estimate+", plus "+", ".join(self.unsized)+" of unknown size"
+        result.append(estimate)
+        return result
+
+    def print_plan(self):
+        """ Print the plan to the screen. """
+        for line in self.make_lines():
+            print(line)
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def format_size(size):
+    """ Format a number of bytes for humans. """
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return str(round(size, 1))+" "+unit
+        size = size/1024
+    return str(round(size, 1))+" GiB"
+
+def list_archived_debs(path_to_apt_archives=DEFAULT_PATH_TO_APT_ARCHIVES):
+    """ List the filenames of the .debs APT has already downloaded. """
+    try:
+        return set(os.listdir(path_to_apt_archives))
+    except OSError:
+        return set()
+
+def resolve_apt_packages(packages, package_index, catalogue):
+    """ Work out which packages installing a given list of packages would
+    pull in, following dependencies through the catalogue until we reach
+    something already installed. Returns those packages, in the order in which
+    we found them, along with any which APT doesn't know about. """
+    result = []
+    unknown = []
+    queue = list(packages)
+    seen = set()
+    while queue:
+        package_name = queue.pop(0)
+        if package_name in seen:
+            continue
+        seen.add(package_name)
+        candidate = catalogue.get_candidate(package_name)
+        if candidate is None:
+            unknown.append(package_name)
+            continue
+        result.append(package_name)
+        depends = \
+            ", ".join(
+                candidate.get(key, "") for key in ("Pre-Depends", "Depends")
+            )
+        for alternatives in parse_depends(depends):
+            if any(
+                package_index.check_package_installed(alternative) or
+                (alternative in seen) or
+                (alternative in queue)
+                for alternative in alternatives
+            ):
+                continue
+            known = [
+                alternative for alternative in alternatives
+                if catalogue.check_known(alternative)
+            ]
+            # Virtual packages aren't in the catalogue under their own names;
+            # we assume, as is usual, that something provides them already.
+            if known:
+                queue.append(known[0])
+    return result, unknown
+
+def find_apt_upgrades(package_index, catalogue):
+    """ List those installed packages of which the catalogue has a newer
+    version. """
+    result = []
+    for package_name, version in sorted(package_index.packages.items()):
+        if (":" in package_name) or (not version):
+            continue
+        candidate = catalogue.get_candidate(package_name)
+        if not candidate:
+            continue
+        if compare_debian_versions(candidate.get("Version", "0"), version) > 0:
+            result.append(package_name)
+    return result
+
+def measure_apt_downloads(packages, catalogue, archived_debs):
+    """ Add up the sizes of those packages in a given list which APT would
+    have to download. """
+    result = 0
+    for package_name in packages:
+        candidate = catalogue.get_candidate(package_name)
+        if not candidate:
+            continue
+        filename = os.path.basename(candidate.get("Filename", ""))
+        if filename in archived_debs:
+            continue
+        result += int(candidate.get("Size", 0) or 0)
+    return result
@@ -0,0 +1,240 @@
+"""
+This code defines a class which gives the installer access to the computer
+it's actually running on: running commands, asking which Python distributions
+are installed, and downloading files. The installer does all of these things
+via an object like this, so that a fake system can be swapped in for testing
+and benchmarking.
+"""
+
+# Standard imports.
+import glob
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+
+# Non-standard imports.
+try:
+    from gi.repository import Gio, GLib
+except ImportError:
+    Gio = None
+    GLib = None
+
+# Local imports.
+from async_runner import AsyncCommandRunner
+from config import (
+    DEFAULT_ENCODING,
+    DEFAULT_PATH_TO_DRM_DIR,
+    DEFAULT_PATH_TO_PROC_LOCKS,
+    DEFAULT_PATHS_TO_APT_LOCKS
+)
+from downloader import Downloader
+from pip_requirements import get_installed_distributions
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class LocalSystem:
+    """ The class in question. """
+    # Fields.
+    runner: AsyncCommandRunner = \
+        field(default_factory=AsyncCommandRunner, repr=False)
+    paths_to_apt_locks: tuple = DEFAULT_PATHS_TO_APT_LOCKS
+    path_to_proc_locks: str = DEFAULT_PATH_TO_PROC_LOCKS
+    path_to_drm_dir: str = DEFAULT_PATH_TO_DRM_DIR
+
+    def run_capturing(
+            self,
+            arguments,
+            cwd=None,
+            timeout=None,
+            log_name=None,
+            show_output=False,
+            keep=None
+        ):
+        """ Run a command, and return a record of what happened, including
+        the tail of its output, and any line of it matching the pattern to
+        keep. """
+        result = \
+            self.runner.run(
+                arguments,
+                cwd=cwd,
+                timeout=timeout,
+                log_name=log_name,
+                show_output=show_output,
+                keep=keep
+            )
+        return result
+
+    def run(self, arguments, cwd=None, show_output=False):
+        """ Run a command, and return its exit code. """
+        result = \
+            self.run_capturing(arguments, cwd=cwd, show_output=show_output)
+        return result.return_code
+
+    def get_installed_distributions(self, pip_version, site_dirs=None):
+        """ Map the normalised name of each distribution installed for a given
+        version of PIP, or in some given site directories, to its version, or
+        return None if we can't tell in-process, because we're not running
+        under that version of Python. """
+        if site_dirs:
+            return get_installed_distributions(site_dirs)
+        if sys.version_info.major != pip_version:
+            return None
+        return get_installed_distributions()
+
+    def get_desktop_settings(self, schema, keys):
+        """ Read some keys of a given GSettings schema, in-process, if we have
+        GIO's bindings, or via GSettings otherwise, and map those which exist
+        to their values. Return None if the schema doesn't exist. """
+        if Gio is None:
+            result = {}
+            for key in keys:
+                command_result = \
+                    self.run_capturing(["gsettings", "get", schema, key])
+                if (command_result.return_code == 0) and command_result.tail:
+                    result[key] = command_result.tail[-1].strip().strip("'")
+            return result
+        source = Gio.SettingsSchemaSource.get_default()
+        found = source.lookup(schema, True) if source else None
+        if found is None:
+            return None
+        settings = Gio.Settings.new(schema)
+        result = {
+            key: settings.get_value(key).unpack()
+            for key in keys if found.has_key(key)
+        }
+        return result
+
+    def set_desktop_settings(self, schema, changes):
+        """ Set some keys of a given GSettings schema, in one change, if we
+        have GIO's bindings, or one at a time via GSettings otherwise, and
+        say whether it worked. """
+        if Gio is None:
+            for key, value in changes.items():
+                if self.run(["gsettings", "set", schema, key, value]) != 0:
+                    return False
+            return True
+        settings = Gio.Settings.new(schema)
+        settings.delay()
+        for key, value in changes.items():
+            type_string = settings.get_value(key).get_type_string()
+            settings.set_value(key, GLib.Variant(type_string, value))
+        settings.apply()
+        Gio.Settings.sync()
+        return True
+
+    def fetch(self, url, path_to_cache, expected_sha256=None):
+        """ Get a local copy of a file, via the download cache, and return its
+        path, or None if that didn't work. """
+        downloader = Downloader(path_to_cache=path_to_cache)
+        result = downloader.fetch(url, expected_sha256=expected_sha256)
+        return result
+
+    def find_apt_lock_holder(self):
+        """ Find the process holding any of APT's locks, without privileges,
+        by matching the lock files against the kernel's table of locks.
+        Return its PID and name, or None if nobody holds them. """
+        result = \
+            find_lock_holder(
+                self.paths_to_apt_locks,
+                path_to_proc_locks=self.path_to_proc_locks
+            )
+        return result
+
+    def get_display_resolution(self):
+        """ Get the preferred resolution of the biggest display connected to
+        this computer, as the kernel sees it, or None if we can't tell. """
+        result = None
+        pattern = os.path.join(self.path_to_drm_dir, "*", "status")
+        for path_to_status in glob.glob(pattern):
+            connector_dir = os.path.dirname(path_to_status)
+            try:
+                with open(
+                    path_to_status,
+                    "r",
+                    encoding=DEFAULT_ENCODING
+                ) as status_file:
+                    if status_file.read().strip() != "connected":
+                        continue
+                with open(
+                    os.path.join(connector_dir, "modes"),
+                    "r",
+                    encoding=DEFAULT_ENCODING
+                ) as modes_file:
+                    preferred_mode = modes_file.readline()
+            except OSError:
+                continue
+            # The preferred mode comes first, e.g. "1920x1080".
+            match = re.match(r"(\d+)x(\d+)", preferred_mode)
+            if not match:
+                continue
+            resolution = (int(match.group(1)), int(match.group(2)))
+            if (
+                (result is None) or
+                (resolution[0]*resolution[1] > result[0]*result[1])
+            ):
+                result = resolution
+        return result
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def get_lock_ids(paths_to_locks):
+    """ Identify some lock files as the kernel does in its table of locks,
+    i.e. as "major:minor:inode", with the device numbers in hex. """
+    result = set()
+    for path_to_lock in paths_to_locks:
+        try:
+            stat = os.stat(path_to_lock)
+        except OSError:
+            continue
+        result.add(
+            format(os.major(stat.st_dev), "02x")+":"+
+            format(os.minor(stat.st_dev), "02x")+":"+
+            str(stat.st_ino)
+        )
+    return result
+
+def get_process_name(pid):
+    """ Get the name of the process with a given PID. """
+    try:
+        with open(
+            "/proc/"+str(pid)+"/comm",
+            "r",
+            encoding=DEFAULT_ENCODING
+        ) as comm_file:
+            return comm_file.read().strip()
+    except OSError:
+        return "unknown"
+
+def find_lock_holder(
+        paths_to_locks,
+        path_to_proc_locks=DEFAULT_PATH_TO_PROC_LOCKS
+    ):
+    """ Find the process holding a lock on any of some files, and return its
+    PID and name, or None if nobody holds them. """
+    lock_ids = get_lock_ids(paths_to_locks)
+    if not lock_ids:
+        return None
+    try:
+        with open(
+            path_to_proc_locks,
+            "r",
+            encoding=DEFAULT_ENCODING
+        ) as locks_file:
+            lines = locks_file.readlines()
+    except OSError:
+        return None
+    for line in lines:
+        words = line.split()
+        # E.g. "1: POSIX  ADVISORY  WRITE 4242 08:01:1234 0 EOF".
+        if (len(words) < 6) or (words[1] == "->"):
+            continue
+        pid, lock_id = words[4], words[5]
+        if (lock_id in lock_ids) and pid.isdigit():
+            return int(pid), get_process_name(pid)
+    return None
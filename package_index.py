@@ -0,0 +1,160 @@
+"""
+This code defines a class which holds, in memory, a record of which packages
+DPKG has installed and which commands are on the PATH, so that we can answer
+"Is this already installed?" without starting a subprocess every time.
+"""
+
+# Standard imports.
+import os
+import threading
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import DEFAULT_ENCODING, DEFAULT_PATH_TO_DPKG_STATUS
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class PackageIndex:
+    """ The class in question. """
+    # Fields.
+    path_to_dpkg_status: str = DEFAULT_PATH_TO_DPKG_STATUS
+    search_path: str = None
+    packages: dict = field(default_factory=dict)
+    commands: dict = field(default_factory=dict)
+    status_mtime: float = None
+    dir_mtimes: dict = field(default_factory=dict)
+    dir_contents: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def __post_init__(self):
+        if self.search_path is None:
+            self.search_path = os.environ.get("PATH", os.defpath)
+
+    def get_search_dirs(self):
+        """ Get the directories on the PATH, in the order they're searched. """
+        result = []
+        for directory in self.search_path.split(os.pathsep):
+            if directory and (directory not in result):
+                result.append(directory)
+        return result
+
+    def read_dpkg_status(self):
+        """ Parse the DPKG status file in a single pass, if it's changed
+        since we last read it. """
+        try:
+            mtime = os.stat(self.path_to_dpkg_status).st_mtime
+        except OSError:
+            self.packages = {}
+            self.status_mtime = None
+            return
+        if mtime == self.status_mtime:
+            return
+        with open(
+            self.path_to_dpkg_status,
+            "r",
+            encoding=DEFAULT_ENCODING,
+            errors="replace"
+        ) as status_file:
+            contents = status_file.read()
+        packages = {}
+        for stanza in contents.split("\n\n"):
+            fields = parse_stanza(stanza)
+            name = fields.get("Package")
+            status = fields.get("Status", "").split()
+            if (not name) or (status[-1:] != ["installed"]):
+                continue
+            packages[name] = fields.get("Version")
+            if fields.get("Architecture"):
+                packages[name+":"+fields["Architecture"]] = \
+                    fields.get("Version")
+        self.packages = packages
+        self.status_mtime = mtime
+
+    def scan_path(self):
+        """ Scan those directories on the PATH which have changed since we
+        last looked at them, and work out which command each name resolves
+        to. """
+        search_dirs = self.get_search_dirs()
+        for directory in search_dirs:
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                self.dir_mtimes.pop(directory, None)
+                self.dir_contents[directory] = set()
+                continue
+            if self.dir_mtimes.get(directory) == mtime:
+                continue
+            self.dir_contents[directory] = list_executables(directory)
+            self.dir_mtimes[directory] = mtime
+        commands = {}
+        for directory in reversed(search_dirs):
+            for name in self.dir_contents.get(directory, ()):
+                commands[name] = os.path.join(directory, name)
+        self.commands = commands
+
+    def refresh(self):
+        """ Bring the index up to date, rereading only what has changed. """
+        with self.lock:
+            self.read_dpkg_status()
+            self.scan_path()
+
+    def check_package_installed(self, package_name):
+        """ Check whether DPKG has a given package down as installed. """
+        if package_name in self.packages:
+            return True
+        return False
+
+    def check_command_exists(self, command):
+        """ Check whether a given command exists on this computer. """
+        if os.sep in command:
+            if os.path.isfile(command) and os.access(command, os.X_OK):
+                return True
+            return False
+        if command in self.commands:
+            return True
+        return False
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def parse_stanza(stanza):
+    """ Parse the top-level fields of a DEB822 stanza into a dictionary. """
+    result = {}
+    for line in stanza.splitlines():
+        if (not line) or line[0].isspace() or (":" not in line):
+            continue
+        key, value = line.split(":", 1)
+        result[key] = value.strip()
+    return result
+
+def list_executables(directory):
+    """ List the names of the executable files in a given directory. """
+    result = set()
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return result
+    for entry in entries:
+        try:
+            if entry.is_file() and os.access(entry.path, os.X_OK):
+                result.add(entry.name)
+        except OSError:
+            continue
+    return result
+
+def build_package_index(
+        path_to_dpkg_status=DEFAULT_PATH_TO_DPKG_STATUS,
+        search_path=None
+    ):
+    """ Build and populate a package index. """
+    result = \
+        PackageIndex(
+            path_to_dpkg_status=path_to_dpkg_status,
+            search_path=search_path
+        )
+    result.refresh()
+    return result
@@ -0,0 +1,86 @@
+"""
+This code defines some functions which check, without starting PIP, whether
+the Python packages we want are already installed at suitable versions.
+"""
+
+# Standard imports.
+import operator
+import re
+from importlib import metadata
+
+# Local constants.
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt
+}
+
+#############
+# FUNCTIONS #
+#############
+
+def normalise_name(name):
+    """ Normalise the name of a distribution, as PIP does. """
+    result = re.sub(r"[-_.]+", "-", name).lower()
+    return result
+
+def parse_version(version):
+    """ Turn a version string into a tuple of integers we can compare. Any
+    trailing non-numeric gubbins in a component (e.g. "0rc1") is ignored. """
+    result = []
+    for component in version.split("."):
+        match = re.match(r"\d+", component)
+        if not match:
+            break
+        result.append(int(match.group()))
+    return tuple(result)
+
+def compare_versions(installed, operator_string, required):
+    """ Check whether an installed version satisfies a given constraint. """
+    installed_tuple = parse_version(installed)
+    required_tuple = parse_version(required)
+    length = max(len(installed_tuple), len(required_tuple))
+    installed_tuple = installed_tuple+(0,)*(length-len(installed_tuple))
+    required_tuple = required_tuple+(0,)*(length-len(required_tuple))
+    result = OPERATORS[operator_string](installed_tuple, required_tuple)
+    return result
+
+def get_installed_distributions(site_dirs=None):
+    """ Map the normalised name of each distribution installed for this
+    interpreter, or in some given site directories, to its version. """
+    if site_dirs:
+        distributions = metadata.distributions(path=list(site_dirs))
+    else:
+        distributions = metadata.distributions()
+    result = {}
+    for distribution in distributions:
+        name = distribution.metadata["Name"]
+        if name:
+            result[normalise_name(name)] = distribution.version
+    return result
+
+def make_requirement_string(requirement):
+    """ Turn a requirement dictionary into something PIP understands. """
+    result = requirement["name"]
+    if requirement["operator"] and requirement["version"]:
+        result = result+requirement["operator"]+requirement["version"]
+    return result
+
+def check_requirement_satisfied(requirement, installed):
+    """ Check whether a requirement dictionary is satisfied by the installed
+    distributions given. """
+    version = installed.get(normalise_name(requirement["name"]))
+    if version is None:
+        return False
+    if not (requirement["operator"] and requirement["version"]):
+        return True
+    result = \
+        compare_versions(
+            version,
+            requirement["operator"],
+            requirement["version"]
+        )
+    return result
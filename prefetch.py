@@ -0,0 +1,136 @@
+"""
+This code defines a class which downloads, in the background, what the
+installation steps are going to need, one batch at a time and in the order in
+which the steps will need them, so that the network is kept busy while DPKG
+and PIP are busy installing what's already arrived.
+"""
+
+# Standard imports.
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+# Local imports.
+from config import DEFAULT_PATH_TO_PREFETCH_DIR
+
+# Local constants.
+APT_DIRNAME = "apt"
+PIP_DIRNAME = "pip"
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class Prefetcher:
+    """ The class in question. """
+    # Fields.
+    run_command: Callable
+    path_to_prefetch_dir: str = DEFAULT_PATH_TO_PREFETCH_DIR
+    batches: dict = field(default_factory=dict)
+    executor: ThreadPoolExecutor = None
+
+    def __post_init__(self):
+        # One worker, so that batches arrive in the order they're added.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def get_apt_dir(self):
+        """ Get the directory into which we download .deb files. APT is
+        pointed at this instead of its own archives, so that it installs what
+        we've already downloaded, and only downloads what we haven't. """
+        return os.path.join(self.path_to_prefetch_dir, APT_DIRNAME)
+
+    def get_pip_dir(self):
+        """ Get the directory into which we download distributions for PIP. """
+        return os.path.join(self.path_to_prefetch_dir, PIP_DIRNAME)
+
+    def make_apt_options(self):
+        """ Make the options which point APT at our downloads. """
+        result = ["-o", "Dir::Cache::archives="+self.get_apt_dir()]
+        return result
+
+    def add_batch(self, key, function, *args):
+        """ Queue a batch of downloads, which tells us, once it's done,
+        whether it downloaded anything. """
+        self.batches[key] = self.executor.submit(function, *args)
+
+    def add_apt_batch(self, key, make_packages):
+        """ Queue the download of some APT packages. The list of packages is
+        only made when the batch's turn comes, since making it may mean
+        reading the whole of APT's lists. """
+        self.add_batch(key, self.download_apt_packages, make_packages)
+
+    def add_pip_batch(self, key, pip_command, make_requirements):
+        """ Queue the download of some PIP requirements. """
+        self.add_batch(
+            key,
+            self.download_pip_requirements,
+            pip_command,
+            make_requirements
+        )
+
+    def download_apt_packages(self, make_packages):
+        """ Download some APT packages, without needing APT's locks, so that
+        APT can carry on installing at the same time. """
+        packages = make_packages()
+        if not packages:
+            return False
+        os.makedirs(os.path.join(self.get_apt_dir(), "partial"), exist_ok=True)
+        command_result = \
+            self.run_command(
+                ["apt-get", "download"]+list(packages),
+                cwd=self.get_apt_dir()
+            )
+        # Even if some failed, APT will use those which arrived.
+        if (command_result.return_code == 0) or self.list_debs():
+            return True
+        return False
+
+    def download_pip_requirements(self, pip_command, make_requirements):
+        """ Download some PIP requirements, and whatever they depend on. """
+        requirements = make_requirements()
+        if not requirements:
+            return False
+        arguments = [
+            pip_command, "download", "--quiet", "--dest", self.get_pip_dir()
+        ]
+        command_result = self.run_command(arguments+list(requirements))
+        if command_result.return_code == 0:
+            return True
+        return False
+
+    def wait(self, key):
+        """ Wait for a given batch to finish, and say whether it downloaded
+        anything. A batch we were never given, or which went wrong, downloaded
+        nothing. """
+        future = self.batches.get(key)
+        if future is None:
+            return False
+        try:
+            return future.result()
+        except Exception as error: # pylint: disable=broad-exception-caught
+            # Whatever went wrong, the step can still install online.
+            print("Error prefetching "+key+": "+str(error))
+            return False
+
+    def list_debs(self):
+        """ List the .deb files we've downloaded. """
+        return glob.glob(os.path.join(self.get_apt_dir(), "*.deb"))
+
+    def close(self, clean=False):
+        """ Stop prefetching, abandoning any batches which haven't started,
+        and, if we've been asked to, throw away what we downloaded. """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if not clean:
+            return
+        paths = (
+            self.list_debs()+
+            glob.glob(os.path.join(self.get_pip_dir(), "*"))
+        )
+        for path_to in paths:
+            try:
+                os.remove(path_to)
+            except OSError:
+                pass
@@ -0,0 +1,354 @@
+"""
+This code defines a class which packs what a successful run of the installer
+leaves behind into a single, streamed, compressed archive, along with a
+manifest of its contents, and which restores such an archive onto another
+computer, installing only those packages which that computer lacks.
+"""
+
+# Standard imports.
+import hashlib
+import io
+import json
+import os
+import re
+import stat
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import (
+    DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    DEFAULT_ENCODING,
+    DEFAULT_JOBS
+)
+from downloader import hash_file
+from pip_requirements import make_requirement_string, normalise_name
+from tracing import run_in_current_context
+
+# Local constants.
+MANIFEST_NAME = "manifest.json"
+REPOS_PREFIX = "repos/"
+SNAPSHOT_VERSION = 1
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class Snapshot:
+    """ The class in question. """
+    # Fields.
+    installer: object
+    path_to_snapshot: str
+    jobs: int = DEFAULT_JOBS
+    failures: list = field(default_factory=list)
+
+    def get_home_files(self):
+        """ Map the names, within the archive, of the Git configuration files
+        we keep to where they live on this computer. """
+        result = {
+            "home/gitconfig": self.installer.path_to_gitconfig,
+            "home/git-credentials": self.installer.path_to_git_credentials
+        }
+        return result
+
+    def map_name(self, name):
+        """ Work out where on this computer a member of the archive belongs,
+        or return None if it doesn't belong anywhere. """
+        if os.path.isabs(name) or (".." in name.split("/")):
+            return None
+        if name.startswith(REPOS_PREFIX):
+            return os.path.join(
+                self.installer.target_dir,
+                *name[len(REPOS_PREFIX):].split("/")
+            )
+        return self.get_home_files().get(name)
+
+    def list_entries(self):
+        """ List the directories, files and symlinks to pack, each as its name
+        within the archive along with its path on this computer. """
+        result = []
+        for repo in self.installer.OWN_REPOS:
+            repo_path = self.installer.get_repo_path(repo["name"])
+            if not os.path.isdir(repo_path):
+                continue
+            for dirpath, dirnames, filenames in os.walk(repo_path):
+                dirnames.sort()
+                # The walk doesn't follow symlinks to directories, so we pack
+                # those as they are.
+                linked = [
+                    dirname for dirname in dirnames
+                    if os.path.islink(os.path.join(dirpath, dirname))
+                ]
+                relative = os.path.relpath(dirpath, self.installer.target_dir)
+                name = REPOS_PREFIX+relative.replace(os.sep, "/")
+                result.append((name, dirpath))
+                for filename in sorted(filenames)+linked:
+                    path_to = os.path.join(dirpath, filename)
+                    relative = \
+                        os.path.relpath(path_to, self.installer.target_dir)
+                    name = REPOS_PREFIX+relative.replace(os.sep, "/")
+                    result.append((name, path_to))
+        for name, path_to in self.get_home_files().items():
+            if os.path.isfile(path_to):
+                result.append((name, path_to))
+        return result
+
+    def make_pip_requirements(self):
+        """ Pin those of the installer's PIP packages which are installed to
+        the versions we have, or, if we can't tell, just list them. """
+        installer = self.installer
+        installed = installer.get_installed_pip_distributions()
+        result = []
+        for package in installer.PIP_PACKAGES:
+            version = None
+            if installed is not None:
+                version = installed.get(normalise_name(package["name"]))
+            if version:
+                result.append(package["name"]+"=="+version)
+            else:
+                result.append(make_requirement_string(package))
+        return result
+
+    def make_manifest(self, entries):
+        """ Describe what we're about to pack, and what needs to be installed
+        alongside it. """
+        files = []
+        for name, path_to in entries:
+            if os.path.islink(path_to):
+                files.append({
+                    "name": name,
+                    "type": "symlink",
+                    "target": os.readlink(path_to)
+                })
+                continue
+            if os.path.isdir(path_to):
+                files.append({ "name": name, "type": "directory" })
+                continue
+            files.append({
+                "name": name,
+                "type": "file",
+                "mode": stat.S_IMODE(os.stat(path_to).st_mode),
+                "size": os.path.getsize(path_to),
+                "sha256": hash_file(path_to)
+            })
+        result = {
+            "version": SNAPSHOT_VERSION,
+            "created_at": time.time(),
+            "this_os": self.installer.this_os,
+            "thunderbird_num": self.installer.thunderbird_num,
+            "apt_packages": [
+                package for package in self.installer.make_apt_packages()
+                if self.installer.check_apt_package_present(package)
+            ],
+            "pip_requirements": self.make_pip_requirements(),
+            "files": files
+        }
+        return result
+
+    def export(self):
+        """ Write the archive, manifest first, so that a restore knows what to
+        install before it has unpacked anything. The archive holds our Git
+        credentials, so only we may read it. """
+        entries = self.list_entries()
+        manifest = self.make_manifest(entries)
+        manifest_bytes = \
+            json.dumps(manifest, indent=4).encode(DEFAULT_ENCODING)
+        descriptor = \
+            os.open(
+                self.path_to_snapshot,
+                os.O_WRONLY|os.O_CREAT|os.O_TRUNC,
+                0o600
+            )
+        with open(descriptor, "wb") as snapshot_file:
+            with tarfile.open(
+                fileobj=snapshot_file,
+                mode="w|gz"
+            ) as archive:
+                info = tarfile.TarInfo(MANIFEST_NAME)
+                info.size = len(manifest_bytes)
+                info.mtime = int(manifest["created_at"])
+                archive.addfile(info, io.BytesIO(manifest_bytes))
+                for name, path_to in entries:
+                    archive.add(path_to, arcname=name, recursive=False)
+        print(
+            "Packed "+str(len(entries))+" entries into "+
+            self.path_to_snapshot+"."
+        )
+        return True
+
+    def install_deltas(self, manifest):
+        """ Install those APT packages and PIP requirements in the manifest
+        which this computer lacks. """
+        installer = self.installer
+        missing = [
+            package for package in manifest["apt_packages"]
+            if not installer.check_apt_package_present(package)
+        ]
+        result = True
+        if missing:
+            if installer.check_apt_update_needed():
+                if installer.run_apt_with_argument("update"):
+                    installer.record_apt_update()
+            arguments = ["sudo", "apt-get", "--yes", "install"]+missing
+            if installer.run_apt(arguments):
+                installer.apt_installed.update(missing)
+            else:
+                self.failures.append("Install missing APT packages")
+                result = False
+        installed = installer.get_installed_pip_distributions()
+        requirements = [
+            requirement for requirement in manifest["pip_requirements"]
+            if not check_pinned_satisfied(requirement, installed)
+        ]
+        if requirements:
+            if installer.path_to_venv_dir and not installer.make_base_venv():
+                self.failures.append("Make base virtual environment")
+                return False
+            if not installer.run_with_indulgence(
+                [installer.get_pip_command(), "install"]+requirements
+            ):
+                self.failures.append("Install PIP requirements")
+                result = False
+        print(
+            "Installed "+str(len(missing))+" APT packages and "+
+            str(len(requirements))+" PIP requirements missing here."
+        )
+        return result
+
+    def check_destination(self, name, destination):
+        """ Check that writing a member of the archive to where it belongs
+        won't take us, via a symlink, outside of where it should be. """
+        if name in self.get_home_files():
+            return True
+        root = os.path.realpath(self.installer.target_dir)
+        parent = os.path.realpath(os.path.dirname(destination))
+        if (parent == root) or parent.startswith(root+os.sep):
+            return True
+        return False
+
+    def restore_member(self, archive, member, entry):
+        """ Restore one member of the archive, streaming a file to disk as we
+        verify it. """
+        destination = self.map_name(member.name)
+        if (destination is None) or (entry is None):
+            self.failures.append("Unexpected "+member.name)
+            return
+        if not self.check_destination(member.name, destination):
+            self.failures.append("Unsafe "+member.name)
+            return
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if member.issym() and (entry["type"] == "symlink"):
+            if member.linkname != entry["target"]:
+                self.failures.append("Verify "+member.name)
+                return
+            if os.path.lexists(destination):
+                os.remove(destination)
+            os.symlink(member.linkname, destination)
+            return
+        if member.isdir() and (entry["type"] == "directory"):
+            os.makedirs(destination, exist_ok=True)
+            return
+        if not (
+            member.isfile() and
+            (entry["type"] == "file") and
+            write_verified(archive.extractfile(member), destination, entry)
+        ):
+            self.failures.append("Verify "+member.name)
+
+    def restore(self):
+        """ Unpack the archive, verifying every file against the manifest as
+        we go, while installing what's missing alongside. """
+        with tarfile.open(self.path_to_snapshot, mode="r|gz") as archive:
+            member = archive.next()
+            if (member is None) or (member.name != MANIFEST_NAME):
+                print("No manifest in "+self.path_to_snapshot+".")
+                return False
+            manifest = json.load(archive.extractfile(member))
+            if manifest.get("version") != SNAPSHOT_VERSION:
+                print("Can't restore snapshots of this version.")
+                return False
+            entries = { entry["name"]: entry for entry in manifest["files"] }
+            with ThreadPoolExecutor(max_workers=max(self.jobs, 1)) as pool:
+                deltas = \
+                    run_in_current_context(pool, self.install_deltas, manifest)
+                while True:
+                    member = archive.next()
+                    if member is None:
+                        break
+                    self.restore_member(
+                        archive,
+                        member,
+                        entries.get(member.name)
+                    )
+                    entries.pop(member.name, None)
+            for name in entries:
+                self.failures.append("Missing "+name)
+            deltas_installed = deltas.result()
+        print(
+            "Restored "+str(len(manifest["files"])-len(entries))+" of "+
+            str(len(manifest["files"]))+" entries."
+        )
+        for failure in self.failures:
+            print("    * "+failure)
+        if self.failures or not deltas_installed:
+            return False
+        return True
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def write_verified(
+        source,
+        destination,
+        entry,
+        chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE
+    ):
+    """ Stream a file to disk, a chunk at a time, via a temporary file, and
+    put it in place provided that it matches its entry in the manifest. We
+    never follow a symlink while writing: one at the temporary path is
+    removed, and one at the destination is replaced rather than written
+    through. """
+    path_to_partial = destination+".hmss-partial"
+    if os.path.lexists(path_to_partial):
+        os.remove(path_to_partial)
+    descriptor = \
+        os.open(
+            path_to_partial,
+            os.O_WRONLY|os.O_CREAT|os.O_EXCL|os.O_NOFOLLOW,
+            0o600
+        )
+    hasher = hashlib.sha256()
+    size = 0
+    with open(descriptor, "wb") as partial_file:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            partial_file.write(chunk)
+            hasher.update(chunk)
+            size += len(chunk)
+    if (size != entry["size"]) or (hasher.hexdigest() != entry["sha256"]):
+        os.remove(path_to_partial)
+        return False
+    os.chmod(path_to_partial, entry["mode"])
+    os.replace(path_to_partial, destination)
+    return True
+
+def check_pinned_satisfied(requirement, installed):
+    """ Check whether a requirement is met by what's installed. A pinned
+    requirement must be met exactly; for any other, having the distribution
+    at all will do. If we can't tell, we take it that it isn't met. """
+    if installed is None:
+        return False
+    name = re.split(r"[<>=!]", requirement, maxsplit=1)[0]
+    have = installed.get(normalise_name(name))
+    if have is None:
+        return False
+    _, pinned, version = requirement.partition("==")
+    if pinned and (have != version):
+        return False
+    return True
@@ -0,0 +1,247 @@
+"""
+This code defines a class which keeps a history of how long each installation
+step took, and whether it passed, in a small SQLite database, so that later
+runs can estimate how long they've got left, and so that we can see which
+steps are getting slower.
+"""
+
+# Standard imports.
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import DEFAULT_PATH_TO_HISTORY
+
+# Local constants.
+HISTORY_WINDOW = 20 # I.e. estimates are based on the last 20 passes.
+RECENT_WINDOW = 5
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS step_timings ("+
+    "imperative TEXT NOT NULL, "+
+    "this_os TEXT, "+
+    "host TEXT, "+
+    "finished_at REAL NOT NULL, "+
+    "duration REAL NOT NULL, "+
+    "passed INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS step_timings_by_step "+
+    "ON step_timings (imperative, this_os, host, finished_at)"
+)
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class StepHistory:
+    """ The class in question. """
+    # Fields.
+    path_to_history: str = DEFAULT_PATH_TO_HISTORY
+    connection: sqlite3.Connection = field(default=None, repr=False)
+    pending: list = field(default_factory=list)
+    estimates: dict = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def connect(self):
+        """ Open the database, making it if need be. Steps record their
+        timings from several threads, so we share one connection between
+        them, behind a lock. """
+        if self.connection is None:
+            directory = os.path.dirname(os.path.abspath(self.path_to_history))
+            os.makedirs(directory, exist_ok=True)
+            self.connection = \
+                sqlite3.connect(self.path_to_history, check_same_thread=False)
+            # Each step's timing is committed as soon as the step finishes,
+            # so that a run which is cut short still records its slow steps.
+            # With a write-ahead log, such a commit is cheap.
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+        return self.connection
+
+    def record(
+            self,
+            imperative,
+            duration,
+            passed,
+            this_os=None,
+            host=None,
+            finished_at=None
+        ):
+        """ Record how long a step took, and whether it passed. Records are
+        kept back until the next flush, so that they're written by whoever
+        is scheduling the steps, rather than by the steps themselves. """
+        with self.lock:
+            self.pending.append((
+                imperative,
+                this_os,
+                host,
+                finished_at or time.time(),
+                duration,
+                int(bool(passed))
+            ))
+
+    def flush(self):
+        """ Write any records we've kept back, in one transaction. """
+        with self.lock:
+            if not self.pending:
+                return
+            connection = self.connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO step_timings VALUES (?, ?, ?, ?, ?, ?)",
+                    self.pending
+                )
+            self.pending = []
+
+    def load_estimates(self):
+        """ Work out, in one query, the estimate for every step, on every OS
+        and host, and for every step on every OS and anywhere, from the most
+        recent passes. The query only brings back the last few passes of
+        each step on each host, however long the history. This is done once,
+        when we first need an estimate, since a run has no use for its own
+        timings. """
+        with self.lock:
+            if self.estimates is not None:
+                return self.estimates
+            rows = \
+                self.connect().execute(
+                    "SELECT imperative, this_os, host, duration FROM ("+
+                    "SELECT imperative, this_os, host, finished_at, "+
+                    "duration, ROW_NUMBER() OVER ("+
+                    "PARTITION BY imperative, this_os, host "+
+                    "ORDER BY finished_at DESC) AS recency "+
+                    "FROM step_timings WHERE passed = 1) "+
+                    "WHERE recency <= ? ORDER BY finished_at DESC",
+                    (HISTORY_WINDOW,)
+                ).fetchall()
+            durations = {}
+            for imperative, this_os, host, duration in rows:
+                for key in {
+                    (imperative, this_os, host),
+                    (imperative, this_os, None),
+                    (imperative, None, None)
+                }:
+                    window = durations.setdefault(key, [])
+                    if len(window) < HISTORY_WINDOW:
+                        window.append(duration)
+            self.estimates = {
+                key: get_percentile(window, 0.5)
+                for key, window in durations.items()
+            }
+            return self.estimates
+
+    def forget_estimates(self):
+        """ Make the next estimate take account of everything recorded since
+        the last, e.g. for a process which runs for days. """
+        with self.lock:
+            self.estimates = None
+
+    def estimate(self, imperative, this_os=None, host=None):
+        """ Estimate how long a given step will take, going by how long it
+        took on this host, or, failing that, on this OS, or, failing that,
+        anywhere. Return None if it's never passed before. """
+        estimates = self.load_estimates()
+        for key in (
+            (imperative, this_os, host),
+            (imperative, this_os, None),
+            (imperative, None, None)
+        ):
+            if key in estimates:
+                return estimates[key]
+        return None
+
+    def make_stats(self):
+        """ Summarise the timings of every step we've seen, with the median
+        of the most recent passes alongside the overall median, so that we
+        can see which steps are getting slower. """
+        self.flush()
+        with self.lock:
+            rows = \
+                self.connect().execute(
+                    "SELECT imperative, duration, passed FROM step_timings "+
+                    "ORDER BY finished_at DESC"
+                ).fetchall()
+        steps = {}
+        for imperative, duration, passed in rows:
+            step = \
+                steps.setdefault(
+                    imperative,
+                    { "runs": 0, "failures": 0, "durations": [] }
+                )
+            step["runs"] += 1
+            if passed:
+                step["durations"].append(duration)
+            else:
+                step["failures"] += 1
+        result = []
+        for imperative, step in sorted(steps.items()):
+            durations = step["durations"]
+            result.append({
+                "imperative": imperative,
+                "runs": step["runs"],
+                "failures": step["failures"],
+                "p50": get_percentile(durations, 0.5),
+                "p95": get_percentile(durations, 0.95),
+                "recent": get_percentile(durations[:RECENT_WINDOW], 0.5)
+            })
+        return result
+
+    def print_stats(self):
+        """ Print a table of the timings of every step we've seen. """
+        stats = self.make_stats()
+        if not stats:
+            print("No history yet.")
+            return
+        width = max(len(step["imperative"]) for step in stats)
+        print(
+            "step".ljust(width)+"  "+"runs".rjust(5)+"  "+"fails".rjust(5)+
+            "  "+"p50".rjust(9)+"  "+"p95".rjust(9)+"  "+"recent".rjust(9)
+        )
+        for step in stats:
+            print(
+                step["imperative"].ljust(width)+"  "+
+                str(step["runs"]).rjust(5)+"  "+
+                str(step["failures"]).rjust(5)+"  "+
+                format_duration(step["p50"]).rjust(9)+"  "+
+                format_duration(step["p95"]).rjust(9)+"  "+
+                format_duration(step["recent"]).rjust(9)
+            )
+
+    def close(self):
+        """ Write what we've kept back, and close the database. """
+        self.flush()
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def get_percentile(values, fraction):
+    """ Get a given percentile of some values, by the nearest rank, or None
+    if there aren't any. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(math.ceil(fraction*len(ordered))-1, 0)
+    return ordered[index]
+
+def format_duration(seconds):
+    """ Format a number of seconds for humans. """
+    if seconds is None:
+        return "-"
+    seconds = round(seconds)
+    if seconds < 60:
+        return str(seconds)+" s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return str(minutes)+" min "+str(seconds)+" s"
+    hours, minutes = divmod(minutes, 60)
+    return str(hours)+" h "+str(minutes)+" min"
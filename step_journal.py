@@ -0,0 +1,79 @@
+"""
+This code defines a class which keeps an on-disk record of which installation
+steps have been completed, and with what inputs, so that a resumed run can
+skip what's already been done.
+"""
+
+# Standard imports.
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import DEFAULT_ENCODING, DEFAULT_PATH_TO_JOURNAL
+from downloader import load_json, write_json_atomically
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class StepJournal:
+    """ The class in question. """
+    # Fields.
+    path_to_journal: str = DEFAULT_PATH_TO_JOURNAL
+    entries: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def load(self):
+        """ Read the journal from disk, if it's there. """
+        self.entries = load_json(self.path_to_journal)
+
+    def save(self):
+        """ Write the journal to disk, atomically. """
+        directory = os.path.dirname(self.path_to_journal)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_json_atomically(self.path_to_journal, self.entries)
+
+    def check_completed(self, imperative, fingerprint):
+        """ Check whether a given step has been completed with the same
+        inputs. """
+        entry = self.entries.get(imperative)
+        if entry and (entry["fingerprint"] == fingerprint):
+            return True
+        return False
+
+    def record_success(self, imperative, fingerprint):
+        """ Record that a given step has been completed. """
+        with self.lock:
+            self.entries[imperative] = {
+                "fingerprint": fingerprint,
+                "completed_at": time.time()
+            }
+            self.save()
+
+    def record_failure(self, imperative):
+        """ Record that a given step needs to be run again. """
+        with self.lock:
+            if self.entries.pop(imperative, None) is not None:
+                self.save()
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def make_fingerprint(inputs):
+    """ Make a fingerprint of a step's inputs. """
+    serialised = json.dumps(inputs, sort_keys=True, default=str)
+    result = hashlib.sha256(serialised.encode(DEFAULT_ENCODING)).hexdigest()
+    return result
+
+def load_journal(path_to_journal=DEFAULT_PATH_TO_JOURNAL):
+    """ Make a journal object, and load it from disk. """
+    result = StepJournal(path_to_journal=path_to_journal)
+    result.load()
+    return result
@@ -0,0 +1,146 @@
+"""
+This code defines a class which runs a collection of installation steps,
+respecting the dependencies between them and the resources they use, and
+running as many of them at once as we're allowed.
+"""
+
+# Standard imports.
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+# Local imports.
+from config import DEFAULT_JOBS, DEFAULT_RESOURCE_CAPACITIES
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class StepScheduler:
+    """ The class in question. """
+    # Fields.
+    steps: tuple
+    jobs: int = DEFAULT_JOBS
+    stop_on_failure: bool = False
+    on_start: Callable = None
+    on_finish: Callable = None
+    resource_capacities: dict = \
+        field(default_factory=lambda: dict(DEFAULT_RESOURCE_CAPACITIES))
+    outcomes: dict = field(default_factory=dict)
+    skipped: list = field(default_factory=list)
+    resources_in_use: dict = field(default_factory=dict)
+
+    def get_capacity(self, resource):
+        """ Get the number of steps which may use a given resource at once. """
+        return self.resource_capacities.get(resource, 1)
+
+    def check_dependencies_met(self, step):
+        """ Check whether every step on which this step depends has passed.
+        Dependencies which aren't in this batch of steps are taken to have
+        been met already. """
+        imperatives = {item["imperative"] for item in self.steps}
+        for dependency in step.get("depends_on", ()):
+            if (
+                (dependency in imperatives) and
+                (self.outcomes.get(dependency) is not True)
+            ):
+                return False
+        return True
+
+    def check_dependencies_failed(self, step):
+        """ Check whether any step on which this step depends has failed, or
+        been skipped. """
+        for dependency in step.get("depends_on", ()):
+            if self.outcomes.get(dependency) is False:
+                return True
+        return False
+
+    def check_resources_free(self, step):
+        """ Check whether this step can take the resources it needs. """
+        for resource in step.get("resources", ()):
+            in_use = self.resources_in_use.get(resource, 0)
+            if in_use >= self.get_capacity(resource):
+                return False
+        return True
+
+    def take_resources(self, step):
+        """ Mark the resources a step needs as being in use. """
+        for resource in step.get("resources", ()):
+            self.resources_in_use[resource] = \
+                self.resources_in_use.get(resource, 0)+1
+
+    def release_resources(self, step):
+        """ Mark the resources a step needed as being free again. """
+        for resource in step.get("resources", ()):
+            self.resources_in_use[resource] -= 1
+
+    def skip_blocked_steps(self, pending):
+        """ Remove from the pending list any step which can never run, because
+        something it depends on has failed. """
+        blocked = True
+        while blocked:
+            blocked = False
+            for step in list(pending):
+                if self.check_dependencies_failed(step):
+                    pending.remove(step)
+                    self.outcomes[step["imperative"]] = False
+                    self.skipped.append(step["imperative"])
+                    blocked = True
+
+    def find_ready_step(self, pending):
+        """ Find the first pending step which can start right now. """
+        for step in pending:
+            if (
+                self.check_dependencies_met(step) and
+                self.check_resources_free(step)
+            ):
+                return step
+        return None
+
+    def start_step(self, executor, step):
+        """ Submit a step to the executor. """
+        if self.on_start:
+            self.on_start(step)
+        self.take_resources(step)
+        context = contextvars.copy_context()
+        return executor.submit(context.run, step["method"])
+
+    def run(self):
+        """ Run the steps, and return a dictionary mapping the imperative of
+        each step that was attempted to whether it passed. """
+        pending = list(self.steps)
+        running = {}
+        failed = False
+        with ThreadPoolExecutor(max_workers=max(self.jobs, 1)) as executor:
+            while pending or running:
+                self.skip_blocked_steps(pending)
+                while (
+                    pending and
+                    len(running) < max(self.jobs, 1) and
+                    not (failed and self.stop_on_failure)
+                ):
+                    step = self.find_ready_step(pending)
+                    if not step:
+                        break
+                    pending.remove(step)
+                    running[self.start_step(executor, step)] = step
+                if not running:
+                    # Nothing is running, and nothing else can start.
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    self.release_resources(step)
+                    outcome = bool(future.result())
+                    self.outcomes[step["imperative"]] = outcome
+                    if self.on_finish:
+                        self.on_finish(step, outcome)
+                    if not outcome:
+                        failed = True
+        if not (failed and self.stop_on_failure):
+            for step in pending:
+                self.outcomes[step["imperative"]] = False
+                self.skipped.append(step["imperative"])
+        return self.outcomes
@@ -0,0 +1,106 @@
+"""
+This code tests the Agent class.
+"""
+
+# Standard imports.
+import os
+import shutil
+import threading
+import time
+
+# Local imports.
+from agent import Agent
+from fake_system import FakeSystem
+from hm_software_installer import HMSoftwareInstaller
+
+###########
+# TESTING #
+###########
+
+def remove_package(system, package_name):
+    """ Remove a package from the fake DPKG's books, replacing the status
+    file, as DPKG does. """
+    path_to_status = system.get_path_to_dpkg_status()
+    with open(path_to_status, "r", encoding="utf-8") as status_file:
+        stanzas = status_file.read().split("\n\n")
+    stanzas = [
+        stanza for stanza in stanzas
+        if not stanza.startswith("Package: "+package_name+"\n")
+    ]
+    with open(path_to_status+"-new", "w", encoding="utf-8") as status_file:
+        status_file.write("\n\n".join(stanzas))
+    os.replace(path_to_status+"-new", path_to_status)
+    os.remove(os.path.join(system.get_bin_dir(), package_name))
+
+def test_agent(tmp_path):
+    """ Check that the agent notices a burst of changes as one, and re-runs
+    only those processes whose work they undid. """
+    system = FakeSystem(str(tmp_path))
+    fields = system.make_installer_fields()
+    working_dir = os.getcwd()
+    try:
+        assert HMSoftwareInstaller(minimal=False, **fields).run()
+        agent = \
+            Agent(HMSoftwareInstaller(minimal=False, **fields), window=0.05)
+        steps = agent.make_steps()
+        agent.watched = agent.map_watches(steps)
+        agent.inotify.open()
+        agent.add_watches()
+        assert agent.repair(steps, {step["imperative"] for step in steps})
+        assert agent.repairs == 0
+        shutil.rmtree(str(tmp_path/"home"/"hgmj"))
+        remove_package(system, "sqlite")
+        remove_package(system, "sqlitebrowser")
+        imperatives = agent.wait_for_drift()
+        assert {"Install own repos", "Install SQLite"} <= imperatives
+        assert "Change wallpaper" not in imperatives
+        first_count = len(system.commands_run)
+        assert agent.repair(steps, imperatives)
+        assert agent.repairs == 1
+        commands = system.commands_run[first_count:]
+        assert ["sudo", "apt-get", "--yes", "install", "sqlite"] in [
+            command[:5] for command in commands
+        ]
+        clones = [command for command in commands if command[1] == "clone"]
+        assert [clone[-1] for clone in clones] == [str(tmp_path/"home"/"hgmj")]
+        assert os.path.isdir(str(tmp_path/"home"/"hgmj"))
+        # The repair's own changes are noticed, but nothing needs repairing.
+        assert agent.repair(steps, agent.wait_for_drift())
+        assert agent.repairs == 1
+    finally:
+        agent.inotify.close()
+        os.chdir(working_dir)
+
+def test_ignore_irrelevant(tmp_path):
+    """ Check that a change to a file we don't care about, in a directory we
+    watch, doesn't start a window, and that we wait on for one we do. """
+    system = FakeSystem(str(tmp_path))
+    fields = system.make_installer_fields()
+    agent = Agent(HMSoftwareInstaller(minimal=False, **fields), window=0.05)
+    agent.watched = agent.map_watches(agent.make_steps())
+    agent.inotify.open()
+    try:
+        agent.add_watches()
+        home_dir = system.get_home_dir()
+        with open(
+            os.path.join(home_dir, ".bash_history"),
+            "w",
+            encoding="utf-8"
+        ) as history_file:
+            history_file.write("ls\n")
+        def change_gitconfig():
+            with open(
+                fields["path_to_gitconfig"],
+                "w",
+                encoding="utf-8"
+            ) as config_file:
+                config_file.write("[user]\n")
+        timer = threading.Timer(0.3, change_gitconfig)
+        started_at = time.monotonic()
+        timer.start()
+        imperatives = agent.wait_for_drift()
+        timer.join()
+        assert time.monotonic()-started_at >= 0.3
+        assert imperatives == {"Set up Git"}
+    finally:
+        agent.inotify.close()
@@ -0,0 +1,88 @@
+"""
+This code tests the AsyncCommandRunner class.
+"""
+
+# Standard imports.
+import os
+import sys
+
+# Local imports.
+from async_runner import AsyncCommandRunner, RotatingLog
+
+# Local constants.
+CHATTY_SCRIPT = (
+    "import sys\n"+
+    "for index in range(1000):\n"+
+    "    print('line', index)\n"+
+    "print('oops', file=sys.stderr)\n"+
+    "sys.exit(3)\n"
+)
+QUIET_SCRIPT = (
+    "import os, time\n"+
+    "os.close(1)\n"+
+    "os.close(2)\n"+
+    "time.sleep(60)\n"
+)
+
+###########
+# TESTING #
+###########
+
+def test_ring_and_log(tmp_path):
+    """ Check that we keep only the tail of a chatty command's output, and
+    that the whole of it goes to the step's log. """
+    runner = AsyncCommandRunner(ring_size=5, path_to_log_dir=str(tmp_path))
+    result = \
+        runner.run(
+            [sys.executable, "-c", CHATTY_SCRIPT],
+            log_name="Install own repos"
+        )
+    assert result.return_code == 3
+    assert not result.timed_out
+    assert len(result.tail) == 5
+    assert "line 999" in result.tail
+    assert "oops" in result.tail
+    log = (tmp_path/"Install_own_repos.log").read_text()
+    assert "line 0\n" in log
+    assert "line 999\n" in log
+
+def test_keep(tmp_path):
+    """ Check that a line matching the pattern to keep is kept, even once
+    it's left the ring. """
+    runner = AsyncCommandRunner(ring_size=5, path_to_log_dir=str(tmp_path))
+    result = \
+        runner.run([sys.executable, "-c", CHATTY_SCRIPT], keep=r"line 1\b")
+    assert "line 1" not in result.tail
+    assert result.kept == ["line 1"]
+
+def test_timeout(tmp_path):
+    """ Check that a command which hangs is killed. """
+    runner = AsyncCommandRunner(path_to_log_dir=str(tmp_path))
+    result = \
+        runner.run(
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            timeout=0.5
+        )
+    assert result.timed_out
+    assert result.return_code != 0
+    assert result.tail[-1].startswith("[Timed out")
+
+def test_timeout_after_closing_output(tmp_path):
+    """ Check that a command which closes its output, and then hangs, is
+    killed all the same. """
+    runner = AsyncCommandRunner(path_to_log_dir=str(tmp_path))
+    result = \
+        runner.run([sys.executable, "-c", QUIET_SCRIPT], timeout=0.5)
+    assert result.timed_out
+    assert result.return_code != 0
+
+def test_rotating_log(tmp_path):
+    """ Check that logs are rotated once they get too big. """
+    path_to_log = str(tmp_path/"step.log")
+    log = RotatingLog(path_to_log, max_bytes=10, backups=2)
+    for _ in range(4):
+        log.write(b"0123456789")
+    log.close()
+    assert os.path.exists(path_to_log+".1")
+    assert os.path.exists(path_to_log+".2")
+    assert not os.path.exists(path_to_log+".3")
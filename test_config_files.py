@@ -0,0 +1,127 @@
+"""
+This code tests the functions which bring configuration files to a desired
+state in-process.
+"""
+
+# Standard imports.
+import os
+import stat
+
+# Non-standard imports.
+import pytest
+
+# Local imports.
+from config_files import parse_git_config, update_git_config, update_ini
+from git_credentials import make_credential_changes, set_up_git_credentials
+
+# Local constants.
+GITCONFIG = (
+    "# Mine, all mine.\n"+
+    "[user]\n"+
+    "\tname = Someone Else ; a comment\n"+
+    "[core]\n"+
+    "\teditor = vim\n"
+)
+
+###########
+# TESTING #
+###########
+
+def test_update_git_config():
+    """ Check that only the keys we want are changed or added, that values
+    are quoted when they need to be, and that applying the same changes
+    again changes nothing. """
+    wanted = {
+        "user.name": "Tom",
+        "user.email": "tom@example.com",
+        "alias.hash": "log -1 --format=#%h"
+    }
+    text = update_git_config(GITCONFIG, wanted)
+    assert text.startswith("# Mine, all mine.\n[user]\n\tname = Tom\n")
+    assert "\teditor = vim\n" in text
+    assert "\thash = \"log -1 --format=#%h\"\n" in text
+    config = parse_git_config(text)
+    assert {key: config[key] for key in wanted} == wanted
+    assert update_git_config(text, wanted) == text
+
+def test_update_git_config_multiple_values():
+    """ Check that, like Git, we refuse to replace several values of a key
+    with one, but keep them if the last is already what we want. """
+    text = "[credential]\n\thelper =\n\thelper = store\n"
+    with pytest.raises(ValueError):
+        update_git_config(text, { "credential.helper": "cache" })
+    assert update_git_config(text, { "credential.helper": "store" }) == text
+
+def test_update_ini():
+    """ Check that an INI file keeps what we don't touch. """
+    text = "[*]\nwallpaper=/old.png\nwallpaper_mode=crop\n"
+    assert update_ini(text, "*", { "wallpaper": "/new.png" }) == (
+        "[*]\nwallpaper=/new.png\nwallpaper_mode=crop\n"
+    )
+    assert update_ini(text, "*", { "wallpaper": "/old.png" }) == text
+
+def test_set_up_git_credentials(tmp_path):
+    """ Check that the credentials are set up, that only we may read them,
+    and that doing it again writes nothing. """
+    path_to_pat = str(tmp_path/"pat.txt")
+    path_to_gitconfig = str(tmp_path/".gitconfig")
+    path_to_git_credentials = str(tmp_path/".git-credentials")
+    with open(path_to_pat, "w", encoding="utf-8") as pat_file:
+        pat_file.write("secret\n")
+    with open(path_to_gitconfig, "w", encoding="utf-8") as config_file:
+        config_file.write(GITCONFIG)
+    arguments = {
+        "username": "someone",
+        "email_address": "someone@example.com",
+        "path_to_git_credentials": path_to_git_credentials,
+        "path_to_pat": path_to_pat,
+        "path_to_gitconfig": path_to_gitconfig
+    }
+    assert set_up_git_credentials(**arguments)
+    with open(path_to_gitconfig, "r", encoding="utf-8") as config_file:
+        config = parse_git_config(config_file.read())
+    assert config["user.name"] == "someone"
+    helper = "store --file "+path_to_git_credentials
+    assert config["credential.helper"] == helper
+    assert config["core.editor"] == "vim"
+    mode = stat.S_IMODE(os.stat(path_to_git_credentials).st_mode)
+    assert mode == 0o600
+    before = [
+        os.stat(path_to).st_ino
+        for path_to in (path_to_gitconfig, path_to_git_credentials)
+    ]
+    assert set_up_git_credentials(**arguments)
+    after = [
+        os.stat(path_to).st_ino
+        for path_to in (path_to_gitconfig, path_to_git_credentials)
+    ]
+    assert after == before
+    # Credentials which others can read are made private, even if they're
+    # already what we want.
+    os.chmod(path_to_git_credentials, 0o644)
+    assert set_up_git_credentials(**arguments)
+    mode = stat.S_IMODE(os.stat(path_to_git_credentials).st_mode)
+    assert mode == 0o600
+
+def test_set_up_git_credentials_multiple_helpers(tmp_path):
+    """ Check that several credential helpers are neither overwritten nor
+    dropped, and that the failure is reported. """
+    path_to_pat = str(tmp_path/"pat.txt")
+    path_to_gitconfig = str(tmp_path/".gitconfig")
+    with open(path_to_pat, "w", encoding="utf-8") as pat_file:
+        pat_file.write("secret\n")
+    text = "[credential]\n\thelper =\n\thelper = store\n"
+    with open(path_to_gitconfig, "w", encoding="utf-8") as config_file:
+        config_file.write(text)
+    arguments = {
+        "username": "someone",
+        "email_address": "someone@example.com",
+        "path_to_git_credentials": str(tmp_path/".git-credentials"),
+        "path_to_pat": path_to_pat,
+        "path_to_gitconfig": path_to_gitconfig
+    }
+    changes = make_credential_changes(**arguments)
+    assert changes[0].startswith("(fail) ")
+    assert not set_up_git_credentials(**arguments)
+    with open(path_to_gitconfig, "r", encoding="utf-8") as config_file:
+        assert config_file.read() == text
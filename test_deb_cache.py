@@ -0,0 +1,73 @@
+"""
+This code tests the functions which export and index .deb files.
+"""
+
+# Standard imports.
+import io
+import os
+import tarfile
+
+# Local imports.
+from deb_cache import (
+    build_packages_index,
+    export_debs,
+    make_sources_line,
+    read_deb_control
+)
+
+# Local constants.
+CONTROL = "Package: hello\nVersion: 1.0\nArchitecture: all\n"
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def make_ar_member(name, contents):
+    """ Make a member of an ar archive. """
+    header = (
+        name.ljust(16)+"0".ljust(12)+"0".ljust(6)+"0".ljust(6)+
+        "100644".ljust(8)+str(len(contents)).ljust(10)+"`\n"
+    )
+    result = header.encode("ascii")+contents
+    if len(contents)%2:
+        result += b"\n"
+    return result
+
+def make_deb(path_to):
+    """ Make a minimal .deb file at a given path. """
+    control_bytes = CONTROL.encode("utf-8")
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as control_tar:
+        info = tarfile.TarInfo("./control")
+        info.size = len(control_bytes)
+        control_tar.addfile(info, io.BytesIO(control_bytes))
+    with open(path_to, "wb") as deb_file:
+        deb_file.write(b"!<arch>\n")
+        deb_file.write(make_ar_member("debian-binary", b"2.0\n"))
+        deb_file.write(make_ar_member("control.tar.gz", buffer.getvalue()))
+        deb_file.write(make_ar_member("data.tar.gz", b""))
+
+###########
+# TESTING #
+###########
+
+def test_export_and_index(tmp_path):
+    """ Check that we export .deb files once, and index them such that APT
+    can find them from the root of the file system. """
+    archives = tmp_path/"archives"
+    archives.mkdir()
+    make_deb(str(archives/"hello_1.0_all.deb"))
+    cache = tmp_path/"cache"
+    assert export_debs(str(cache), source_dirs=(str(archives),)) == 1
+    assert export_debs(str(cache), source_dirs=(str(archives),)) == 0
+    path_to_deb = str(cache/"hello_1.0_all.deb")
+    assert read_deb_control(path_to_deb) == CONTROL.strip()
+    index_dir = tmp_path/"index"
+    assert build_packages_index(str(cache), str(index_dir)) == 1
+    packages = (index_dir/"Packages").read_text()
+    assert "Package: hello\n" in packages
+    assert "Filename: "+path_to_deb.lstrip("/")+"\n" in packages
+    assert "Size: "+str(os.path.getsize(path_to_deb)) in packages
+    assert make_sources_line(str(index_dir)) == (
+        "deb [trusted=yes] file:/ "+str(index_dir).lstrip("/")+"/\n"
+    )
@@ -0,0 +1,120 @@
+"""
+This code tests the Downloader class, against a local stand-in for a real
+HTTP server.
+"""
+
+# Standard imports.
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Non-standard imports.
+import pytest
+
+# Local imports.
+from downloader import Downloader
+
+# Local constants.
+PAYLOAD = bytes(range(256))*1000
+ETAG = '"v1"'
+
+##################
+# HELPER CLASSES #
+##################
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Serves PAYLOAD, honouring conditional and range requests, and
+    recording what it was asked for. """
+    requests_seen = []
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+    def send_payload(self, with_body):
+        """ Send the payload, or as much of it as was asked for. """
+        self.requests_seen.append((self.command, dict(self.headers)))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and (self.headers.get("If-Range") == ETAG):
+            start = int(range_header.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header(
+                "Content-Range",
+                "bytes "+str(start)+"-"+str(len(PAYLOAD)-1)+"/"+
+                str(len(PAYLOAD))
+            )
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """ Handle a GET request. """
+        self.send_payload(True)
+
+    def do_HEAD(self): # pylint: disable=invalid-name
+        """ Handle a HEAD request. """
+        self.send_payload(False)
+
+############
+# FIXTURES #
+############
+
+@pytest.fixture(name="url")
+def fixture_url():
+    """ Run the stand-in server for the duration of a test. """
+    StandInHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:"+str(server.server_port)+"/package.deb"
+    server.shutdown()
+    server.server_close()
+
+###########
+# TESTING #
+###########
+
+def test_download_and_reuse(tmp_path, url):
+    """ Check that we download the file intact, and that a second fetch
+    reuses the cached copy after a single conditional HEAD request. """
+    downloader = Downloader(path_to_cache=str(tmp_path), chunk_size=4096)
+    sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+    path_to = downloader.fetch(url, expected_sha256=sha256)
+    assert path_to.endswith(os.path.join(sha256, "package.deb"))
+    with open(path_to, "rb") as downloaded:
+        assert downloaded.read() == PAYLOAD
+    StandInHandler.requests_seen = []
+    assert downloader.fetch(url) == path_to
+    assert [item[0] for item in StandInHandler.requests_seen] == ["HEAD"]
+
+def test_resume(tmp_path, url):
+    """ Check that an interrupted download picks up where it left off. """
+    downloader = Downloader(path_to_cache=str(tmp_path))
+    path_to_partial, path_to_metadata = downloader.get_partial_paths(url)
+    os.makedirs(os.path.dirname(path_to_partial))
+    with open(path_to_partial, "wb") as partial:
+        partial.write(PAYLOAD[:1000])
+    with open(path_to_metadata, "w", encoding="utf-8") as metadata:
+        metadata.write('{"validator": "\\"v1\\"", "etag": "\\"v1\\""}')
+    path_to = downloader.fetch(url)
+    with open(path_to, "rb") as downloaded:
+        assert downloaded.read() == PAYLOAD
+    _, headers = StandInHandler.requests_seen[0]
+    assert headers["Range"] == "bytes=1000-"
+
+def test_integrity_check(tmp_path, url):
+    """ Check that a download which doesn't match the expected hash is
+    thrown away. """
+    downloader = Downloader(path_to_cache=str(tmp_path))
+    assert downloader.fetch(url, expected_sha256="0"*64) is None
+    assert not os.path.exists(os.path.join(str(tmp_path), "objects"))
@@ -0,0 +1,64 @@
+"""
+This code tests the Fleet class.
+"""
+
+# Standard imports.
+import sys
+import time
+
+# Local imports.
+from async_runner import AsyncCommandRunner
+from fleet import Fleet, LocalTransport
+
+# Local constants.
+STAND_IN_SCRIPT = """
+import json, sys, time
+arguments = sys.argv[1:]
+thunderbird_num = arguments[arguments.index("--thunderbird-num")+1]
+time.sleep(0.5)
+if thunderbird_num == "3":
+    sys.exit("No route to host")
+failure_log = ["Change wallpaper"] if thunderbird_num == "2" else []
+report = {
+    "passed": True,
+    "with_flying_colours": not failure_log,
+    "failure_log": failure_log,
+    "this_os": arguments[arguments.index("--os")+1]
+}
+with open(arguments[arguments.index("--report")+1], "w") as report_file:
+    json.dump(report, report_file)
+"""
+
+###########
+# TESTING #
+###########
+
+def test_fleet(tmp_path):
+    """ Check that the hosts are provisioned at once, each with its own
+    overrides, and that the reports are combined, even for a host which never
+    sent one. """
+    transport = \
+        LocalTransport(
+            remote_command=(sys.executable, "-c", STAND_IN_SCRIPT),
+            path_to_report_dir=str(tmp_path),
+            runner=AsyncCommandRunner(path_to_log_dir=str(tmp_path/"logs"))
+        )
+    hosts = [
+        {
+            "host": "thunderbird"+str(index),
+            "thunderbird_num": index,
+            "this_os": "raspbian" if index == 4 else "ubuntu"
+        }
+        for index in range(1, 5)
+    ]
+    fleet = Fleet(hosts, transport=transport, max_hosts=4)
+    start = time.perf_counter()
+    assert not fleet.run()
+    assert time.perf_counter()-start < 1.5
+    assert fleet.reports["thunderbird1"]["with_flying_colours"]
+    assert fleet.reports["thunderbird2"]["failure_log"] == ["Change wallpaper"]
+    assert fleet.reports["thunderbird4"]["this_os"] == "raspbian"
+    failed = fleet.reports["thunderbird3"]
+    assert not failed["passed"]
+    assert failed["failure_output"]["Run HMSS on thunderbird3"] == \
+        ["No route to host"]
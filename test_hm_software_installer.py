@@ -2,8 +2,18 @@
 This code tests the HMSoftwareInstaller class.
 """
 
+# Standard imports.
+import json
+import os
+import subprocess
+
 # Local imports.
+import hm_software_installer
+from fake_system import FakeSystem
 from hm_software_installer import HMSoftwareInstaller
+from prefetch import Prefetcher
+from step_history import StepHistory
+from venvs import check_venv_present, make_venv_arguments
 
 ###########
 # TESTING #
@@ -13,3 +23,668 @@ def test_run():
     """ Carry out a test run with the object. """
     installer_obj = HMSoftwareInstaller(test_run=True)
     assert installer_obj.run()
+
+def test_apt_batch(tmp_path):
+    """ Check that APT packages are installed in one transaction, and that,
+    if that fails, we fall back on installing them one at a time. """
+    system = FakeSystem(str(tmp_path))
+    installer_obj = \
+        HMSoftwareInstaller(minimal=False, **system.make_installer_fields())
+    calls = []
+    def run_apt(arguments):
+        calls.append(arguments)
+        return (len(arguments) == 5) and (arguments[-1] != "inkscape")
+    installer_obj.run_apt = run_apt
+    batch = installer_obj.make_apt_batch()
+    assert batch == installer_obj.make_apt_packages()
+    assert "inkscape" in batch
+    assert installer_obj.install_apt_batch()
+    assert calls[0] == ["sudo", "apt-get", "--yes", "install"]+batch
+    assert len(calls) == len(batch)+1
+    assert installer_obj.failure_log == ["Install inkscape via APT"]
+    assert not installer_obj.install_via_apt("inkscape")
+
+def test_own_repos_alongside_apt(tmp_path):
+    """ Check that, when the APT batch and our own repos run in one batch of
+    processes, the repos wait for the batch, and that, whether or not it
+    runs alongside, they leave installing their underpinnings to it, rather
+    than running APT alongside the other processes. """
+    system = FakeSystem(str(tmp_path))
+    installer_obj = \
+        HMSoftwareInstaller(minimal=False, **system.make_installer_fields())
+    batch_step = [
+        step for step in installer_obj.make_essentials()
+        if step["imperative"] == "Install APT packages"
+    ]
+    working_dir = os.getcwd()
+    try:
+        assert installer_obj.run_steps(
+            tuple(batch_step)+installer_obj.make_non_essentials()
+        )
+    finally:
+        os.chdir(working_dir)
+    installs = [
+        index for index, command in enumerate(system.commands_run)
+        if "nodejs" in command
+    ]
+    clones = [
+        index for index, command in enumerate(system.commands_run)
+        if (command[:2] == ["git", "clone"]) and
+        any(word.endswith("kingdom-of-cyprus") for word in command)
+    ]
+    assert len(installs) == 1
+    assert clones and (installs[0] < clones[0])
+    system = FakeSystem(str(tmp_path/"without_batch"))
+    installer_obj = \
+        HMSoftwareInstaller(minimal=False, **system.make_installer_fields())
+    try:
+        assert not installer_obj.run_steps(installer_obj.make_non_essentials())
+    finally:
+        os.chdir(working_dir)
+    assert not any("nodejs" in command for command in system.commands_run)
+    assert "Install own repos" in installer_obj.failure_log
+
+def test_install_own_repos(tmp_path):
+    """ Check that our own repos are cloned without changing directory, and
+    that each repo's installation arguments are what then gets run. """
+    installer_obj = \
+        HMSoftwareInstaller(
+            target_dir=str(tmp_path),
+            path_to_repo_cache=None
+        )
+    calls = []
+    def run_with_indulgence(arguments, cwd=None):
+        calls.append((arguments, cwd))
+        return True
+    installer_obj.run_with_indulgence = run_with_indulgence
+    working_dir = os.getcwd()
+    assert installer_obj.install_own_repos(("hgmj", "chancery"))
+    assert os.getcwd() == working_dir
+    hgmj_path = str(tmp_path/"hgmj")
+    assert (
+        ["git", "clone", installer_obj.make_git_url("hgmj"), hgmj_path],
+        None
+    ) in calls
+    assert (["sh", "install_3rd_party"], hgmj_path) in calls
+    assert len(calls) == 3
+
+def test_install_pip_packages():
+    """ Check that PIP is run just once, and only for what we don't have. """
+    installer_obj = HMSoftwareInstaller(path_to_venv_dir=None)
+    calls = []
+    def run_with_indulgence(arguments):
+        calls.append(arguments)
+        return True
+    installer_obj.run_with_indulgence = run_with_indulgence
+    installer_obj.PIP_PACKAGES = (
+        { "name": "PyTest", "operator": ">=", "version": "1.0" },
+        { "name": "no-such-package", "operator": None, "version": None },
+        { "name": "pytest", "operator": "<", "version": "1.0" }
+    )
+    assert installer_obj.install_pip_packages()
+    assert calls == [["pip3", "install", "no-such-package", "pytest<1.0"]]
+
+def test_resume(tmp_path):
+    """ Check that a resumed run skips a step which was completed with the
+    same inputs, but reruns it if they've changed. """
+    calls = []
+    def method():
+        calls.append(1)
+        return True
+    item = {
+        "imperative": "Do something",
+        "gerund": "Doing something",
+        "method": method,
+        "inputs": { "thing": 1 }
+    }
+    path_to_journal = str(tmp_path/"journal.json")
+    installer_obj = \
+        HMSoftwareInstaller(
+            path_to_journal=path_to_journal,
+            path_to_history=None
+        )
+    assert installer_obj.run_steps((item,))
+    resumed_obj = \
+        HMSoftwareInstaller(
+            path_to_journal=path_to_journal,
+            path_to_history=None,
+            resume=True
+        )
+    assert resumed_obj.run_steps((item,))
+    assert len(calls) == 1
+    item["inputs"] = { "thing": 2 }
+    assert resumed_obj.run_steps((item,))
+    assert len(calls) == 2
+
+def test_trace(tmp_path):
+    """ Check that a traced run leaves behind a timeline of its steps. """
+    path_to_trace = str(tmp_path/"trace.json")
+    installer_obj = \
+        HMSoftwareInstaller(
+            test_run=True,
+            path_to_journal=str(tmp_path/"journal.json"),
+            path_to_trace=path_to_trace
+        )
+    installer_obj.run()
+    with open(path_to_trace, "r", encoding="utf-8") as trace_file:
+        events = json.load(trace_file)["traceEvents"]
+    steps = [event for event in events if event.get("cat") == "step"]
+    assert steps[0]["name"] == "Check OS"
+    assert steps[0]["args"]["parent"] == "Run"
+    assert all(event["ph"] in ("X", "M") for event in events)
+
+def test_run_against_fake_system(tmp_path):
+    """ Check that a full run against a fake system passes, and that running
+    again does much less. """
+    system = FakeSystem(str(tmp_path))
+    working_dir = os.getcwd()
+    try:
+        installer_obj = \
+            HMSoftwareInstaller(
+                minimal=False,
+                jobs=4,
+                **system.make_installer_fields()
+            )
+        assert installer_obj.run()
+        assert installer_obj.failure_log == []
+        assert os.path.isdir(str(tmp_path/"home"/"hgmj"/".git"))
+        path_to_venv = installer_obj.get_venv_path("hgmj")
+        assert check_venv_present(path_to_venv)
+        assert (
+            make_venv_arguments(path_to_venv, ["sh", "install_3rd_party"])
+            in system.commands_run
+        )
+        first_count = system.command_count
+        rerun_obj = \
+            HMSoftwareInstaller(
+                minimal=False,
+                **system.make_installer_fields()
+            )
+        assert rerun_obj.run()
+        assert rerun_obj.failure_log == []
+        assert system.command_count-first_count < first_count/2
+    finally:
+        os.chdir(working_dir)
+
+def test_plan(tmp_path):
+    """ Check that the plan for a fresh machine lists what a real run does,
+    dependencies and download size included, and that the plan after a real
+    run is empty. """
+    system = FakeSystem(str(tmp_path))
+    os.makedirs(system.get_apt_lists_dir())
+    path_to_list = \
+        os.path.join(system.get_apt_lists_dir(), "archive_main_Packages")
+    with open(path_to_list, "w", encoding="utf-8") as list_file:
+        list_file.write(
+            "Package: nodejs\nVersion: 1.0\nDepends: libnode (>= 1.0)\n"+
+            "Filename: pool/n/nodejs_1.0_amd64.deb\nSize: 1000\n\n"+
+            "Package: libnode\nVersion: 1.0\nDepends: libc6 | musl\n"+
+            "Filename: pool/l/libnode_1.0_amd64.deb\nSize: 24\n"
+        )
+    os.makedirs(system.get_wallpaper_dir(), exist_ok=True)
+    working_dir = os.getcwd()
+    try:
+        fields = system.make_installer_fields()
+        plan = HMSoftwareInstaller(minimal=False, **fields).make_plan()
+        assert system.command_count == 0
+        assert "nodejs" in plan.apt_packages
+        assert plan.apt_dependencies == ["libnode"]
+        assert plan.download_bytes == 1024
+        assert "hgmj" in plan.repos
+        assert plan.pip_requirements
+        assert len(plan.credential_writes) == 4
+        assert plan.wallpaper
+        assert not plan.check_empty()
+        assert HMSoftwareInstaller(minimal=False, **fields).run()
+        plan = HMSoftwareInstaller(minimal=False, **fields).make_plan()
+        assert plan.check_empty()
+    finally:
+        os.chdir(working_dir)
+
+def test_prefetch(tmp_path):
+    """ Check that the packages a run needs are downloaded, dependencies
+    included, before APT is asked to install them, that APT is pointed at
+    them, and that they're thrown away once the run has passed. """
+    system = FakeSystem(str(tmp_path))
+    os.makedirs(system.get_apt_lists_dir())
+    path_to_list = \
+        os.path.join(system.get_apt_lists_dir(), "archive_main_Packages")
+    with open(path_to_list, "w", encoding="utf-8") as list_file:
+        list_file.write(
+            "Package: nodejs\nVersion: 1.0\nDepends: libnode\n\n"+
+            "Package: libnode\nVersion: 1.0\n"
+        )
+    fields = system.make_installer_fields()
+    working_dir = os.getcwd()
+    try:
+        installer_obj = HMSoftwareInstaller(minimal=False, **fields)
+        assert installer_obj.run()
+        download = ["apt-get", "download", "nodejs", "libnode"]
+        assert download in system.commands_run
+        option = \
+            "Dir::Cache::archives="+ \
+            os.path.join(fields["path_to_prefetch_dir"], "apt")
+        install = [
+            command for command in system.commands_run
+            if ("install" in command) and ("nodejs" in command)
+        ][0]
+        assert install[3:5] == ["-o", option]
+        assert (
+            system.commands_run.index(download) <
+            system.commands_run.index(install)
+        )
+        assert not installer_obj.prefetcher.list_debs()
+        # Starting to prefetch needs neither APT nor the network.
+        count = system.command_count
+        unprefetched_obj = HMSoftwareInstaller(prefetch=False, **fields)
+        assert unprefetched_obj.start_prefetching()
+        assert system.command_count == count
+        # A batch which can't be worked out is installed online instead.
+        prefetcher = Prefetcher(system.run_capturing)
+        prefetcher.add_apt_batch("apt", lambda: {}["nodejs"])
+        assert not prefetcher.wait("apt")
+        prefetcher.close()
+    finally:
+        os.chdir(working_dir)
+
+def test_wait_for_apt_lock(tmp_path):
+    """ Check that, if someone else holds the DPKG lock when we start, we
+    wait for them, rather than failing. """
+    system = FakeSystem(str(tmp_path), external_lock_seconds=0.5)
+    working_dir = os.getcwd()
+    try:
+        installer_obj = \
+            HMSoftwareInstaller(
+                apt_lock_poll_interval=0.1,
+                **system.make_installer_fields()
+            )
+        assert installer_obj.run()
+        assert installer_obj.failure_log == []
+        update = ["sudo", "apt-get", "--yes", "update"]
+        assert system.commands_run.count(update) == 2
+    finally:
+        os.chdir(working_dir)
+
+def test_count_many_upgrades(tmp_path):
+    """ Check that we can still count the upgrades when APT's summary has
+    long since left the tail of its output. """
+    system = FakeSystem(str(tmp_path), pending_upgrades=150)
+    installer_obj = HMSoftwareInstaller(**system.make_installer_fields())
+    command_result = \
+        system.run_capturing(["apt-get", "--simulate", "upgrade"])
+    assert not any("upgraded" in line for line in command_result.tail)
+    assert installer_obj.check_apt_upgrade_needed()
+    assert installer_obj.report["apt_upgrade"] == {
+        "run": True,
+        "packages": 150
+    }
+
+def test_skip_apt_update(tmp_path):
+    """ Check that a second run skips updating APT's lists, and skips
+    upgrading when there's nothing to upgrade, but updates again if the
+    sources change, and that these decisions make it into the report. """
+    system = FakeSystem(str(tmp_path), pending_upgrades=3)
+    fields = system.make_installer_fields()
+    update = ["sudo", "apt-get", "--yes", "update"]
+    upgrade = ["sudo", "apt-get", "--yes", "upgrade"]
+    working_dir = os.getcwd()
+    try:
+        first_obj = HMSoftwareInstaller(**fields)
+        assert first_obj.run()
+        assert first_obj.report["apt_update"]["run"]
+        assert first_obj.report["apt_upgrade"]["packages"] == 3
+        assert system.commands_run.count(upgrade) == 1
+        second_obj = HMSoftwareInstaller(**fields)
+        assert second_obj.run()
+        assert not second_obj.report["apt_update"]["run"]
+        assert not second_obj.report["apt_upgrade"]["run"]
+        assert system.commands_run.count(update) == 1
+        assert system.commands_run.count(upgrade) == 1
+        os.makedirs(fields["path_to_apt_sources_dir"])
+        path_to_sources = \
+            os.path.join(fields["path_to_apt_sources_dir"], "extra.list")
+        with open(path_to_sources, "w", encoding="utf-8") as sources_file:
+            sources_file.write("deb http://example.com/ stable main\n")
+        third_obj = HMSoftwareInstaller(**fields)
+        assert third_obj.run()
+        assert third_obj.report["apt_update"] == {
+            "run": True,
+            "reason": "sources changed since the last update"
+        }
+    finally:
+        os.chdir(working_dir)
+
+def test_choose_wallpaper(tmp_path):
+    """ Check that the wallpaper set is the variant which fits the display,
+    that a hosted variant is fetched only if we haven't got it, and that the
+    source is fetched only when no variant fits. """
+    system = FakeSystem(str(tmp_path), display_resolution=(1280, 720))
+    wallpaper_dir = system.get_wallpaper_dir()
+    manifest = {
+        "sources": [{
+            "filename": "wallpaper_t1.png",
+            "thunderbird_num": 1,
+            "sha256": "0"*64,
+            "url": "https://example.com/wallpaper_t1.png"
+        }],
+        "variants": [{
+            "source": "wallpaper_t1.png",
+            "filename": "variants/wallpaper_t1_1280x720.jpg",
+            "width": 1280,
+            "height": 720
+        }, {
+            "source": "wallpaper_t1.png",
+            "filename": "variants/wallpaper_t1_1920x1080.jpg",
+            "width": 1920,
+            "height": 1080,
+            "size": 1000,
+            "sha256": "1"*64,
+            "url": "https://example.com/variants/wallpaper_t1_1920x1080.jpg"
+        }, {
+            "source": "wallpaper_t1.png",
+            "filename": "variants/wallpaper_t1_2560x1440.jpg",
+            "width": 2560,
+            "height": 1440
+        }]
+    }
+    with open(
+        os.path.join(wallpaper_dir, "manifest.json"),
+        "w",
+        encoding="utf-8"
+    ) as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.makedirs(os.path.join(wallpaper_dir, "variants"))
+    with open(
+        os.path.join(wallpaper_dir, "variants", "wallpaper_t1_1280x720.jpg"),
+        "wb"
+    ):
+        pass
+    installer_obj = \
+        HMSoftwareInstaller(
+            thunderbird_num=1,
+            minimal=False,
+            **system.make_installer_fields()
+        )
+    key = (installer_obj.BACKGROUND_SCHEMA, "picture-uri")
+    assert installer_obj.change_wallpaper()
+    assert system.settings[key].endswith("wallpaper_t1_1280x720.jpg")
+    assert system.download_count == 0
+    system.display_resolution = (1920, 1080)
+    plan = installer_obj.make_plan()
+    assert plan.downloads[-1] == manifest["variants"][1]["url"]
+    assert "variants/wallpaper_t1_1920x1080.jpg" not in plan.unsized
+    assert installer_obj.change_wallpaper()
+    assert system.settings[key].endswith("wallpaper_t1_1920x1080.jpg")
+    assert system.download_count == 1
+    # The biggest variant is neither here nor hosted.
+    system.display_resolution = (2560, 1440)
+    plan = installer_obj.make_plan()
+    assert plan.downloads[-1] == "https://example.com/wallpaper_t1.png"
+    assert installer_obj.change_wallpaper()
+    assert system.settings[key].endswith("wallpaper_t1.png")
+    assert system.download_count == 2
+    assert system.command_count == 0
+
+def test_wallpaper_falls_back_on_source(tmp_path, monkeypatch):
+    """ Check that, when no variant is chosen, the source image we've got is
+    set, and nothing is fetched. """
+    system = FakeSystem(str(tmp_path), display_resolution=(1280, 720))
+    wallpaper_dir = system.get_wallpaper_dir()
+    manifest = {
+        "sources": [{
+            "filename": "wallpaper_t1.png",
+            "thunderbird_num": 1,
+            "sha256": "0"*64,
+            "url": None
+        }],
+        "variants": [{
+            "source": "wallpaper_t1.png",
+            "filename": "variants/wallpaper_t1_1280x720.jpg",
+            "width": 1280,
+            "height": 720
+        }]
+    }
+    with open(
+        os.path.join(wallpaper_dir, "manifest.json"),
+        "w",
+        encoding="utf-8"
+    ) as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.makedirs(os.path.join(wallpaper_dir, "variants"))
+    for filename in ("wallpaper_t1.png", "variants/wallpaper_t1_1280x720.jpg"):
+        with open(os.path.join(wallpaper_dir, filename), "wb"):
+            pass
+    monkeypatch.setattr(
+        hm_software_installer,
+        "choose_variant",
+        lambda manifest, source, resolution=None: None
+    )
+    installer_obj = \
+        HMSoftwareInstaller(
+            thunderbird_num=1,
+            minimal=False,
+            **system.make_installer_fields()
+        )
+    assert installer_obj.change_wallpaper()
+    key = (installer_obj.BACKGROUND_SCHEMA, "picture-uri")
+    assert system.settings[key].endswith("/wallpaper_t1.png")
+    assert system.download_count == 0
+
+def test_pcmanfm_wallpaper(tmp_path):
+    """ Check that, on Raspbian, the wallpaper is set by editing PCManFM's
+    configuration, and that nothing is written, or run, if it's already
+    set. """
+    system = FakeSystem(str(tmp_path))
+    path_to_pcmanfm_config = str(tmp_path/"desktop-items-0.conf")
+    with open(path_to_pcmanfm_config, "w", encoding="utf-8") as config_file:
+        config_file.write("[*]\nwallpaper_mode=crop\nwallpaper=/old.png\n")
+    installer_obj = \
+        HMSoftwareInstaller(
+            path_to_pcmanfm_config=path_to_pcmanfm_config,
+            **dict(system.make_installer_fields(), this_os="raspbian")
+        )
+    assert not installer_obj.check_wallpaper_set()
+    assert installer_obj.change_wallpaper()
+    with open(path_to_pcmanfm_config, "r", encoding="utf-8") as config_file:
+        assert config_file.read() == (
+            "[*]\nwallpaper_mode=crop\nwallpaper="+
+            installer_obj.get_source_wallpaper_path()+"\n"
+        )
+    assert system.commands_run == [["pcmanfm", "--reconfigure"]]
+    assert installer_obj.check_wallpaper_set()
+    assert installer_obj.change_wallpaper()
+    assert system.command_count == 1
+
+def test_update_repos(tmp_path):
+    """ Check that updating our repos fast-forwards the clean ones, reruns
+    installation scripts only if they've changed, and reports, without being
+    held up by, a repo which is dirty or has diverged. """
+    system = FakeSystem(str(tmp_path))
+    fields = system.make_installer_fields()
+    working_dir = os.getcwd()
+    try:
+        for repo_name in ("hgmj", "chancery-b", "chancery", "hmss"):
+            repo_path = tmp_path/"home"/repo_name
+            os.makedirs(str(repo_path/".git"))
+            (repo_path/"install_3rd_party").write_text("", encoding="utf-8")
+        system.upstreams = {
+            "hgmj": { "behind": 2, "changed": ["install_3rd_party"] },
+            "chancery-b": { "behind": 1, "changed": ["README.md"] },
+            "chancery": { "behind": 1, "dirty": True },
+            "hmss": { "ahead": 1, "behind": 1 }
+        }
+        installer_obj = HMSoftwareInstaller(update_repos=True, **fields)
+        assert installer_obj.run()
+        assert installer_obj.report["repos"] == {
+            "hmss": "diverged",
+            "kingdom-of-cyprus": "not cloned",
+            "chancery": "dirty",
+            "chancery-b": "updated",
+            "hgmj": "updated and reinstalled"
+        }
+        assert installer_obj.failure_log == [
+            "Update hmss (diverged)", "Update chancery (dirty)"
+        ]
+        assert system.commands_run.count(["sh", "install_3rd_party"]) == 1
+        # A repo may name its install scripts without having any installation
+        # arguments to run.
+        system.upstreams["chancery"] = \
+            { "behind": 1, "changed": ["install_3rd_party"] }
+        repo = { "name": "chancery", "install_scripts": ["install_3rd_party"] }
+        assert installer_obj.update_own_repo(repo) == "updated"
+        assert not any(
+            command[:2] == ["sudo", "apt-get"]
+            for command in system.commands_run
+        )
+    finally:
+        os.chdir(working_dir)
+
+def commit_file(work_path, filename):
+    """ Commit a new file to a working repo. """
+    with open(
+        os.path.join(work_path, filename),
+        "w",
+        encoding="utf-8"
+    ) as new_file:
+        new_file.write(filename+"\n")
+    git = ["git", "-C", work_path, "-c", "user.name=T", "-c", "user.email=t@t"]
+    subprocess.run(git+["add", filename], check=True)
+    subprocess.run(git+["commit", "--quiet", "-m", filename], check=True)
+
+def test_repo_cache(tmp_path):
+    """ Check that own repos are cloned via a mirror in the cache, which a
+    second computer's clone refreshes, and that the clones don't depend on
+    the cache afterwards. """
+    work_path = str(tmp_path/"work")
+    path_to_remote = str(tmp_path/"github"/"someone"/"hgmj.git")
+    subprocess.run(["git", "init", "--quiet", work_path], check=True)
+    commit_file(work_path, "README.md")
+    subprocess.run(
+        ["git", "clone", "--bare", "--quiet", work_path, path_to_remote],
+        check=True
+    )
+    path_to_repo_cache = str(tmp_path/"shared"/"mirrors")
+    def make_installer(target_dir):
+        result = \
+            HMSoftwareInstaller(
+                target_dir=target_dir,
+                git_username="someone",
+                path_to_repo_cache=path_to_repo_cache
+            )
+        result.GIT_URL_STEM = (tmp_path/"github").as_uri()+"/"
+        return result
+    first_obj = make_installer(str(tmp_path/"first"))
+    assert first_obj.install_own_repo("hgmj")
+    mirror_path = first_obj.get_mirror_path("hgmj")
+    assert os.path.isfile(os.path.join(mirror_path, "HEAD"))
+    commit_file(work_path, "NEWS")
+    subprocess.run(
+        ["git", "-C", work_path, "push", "--quiet", path_to_remote, "HEAD"],
+        check=True
+    )
+    second_obj = make_installer(str(tmp_path/"second"))
+    assert second_obj.install_own_repo("hgmj")
+    assert os.path.isfile(str(tmp_path/"second"/"hgmj"/"NEWS"))
+    log = \
+        subprocess.run(
+            ["git", "--git-dir", mirror_path, "log", "--oneline", "--all"],
+            stdout=subprocess.PIPE,
+            check=True
+        )
+    assert b"NEWS" in log.stdout
+    for clone_dir in ("first", "second"):
+        path_to_alternates = \
+            tmp_path/clone_dir/"hgmj"/".git"/"objects"/"info"/"alternates"
+        assert not os.path.exists(str(path_to_alternates))
+
+def test_sparse_clone(tmp_path):
+    """ Check that a repo with clone options is cloned without the contents
+    of the files it doesn't check out, or a mirror, and that it can still be
+    brought up to date afterwards. """
+    work_path = str(tmp_path/"work")
+    path_to_remote = str(tmp_path/"github"/"someone"/"hmss.git")
+    subprocess.run(["git", "init", "--quiet", work_path], check=True)
+    os.makedirs(os.path.join(work_path, "wallpaper"))
+    for filename in (
+        "README.md",
+        "wallpaper/manifest.json",
+        "wallpaper/wallpaper_t1.png",
+        "wallpaper/wallpaper_t2.png"
+    ):
+        commit_file(work_path, filename)
+    subprocess.run(
+        ["git", "clone", "--bare", "--quiet", work_path, path_to_remote],
+        check=True
+    )
+    subprocess.run(
+        [
+            "git", "--git-dir", path_to_remote, "config",
+            "uploadpack.allowFilter", "true"
+        ],
+        check=True
+    )
+    installer_obj = \
+        HMSoftwareInstaller(
+            target_dir=str(tmp_path/"target"),
+            thunderbird_num=2,
+            git_username="someone",
+            path_to_repo_cache=str(tmp_path/"mirrors"),
+            path_to_venv_dir=None
+        )
+    installer_obj.GIT_URL_STEM = (tmp_path/"github").as_uri()+"/"
+    repo = installer_obj.OWN_REPOS[0]
+    assert installer_obj.install_own_repo(
+        "hmss",
+        clone_options=repo["clone_options"]
+    )
+    repo_path = tmp_path/"target"/"hmss"
+    for filename in (
+        "README.md",
+        "wallpaper/manifest.json",
+        "wallpaper/wallpaper_t2.png"
+    ):
+        assert os.path.isfile(str(repo_path/filename))
+    assert not os.path.exists(str(repo_path/"wallpaper"/"wallpaper_t1.png"))
+    assert not os.path.exists(str(tmp_path/"mirrors"))
+    promisor = \
+        subprocess.run(
+            ["git", "-C", str(repo_path), "config", "remote.origin.promisor"],
+            stdout=subprocess.PIPE,
+            check=True
+        )
+    assert promisor.stdout.strip() == b"true"
+    commit_file(work_path, "NEWS")
+    subprocess.run(
+        ["git", "-C", work_path, "push", "--quiet", path_to_remote, "HEAD"],
+        check=True
+    )
+    assert installer_obj.update_own_repo(repo) == "updated"
+    assert os.path.isfile(str(repo_path/"NEWS"))
+    assert not os.path.exists(str(repo_path/"wallpaper"/"wallpaper_t1.png"))
+
+def test_eta(tmp_path, capsys):
+    """ Check that a run records how long its steps took, and that the next
+    run uses that to say how long each step, and the run, has left. """
+    system = FakeSystem(str(tmp_path))
+    fields = system.make_installer_fields()
+    working_dir = os.getcwd()
+    try:
+        first_obj = HMSoftwareInstaller(**fields)
+        assert first_obj.run()
+        assert "Whole run (minimal)" in first_obj.report["step_times"]
+        assert "usually" not in capsys.readouterr().out
+        assert HMSoftwareInstaller(**fields).run()
+        output = capsys.readouterr().out
+        assert "Checking OS... (usually 0 s; about 0 s left in all)" in output
+        # Each step's timing is written as soon as it finishes, so a run
+        # which is cut short still keeps them.
+        cut_short_obj = HMSoftwareInstaller(**fields)
+        assert cut_short_obj.run_essentials()
+        history = StepHistory(fields["path_to_history"])
+        runs = {
+            step["imperative"]: step["runs"] for step in history.make_stats()
+        }
+        assert runs["Check OS"] == 3
+        history.close()
+    finally:
+        os.chdir(working_dir)
@@ -0,0 +1,42 @@
+"""
+This code tests the LocalSystem class.
+"""
+
+# Standard imports.
+import subprocess
+import sys
+
+# Local imports.
+from local_system import LocalSystem
+
+# Local constants.
+HOLDER_SCRIPT = """
+import fcntl, sys, time
+with open(sys.argv[1], "w") as lock_file:
+    fcntl.lockf(lock_file, fcntl.LOCK_EX)
+    print("locked", flush=True)
+    time.sleep(30)
+"""
+
+###########
+# TESTING #
+###########
+
+def test_find_apt_lock_holder(tmp_path):
+    """ Check that we can tell which process holds a lock, and that we can
+    tell when nobody does. """
+    path_to_lock = str(tmp_path/"lock-frontend")
+    open(path_to_lock, "w", encoding="utf-8").close()
+    system = LocalSystem(paths_to_apt_locks=(path_to_lock,))
+    assert system.find_apt_lock_holder() is None
+    with subprocess.Popen(
+        [sys.executable, "-c", HOLDER_SCRIPT, path_to_lock],
+        stdout=subprocess.PIPE
+    ) as holder:
+        try:
+            assert holder.stdout.readline() == b"locked\n"
+            pid, name = system.find_apt_lock_holder()
+            assert pid == holder.pid
+            assert name
+        finally:
+            holder.kill()
@@ -0,0 +1,50 @@
+"""
+This code tests the PackageIndex class.
+"""
+
+# Standard imports.
+import os
+
+# Local imports.
+from package_index import PackageIndex
+
+# Local constants.
+DPKG_STATUS = """Package: gedit-plugins
+Status: install ok installed
+Architecture: amd64
+Version: 44.1-1
+Description: a set of plugins for gedit
+ with a continuation line: which isn't a field
+
+Package: inkscape
+Status: deinstall ok config-files
+Version: 1.2.2-2
+"""
+
+###########
+# TESTING #
+###########
+
+def test_package_index(tmp_path):
+    """ Check that the index picks up packages and commands, and notices new
+    commands when it's refreshed. """
+    path_to_status = tmp_path/"status"
+    path_to_status.write_text(DPKG_STATUS)
+    bin_dir = tmp_path/"bin"
+    bin_dir.mkdir()
+    index = \
+        PackageIndex(
+            path_to_dpkg_status=str(path_to_status),
+            search_path=str(bin_dir)
+        )
+    index.refresh()
+    assert index.check_package_installed("gedit-plugins")
+    assert index.check_package_installed("gedit-plugins:amd64")
+    assert not index.check_package_installed("inkscape")
+    assert not index.check_command_exists("sqlite3")
+    path_to_command = bin_dir/"sqlite3"
+    path_to_command.write_text("#!/bin/sh\n")
+    os.chmod(path_to_command, 0o755)
+    os.utime(bin_dir, (0, 0))
+    index.refresh()
+    assert index.check_command_exists("sqlite3")
@@ -0,0 +1,129 @@
+"""
+This code tests the Snapshot class.
+"""
+
+# Standard imports.
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+# Local imports.
+from fake_system import FakeSystem
+from hm_software_installer import HMSoftwareInstaller
+from snapshot import MANIFEST_NAME, SNAPSHOT_VERSION, Snapshot
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def add_member(archive, name, data=None, linkname=None):
+    """ Add a file, or a symlink, to an archive we're crafting. """
+    info = tarfile.TarInfo(name)
+    if linkname is not None:
+        info.type = tarfile.SYMTYPE
+        info.linkname = linkname
+        archive.addfile(info)
+        return
+    info.size = len(data)
+    archive.addfile(info, io.BytesIO(data))
+
+###########
+# TESTING #
+###########
+
+def test_export_and_restore(tmp_path):
+    """ Check that a computer restored from another's snapshot gets its repos
+    and Git configuration, and installs only the APT packages it lacks, and
+    that a corrupted snapshot is caught. """
+    path_to_snapshot = str(tmp_path/"snapshot.tar.gz")
+    source = FakeSystem(str(tmp_path/"source"))
+    target = FakeSystem(str(tmp_path/"target"))
+    working_dir = os.getcwd()
+    try:
+        source_obj = \
+            HMSoftwareInstaller(
+                minimal=False,
+                **source.make_installer_fields()
+            )
+        assert source_obj.run()
+        assert Snapshot(source_obj, path_to_snapshot).export()
+        assert oct(os.stat(path_to_snapshot).st_mode)[-3:] == "600"
+        target_fields = target.make_installer_fields()
+        target_obj = HMSoftwareInstaller(minimal=False, **target_fields)
+        assert Snapshot(target_obj, path_to_snapshot).restore()
+        assert os.path.isdir(str(tmp_path/"target"/"home"/"hgmj"/".git"))
+        assert os.path.isfile(target_fields["path_to_gitconfig"])
+        installs = [
+            command for command in target.commands_run
+            if command[:4] == ["sudo", "apt-get", "--yes", "install"]
+        ]
+        assert len(installs) == 1
+        assert "git" in installs[0]
+        with gzip.open(path_to_snapshot, "rb") as snapshot_file:
+            data = bytearray(snapshot_file.read())
+        index = data.index(b"[user]")
+        data[index+1:index+5] = b"USER"
+        with gzip.open(path_to_snapshot, "wb") as snapshot_file:
+            snapshot_file.write(bytes(data))
+        corrupted = Snapshot(target_obj, path_to_snapshot)
+        assert not corrupted.restore()
+        assert corrupted.failures == ["Verify home/gitconfig"]
+    finally:
+        os.chdir(working_dir)
+
+def test_restore_stays_inside(tmp_path):
+    """ Check that a crafted snapshot can't write, via a symlink of its own
+    or one already in place, outside of where it should. """
+    outside = tmp_path/"outside"
+    outside.mkdir()
+    (outside/"gitconfig").write_text("mine\n")
+    target = FakeSystem(str(tmp_path/"target"))
+    target_fields = target.make_installer_fields()
+    target_obj = HMSoftwareInstaller(minimal=False, **target_fields)
+    os.makedirs(
+        os.path.dirname(target_fields["path_to_gitconfig"]),
+        exist_ok=True
+    )
+    os.symlink(
+        str(outside/"gitconfig"),
+        target_fields["path_to_gitconfig"]
+    )
+    data = b"[user]\n"
+    files = [
+        { "name": "repos/a", "type": "symlink", "target": str(outside) },
+        {
+            "name": "repos/a/passwd",
+            "type": "file",
+            "mode": 0o644,
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest()
+        },
+        {
+            "name": "home/gitconfig",
+            "type": "file",
+            "mode": 0o644,
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest()
+        }
+    ]
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "apt_packages": [],
+        "pip_requirements": [],
+        "files": files
+    }
+    path_to_snapshot = str(tmp_path/"snapshot.tar.gz")
+    with tarfile.open(path_to_snapshot, mode="w:gz") as archive:
+        add_member(archive, MANIFEST_NAME, json.dumps(manifest).encode())
+        add_member(archive, "repos/a", linkname=str(outside))
+        add_member(archive, "repos/a/passwd", data)
+        add_member(archive, "home/gitconfig", data)
+    crafted = Snapshot(target_obj, path_to_snapshot)
+    assert not crafted.restore()
+    assert crafted.failures == ["Unsafe repos/a/passwd"]
+    assert not (outside/"passwd").exists()
+    assert (outside/"gitconfig").read_text() == "mine\n"
+    assert not os.path.islink(target_fields["path_to_gitconfig"])
@@ -0,0 +1,80 @@
+"""
+This code tests the StepHistory class.
+"""
+
+# Local imports.
+from step_history import (
+    HISTORY_WINDOW,
+    StepHistory,
+    format_duration,
+    get_percentile
+)
+
+###########
+# TESTING #
+###########
+
+def test_estimate(tmp_path):
+    """ Check that estimates go by this host, then this OS, then anywhere,
+    and ignore failures. """
+    history = StepHistory(str(tmp_path/"history.sqlite3"))
+    assert history.estimate("Install HGMJ", "ubuntu", "a") is None
+    history.record("Install HGMJ", 10, True, this_os="ubuntu", host="a")
+    history.record("Install HGMJ", 30, True, this_os="ubuntu", host="b")
+    history.record("Install HGMJ", 99, False, this_os="ubuntu", host="a")
+    history.record("Install HGMJ", 50, True, this_os="raspian", host="c")
+    history.flush()
+    # A run doesn't estimate from its own timings.
+    assert history.estimate("Install HGMJ", "ubuntu", "a") is None
+    history.close()
+    history = StepHistory(str(tmp_path/"history.sqlite3"))
+    assert history.estimate("Install HGMJ", "ubuntu", "a") == 10
+    assert history.estimate("Install HGMJ", "ubuntu", "z") == 10
+    assert history.estimate("Install HGMJ", "chrome-os", "z") == 30
+    assert history.estimate("Install HGMJ", "raspian", "c") == 50
+    assert history.estimate("Install HGMJ") == 30
+    assert history.estimate("Install Chancery", "ubuntu", "a") is None
+    history.close()
+
+def test_estimate_window(tmp_path):
+    """ Check that estimates go by only the most recent passes, both on each
+    host and on each OS. """
+    history = StepHistory(str(tmp_path/"history.sqlite3"))
+    for finished_at in range(HISTORY_WINDOW*2):
+        history.record(
+            "Install HGMJ",
+            100 if finished_at < HISTORY_WINDOW else 1,
+            True,
+            this_os="ubuntu",
+            host="ab"[finished_at%2],
+            finished_at=finished_at+1
+        )
+    history.close()
+    history = StepHistory(str(tmp_path/"history.sqlite3"))
+    assert history.estimate("Install HGMJ", "ubuntu", "a") == 1
+    assert history.estimate("Install HGMJ", "ubuntu", "z") == 1
+    assert history.estimate("Install HGMJ") == 1
+    history.close()
+
+def test_stats(tmp_path):
+    """ Check the timings summarised for each step. """
+    history = StepHistory(str(tmp_path/"history.sqlite3"))
+    for finished_at in range(20):
+        history.record(
+            "Install HGMJ",
+            finished_at+1,
+            True,
+            finished_at=finished_at+1
+        )
+    history.record("Install HGMJ", 1, False, finished_at=21)
+    stats = history.make_stats()
+    assert stats == [{
+        "imperative": "Install HGMJ",
+        "runs": 21,
+        "failures": 1,
+        "p50": 10,
+        "p95": 19,
+        "recent": 18
+    }]
+    assert get_percentile([], 0.5) is None
+    assert format_duration(95) == "1 min 35 s"
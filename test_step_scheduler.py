@@ -0,0 +1,103 @@
+"""
+This code tests the StepScheduler class.
+"""
+
+# Standard imports.
+import threading
+import time
+
+# Local imports.
+from step_scheduler import StepScheduler
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def make_step(imperative, outcome=True, depends_on=(), resources=(), log=None):
+    """ Make a step which records when it starts and finishes. """
+    def method():
+        if log is not None:
+            log.append(("start", imperative))
+        time.sleep(0.05)
+        if log is not None:
+            log.append(("end", imperative))
+        return outcome
+    result = {
+        "imperative": imperative,
+        "gerund": imperative,
+        "method": method,
+        "depends_on": depends_on,
+        "resources": resources
+    }
+    return result
+
+###########
+# TESTING #
+###########
+
+def test_dependencies_are_respected():
+    """ Check that a step doesn't start until its dependencies have passed. """
+    log = []
+    steps = (
+        make_step("b", depends_on=("a",), log=log),
+        make_step("a", log=log)
+    )
+    outcomes = StepScheduler(steps, jobs=4).run()
+    assert outcomes == {"a": True, "b": True}
+    assert log.index(("end", "a")) < log.index(("start", "b"))
+
+def test_independent_steps_overlap():
+    """ Check that independent steps actually run at the same time. """
+    active = []
+    peak = []
+    lock = threading.Lock()
+    def method():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return True
+    steps = tuple(
+        { "imperative": str(index), "gerund": "", "method": method }
+        for index in range(3)
+    )
+    StepScheduler(steps, jobs=3).run()
+    assert max(peak) == 3
+
+def test_resources_are_exclusive():
+    """ Check that two steps needing the same resource don't overlap. """
+    log = []
+    steps = (
+        make_step("a", resources=("apt",), log=log),
+        make_step("b", resources=("apt",), log=log)
+    )
+    StepScheduler(steps, jobs=2).run()
+    assert log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")]
+
+def test_stop_on_failure():
+    """ Check that no new steps start after a failure when asked to stop. """
+    steps = (make_step("a", outcome=False), make_step("b"))
+    scheduler = StepScheduler(steps, jobs=1, stop_on_failure=True)
+    assert scheduler.run() == {"a": False}
+
+def test_failed_dependency_skips_step():
+    """ Check that a step whose dependency failed is skipped and failed. """
+    steps = (make_step("a", outcome=False), make_step("b", depends_on=("a",)))
+    scheduler = StepScheduler(steps, jobs=2)
+    assert scheduler.run() == {"a": False, "b": False}
+    assert scheduler.skipped == ["b"]
+
+def test_on_finish():
+    """ Check that we're told as each step finishes, before any step which
+    depends on it starts. """
+    log = []
+    steps = (
+        make_step("b", depends_on=("a",), log=log),
+        make_step("a", outcome=False, log=log)
+    )
+    def on_finish(step, outcome):
+        log.append(("finish", step["imperative"], outcome))
+    StepScheduler(steps, jobs=2, on_finish=on_finish).run()
+    assert log == [("start", "a"), ("end", "a"), ("finish", "a", False)]
@@ -0,0 +1,56 @@
+"""
+This code tests the functions which derive one virtual environment from
+another.
+"""
+
+# Standard imports.
+import os
+import subprocess
+import sys
+
+# Local imports.
+from venvs import derive_venv, find_site_packages
+
+###########
+# TESTING #
+###########
+
+def test_derive_venv(tmp_path):
+    """ Check that a derived environment runs its own interpreter, sees the
+    base's packages without copying them, and that the base's console
+    scripts run under the derived environment. """
+    path_to_base = str(tmp_path/"base")
+    subprocess.run(
+        [sys.executable, "-m", "venv", "--without-pip", path_to_base],
+        check=True
+    )
+    base_site_packages = find_site_packages(path_to_base)
+    with open(
+        os.path.join(base_site_packages, "shared_thing.py"),
+        "w",
+        encoding="utf-8"
+    ) as module_file:
+        module_file.write("ANSWER = 42\n")
+    path_to_script = os.path.join(path_to_base, "bin", "where")
+    with open(path_to_script, "w", encoding="utf-8") as script_file:
+        script_file.write(
+            "#!"+os.path.join(path_to_base, "bin", "python")+"\n"+
+            "import shared_thing, sys\n"+
+            "print(sys.prefix, shared_thing.ANSWER)\n"
+        )
+    os.chmod(path_to_script, 0o755)
+    path_to_venv = str(tmp_path/"derived")
+    assert derive_venv(path_to_base, path_to_venv)
+    assert not os.path.exists(
+        os.path.join(find_site_packages(path_to_venv), "shared_thing.py")
+    )
+    output = \
+        subprocess.run(
+            [os.path.join(path_to_venv, "bin", "where")],
+            capture_output=True,
+            check=True,
+            text=True
+        ).stdout
+    assert output.split() == [path_to_venv, "42"]
+    assert derive_venv(path_to_base, path_to_venv)
+    assert not derive_venv(str(tmp_path/"no-base"), str(tmp_path/"other"))
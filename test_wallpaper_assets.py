@@ -0,0 +1,76 @@
+"""
+This code tests the functions which build and choose wallpaper variants.
+"""
+
+# Standard imports.
+import os
+
+# Non-standard imports.
+import pytest
+
+# Local imports.
+from wallpaper_assets import (
+    build_variants,
+    choose_variant,
+    find_source,
+    hash_file,
+    load_manifest
+)
+
+# Local constants.
+PATH_TO_WALLPAPER_DIR = \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "wallpaper")
+VARIANT_SIZES = ((1280, 720), (1366, 768), (1910, 1074))
+
+###########
+# TESTING #
+###########
+
+def test_choose_variant():
+    """ Check that we pick the smallest variant which covers the display,
+    and that we fall back on the source when nothing does. """
+    manifest = load_manifest(PATH_TO_WALLPAPER_DIR)
+    source = find_source(manifest, 1)
+    assert source["filename"] == "wallpaper_t1.png"
+    manifest["variants"] = [
+        {
+            "source": "wallpaper_t1.png",
+            "filename": "variants/wallpaper_t1_"+str(width)+"x"+str(height),
+            "width": width,
+            "height": height
+        }
+        for width, height in VARIANT_SIZES
+    ]
+    variant = choose_variant(manifest, source, (1366, 768))
+    assert (variant["width"], variant["height"]) == (1366, 768)
+    variant = choose_variant(manifest, source, (1920, 1080))
+    assert (variant["width"], variant["height"]) == (1910, 1074)
+    assert choose_variant(manifest, source, (2560, 1440)) is None
+    assert choose_variant(manifest, source)["width"] == 1910
+    assert find_source(manifest, 4)["filename"] == "wallpaper_t4_(phone).png"
+    assert find_source(manifest, 99)["filename"] == "default.jpg"
+
+def test_build_variants(tmp_path):
+    """ Check that variants are built at the sizes we want, and listed in the
+    manifest. """
+    image_module = pytest.importorskip("PIL.Image")
+    image = image_module.new("RGBA", (2000, 1000))
+    image.save(str(tmp_path/"wallpaper_t7.png"))
+    manifest = \
+        build_variants(
+            str(tmp_path),
+            resolutions=((1280, 720),),
+            url_stem="https://example.com/wallpaper/"
+        )
+    sizes = [
+        (variant["width"], variant["height"])
+        for variant in manifest["variants"]
+    ]
+    assert sizes == [(1440, 720), (2000, 1000)]
+    assert manifest["sources"][0]["thunderbird_num"] == 7
+    variant = manifest["variants"][0]
+    assert variant["url"] == \
+        "https://example.com/wallpaper/variants/wallpaper_t7_1440x720.jpg"
+    assert variant["sha256"] == \
+        hash_file(os.path.join(str(tmp_path), variant["filename"]))
+    assert load_manifest(str(tmp_path)) == manifest
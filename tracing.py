@@ -0,0 +1,117 @@
+"""
+This code defines a class which records what the installer does, and when, as
+a timeline in the Trace Event Format, which can be opened in Perfetto or
+chrome://tracing.
+"""
+
+# Standard imports.
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+# Local imports.
+from config import DEFAULT_ENCODING
+
+# Local constants.
+CURRENT_SPANS = contextvars.ContextVar("current_spans", default=())
+
+##############
+# MAIN CLASS #
+##############
+
+@dataclass
+class Tracer:
+    """ The class in question. """
+    # Fields.
+    events: list = field(default_factory=list)
+    thread_ids: dict = field(default_factory=dict)
+    started_at: float = field(default_factory=time.perf_counter)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def get_timestamp(self):
+        """ Get the number of microseconds since we started tracing. """
+        return (time.perf_counter()-self.started_at)*1e6
+
+    def get_thread_id(self):
+        """ Get a small, stable number for the current thread, and remember
+        its name. """
+        ident = threading.get_ident()
+        with self.lock:
+            if ident not in self.thread_ids:
+                self.thread_ids[ident] = \
+                    (len(self.thread_ids)+1, threading.current_thread().name)
+            return self.thread_ids[ident][0]
+
+    @contextmanager
+    def span(self, name, category, args=None):
+        """ Record the time spent inside this context as a complete event. The
+        caller may add to the yielded arguments dictionary as it goes. """
+        args = dict(args or {})
+        parents = CURRENT_SPANS.get()
+        if parents:
+            args["parent"] = parents[-1][0]
+        token = CURRENT_SPANS.set(parents+((name, category),))
+        thread_id = self.get_thread_id()
+        start = self.get_timestamp()
+        try:
+            yield args
+        finally:
+            CURRENT_SPANS.reset(token)
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": self.get_timestamp()-start,
+                "pid": os.getpid(),
+                "tid": thread_id,
+                "args": args
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def make_trace(self):
+        """ Make the trace as a dictionary, ready to be serialised. """
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": thread_id,
+                "args": { "name": thread_name }
+            }
+            for thread_id, thread_name in self.thread_ids.values()
+        ]
+        result = {
+            "traceEvents": metadata+self.events,
+            "displayTimeUnit": "ms"
+        }
+        return result
+
+    def save(self, path_to):
+        """ Write the trace to a JSON file. """
+        with self.lock:
+            trace = self.make_trace()
+        with open(path_to, "w", encoding=DEFAULT_ENCODING) as trace_file:
+            json.dump(trace, trace_file)
+
+####################
+# HELPER FUNCTIONS #
+####################
+
+def get_current_step():
+    """ Get the name of the innermost step span we're in, if any. """
+    for name, category in reversed(CURRENT_SPANS.get()):
+        if category == "step":
+            return name
+    return None
+
+def run_in_current_context(executor, function, *args, **kwargs):
+    """ Submit a function to an executor such that it runs in a copy of the
+    current context, so that any spans it records know their parent. """
+    context = contextvars.copy_context()
+    return executor.submit(context.run, function, *args, **kwargs)
@@ -0,0 +1,127 @@
+"""
+This code defines some functions which derive a Python virtual environment
+from a base environment, without copying anything the base already has: the
+derived environment shares the base's interpreter, and sees the base's
+packages via a .pth file, so that only its own extra requirements need
+installing into it.
+"""
+
+# Standard imports.
+import glob
+import os
+import re
+import shutil
+
+# Local imports.
+from config import DEFAULT_ENCODING
+
+# Local constants.
+BASE_PTH_FILENAME = "hmss-base.pth"
+INTERPRETER_PATTERN = re.compile(r"python[\d.]*$")
+VENV_CFG_FILENAME = "pyvenv.cfg"
+
+#############
+# FUNCTIONS #
+#############
+
+def check_venv_present(path_to_venv):
+    """ Check whether a virtual environment has been made at a given path.
+    The configuration file is the last thing we write, so a half-made
+    environment doesn't count. """
+    return os.path.isfile(os.path.join(path_to_venv, VENV_CFG_FILENAME))
+
+def find_site_packages(path_to_venv):
+    """ Find the site-packages directory of a virtual environment, or return
+    None if it hasn't got one. """
+    paths = \
+        sorted(
+            glob.glob(
+                os.path.join(path_to_venv, "lib", "python*", "site-packages")
+            )
+        )
+    if not paths:
+        return None
+    return paths[-1]
+
+def derive_file(path_to_source, path_to_destination, old, new):
+    """ Copy a file from the base into a derived environment, if it mentions
+    where the base lives, pointing it at the derived environment instead.
+    This is what makes the base's activate scripts, and the console scripts
+    of the base's packages, run under the derived environment. Return
+    whether we copied it. """
+    with open(path_to_source, "rb") as source_file:
+        data = source_file.read()
+    if old not in data:
+        return False
+    with open(path_to_destination, "wb") as destination_file:
+        destination_file.write(data.replace(old, new))
+    shutil.copymode(path_to_source, path_to_destination)
+    return True
+
+def derive_venv(path_to_base, path_to_venv):
+    """ Make a virtual environment which shares the base's interpreter and
+    packages. This touches a few dozen small files, rather than installing
+    anything, so it takes a fraction of a second. Return whether it worked. """
+    path_to_base = os.path.abspath(path_to_base)
+    path_to_venv = os.path.abspath(path_to_venv)
+    base_site_packages = find_site_packages(path_to_base)
+    if (not check_venv_present(path_to_base)) or (not base_site_packages):
+        return False
+    if os.path.lexists(path_to_venv):
+        if check_venv_present(path_to_venv):
+            return True
+        # Left over from an attempt which didn't finish.
+        shutil.rmtree(path_to_venv)
+    old = path_to_base.encode(DEFAULT_ENCODING)
+    new = path_to_venv.encode(DEFAULT_ENCODING)
+    site_packages = \
+        os.path.join(
+            path_to_venv,
+            os.path.relpath(base_site_packages, path_to_base)
+        )
+    os.makedirs(site_packages)
+    path_to_pth = os.path.join(site_packages, BASE_PTH_FILENAME)
+    with open(path_to_pth, "w", encoding=DEFAULT_ENCODING) as pth_file:
+        pth_file.write(base_site_packages+"\n")
+    for entry in os.scandir(path_to_base):
+        if entry.is_symlink():
+            os.symlink(
+                os.readlink(entry.path),
+                os.path.join(path_to_venv, entry.name)
+            )
+    bin_dir = os.path.join(path_to_venv, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    for entry in os.scandir(os.path.join(path_to_base, "bin")):
+        path_to_destination = os.path.join(bin_dir, entry.name)
+        if entry.is_symlink():
+            os.symlink(os.readlink(entry.path), path_to_destination)
+        elif INTERPRETER_PATTERN.match(entry.name):
+            # The base has a copy of the interpreter, rather than a link.
+            os.symlink(entry.path, path_to_destination)
+        elif entry.is_file():
+            derive_file(entry.path, path_to_destination, old, new)
+    with open(
+        os.path.join(path_to_base, VENV_CFG_FILENAME),
+        "rb"
+    ) as cfg_file:
+        data = cfg_file.read()
+    with open(
+        os.path.join(path_to_venv, VENV_CFG_FILENAME),
+        "wb"
+    ) as cfg_file:
+        cfg_file.write(data.replace(old, new))
+    return True
+
+def make_venv_arguments(path_to_venv, arguments):
+    """ Wrap a command so that it runs as if the virtual environment at a
+    given path had been activated, so that, for instance, a script which
+    runs "pip3 install" installs into that environment, rather than into the
+    system's Python. """
+    bin_dir = os.path.join(os.path.abspath(path_to_venv), "bin")
+    search_path = os.environ.get("PATH", os.defpath)
+    result = [
+        "env",
+        "VIRTUAL_ENV="+os.path.abspath(path_to_venv),
+        "PATH="+bin_dir+os.pathsep+search_path
+    ]+list(arguments)
+    return result
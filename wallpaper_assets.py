@@ -0,0 +1,277 @@
+"""
+This code defines a script which builds compressed variants of the wallpapers
+at common screen resolutions, along with a manifest listing them, and some
+functions with which the installer picks the variant which best fits this
+computer's display.
+
+Building the variants needs Pillow; picking one doesn't.
+"""
+
+# Standard imports.
+import argparse
+import hashlib
+import json
+import os
+import re
+
+# Non-standard imports.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Local imports.
+from config import (
+    DEFAULT_ENCODING,
+    DEFAULT_PATH_TO_WALLPAPER_DIR,
+    DEFAULT_WALLPAPER_QUALITY,
+    DEFAULT_WALLPAPER_RESOLUTIONS
+)
+
+# Local constants.
+FIT_TOLERANCE = 0.95 # I.e. a variant 5% short of the display still fits.
+MANIFEST_FILENAME = "manifest.json"
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+THUNDERBIRD_PATTERN = re.compile(r"wallpaper_t(\d+)")
+VARIANTS_DIRNAME = "variants"
+
+############
+# BUILDING #
+############
+
+def list_sources(path_to_wallpaper_dir):
+    """ List the source images in the wallpaper directory. """
+    result = []
+    for filename in sorted(os.listdir(path_to_wallpaper_dir)):
+        if os.path.splitext(filename)[1].lower() in SOURCE_EXTENSIONS:
+            result.append(filename)
+    return result
+
+def get_thunderbird_num(filename):
+    """ Get the Thunderbird number a given source image is for, or None if
+    it's the default. """
+    match = THUNDERBIRD_PATTERN.match(filename)
+    if match:
+        return int(match.group(1))
+    return None
+
+def hash_file(path_to):
+    """ Compute the SHA-256 of a file. """
+    sha256 = hashlib.sha256()
+    with open(path_to, "rb") as the_file:
+        for chunk in iter(lambda: the_file.read(1024*1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def make_variant_sizes(width, height, resolutions, include_own_size=True):
+    """ Work out the sizes to which to shrink an image so that it just covers
+    each of the given resolutions, keeping its aspect ratio, along with its
+    own size, if we're asked for it. We never enlarge anything. """
+    result = []
+    if include_own_size:
+        result.append((width, height))
+    for target_width, target_height in resolutions:
+        scale = max(target_width/width, target_height/height)
+        if scale >= 1:
+            continue
+        size = (round(width*scale), round(height*scale))
+        if size not in result:
+            result.append(size)
+    return sorted(result)
+
+def save_variant(image, size, path_to_variant, quality):
+    """ Save a shrunken, flattened, JPEG copy of an image. """
+    variant = image
+    if variant.mode != "RGB":
+        background = Image.new("RGB", variant.size)
+        if "A" in variant.getbands():
+            background.paste(variant, mask=variant.getchannel("A"))
+        else:
+            background.paste(variant)
+        variant = background
+    if variant.size != size:
+        variant = variant.resize(size, Image.LANCZOS)
+    variant.save(
+        path_to_variant,
+        "JPEG",
+        quality=quality,
+        optimize=True,
+        progressive=True
+    )
+
+def make_url(url_stem, filename):
+    """ Make the URL at which a given file in the wallpaper directory is
+    hosted, or return None if it isn't. """
+    if not url_stem:
+        return None
+    result = url_stem.rstrip("/")+"/"+filename
+    return result
+
+def build_variants(
+        path_to_wallpaper_dir=DEFAULT_PATH_TO_WALLPAPER_DIR,
+        resolutions=DEFAULT_WALLPAPER_RESOLUTIONS,
+        quality=DEFAULT_WALLPAPER_QUALITY,
+        url_stem=None
+    ):
+    """ Build the variants of every source image, and write the manifest.
+    The variants are build outputs, to be hosted at release time rather than
+    committed, so, if we're given the URL at which the wallpaper directory is
+    hosted, the manifest records where to fetch each image from, along with
+    its hash. """
+    if Image is None:
+        raise RuntimeError("Pillow is needed to build wallpaper variants")
+    variants_dir = os.path.join(path_to_wallpaper_dir, VARIANTS_DIRNAME)
+    os.makedirs(variants_dir, exist_ok=True)
+    manifest = { "sources": [], "variants": [] }
+    for filename in list_sources(path_to_wallpaper_dir):
+        path_to_source = os.path.join(path_to_wallpaper_dir, filename)
+        with Image.open(path_to_source) as image:
+            image.load()
+            width, height = image.size
+            stem = os.path.splitext(filename)[0]
+            # Re-encoding a JPEG at the same size would gain nothing.
+            sizes = \
+                make_variant_sizes(
+                    width,
+                    height,
+                    resolutions,
+                    include_own_size=(image.format != "JPEG")
+                )
+            for size in sizes:
+                variant_filename = \
+                    stem+"_"+str(size[0])+"x"+str(size[1])+".jpg"
+                path_to_variant = os.path.join(variants_dir, variant_filename)
+                save_variant(image, size, path_to_variant, quality)
+                manifest["variants"].append({
+                    "source": filename,
+                    "filename": VARIANTS_DIRNAME+"/"+variant_filename,
+                    "width": size[0],
+                    "height": size[1],
+                    "size": os.path.getsize(path_to_variant),
+                    "sha256": hash_file(path_to_variant),
+                    "url": \
+                        make_url(
+                            url_stem,
+                            VARIANTS_DIRNAME+"/"+variant_filename
+                        )
+                })
+        source = {
+            "filename": filename,
+            "thunderbird_num": get_thunderbird_num(filename),
+            "width": width,
+            "height": height,
+            "sha256": hash_file(path_to_source),
+            "url": make_url(url_stem, filename)
+        }
+        manifest["sources"].append(source)
+    path_to_manifest = os.path.join(path_to_wallpaper_dir, MANIFEST_FILENAME)
+    with open(
+        path_to_manifest,
+        "w",
+        encoding=DEFAULT_ENCODING
+    ) as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    return manifest
+
+############
+# CHOOSING #
+############
+
+def load_manifest(path_to_wallpaper_dir=DEFAULT_PATH_TO_WALLPAPER_DIR):
+    """ Load the manifest, or return None if there isn't one. """
+    path_to_manifest = os.path.join(path_to_wallpaper_dir, MANIFEST_FILENAME)
+    try:
+        with open(
+            path_to_manifest,
+            "r",
+            encoding=DEFAULT_ENCODING
+        ) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+def find_source(manifest, thunderbird_num=None):
+    """ Find the source image for a given Thunderbird, or the default if
+    there isn't one. """
+    default = None
+    for source in manifest["sources"]:
+        if source["thunderbird_num"] is None:
+            default = default or source
+        elif source["thunderbird_num"] == thunderbird_num:
+            return source
+    return default
+
+def check_fits(variant, resolution):
+    """ Check whether a variant is big enough to cover a display of a given
+    resolution, give or take a little. """
+    width, height = resolution
+    if (
+        (variant["width"] >= width*FIT_TOLERANCE) and
+        (variant["height"] >= height*FIT_TOLERANCE)
+    ):
+        return True
+    return False
+
+def choose_variant(manifest, source, resolution=None):
+    """ Choose the smallest variant of a given source which fits a display of
+    a given resolution, or the biggest if we don't know the resolution.
+    Return None if no variant fits. """
+    variants = [
+        variant for variant in manifest["variants"]
+        if variant["source"] == source["filename"]
+    ]
+    if not variants:
+        return None
+    if resolution is None:
+        return max(variants, key=lambda variant: variant["width"])
+    fitting = [
+        variant for variant in variants if check_fits(variant, resolution)
+    ]
+    if not fitting:
+        return None
+    result = \
+        min(fitting, key=lambda variant: variant["width"]*variant["height"])
+    return result
+
+###################
+# RUN AND WRAP UP #
+###################
+
+def make_parser():
+    """ Make and return the parser object. """
+    result = argparse.ArgumentParser(description=__doc__)
+    result.add_argument(
+        "--path-to-wallpaper-dir",
+        default=os.path.join(os.path.dirname(__file__), "wallpaper"),
+        help="The directory holding the source images"
+    )
+    result.add_argument(
+        "--quality",
+        default=DEFAULT_WALLPAPER_QUALITY,
+        type=int,
+        help="The JPEG quality of the variants"
+    )
+    result.add_argument(
+        "--url-stem",
+        default=None,
+        help=(
+            "The URL of the directory at which the wallpaper directory's "+
+            "contents are hosted"
+        )
+    )
+    return result
+
+def run():
+    """ Run this file. """
+    arguments = make_parser().parse_args()
+    manifest = \
+        build_variants(
+            arguments.path_to_wallpaper_dir,
+            quality=arguments.quality,
+            url_stem=arguments.url_stem
+        )
+    for variant in manifest["variants"]:
+        print(variant["filename"]+": "+str(variant["size"]//1024)+" KiB")
+
+if __name__ == "__main__":
+    run()